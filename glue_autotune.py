@@ -0,0 +1,152 @@
+import argparse
+import json
+import logging
+import math
+import sys
+
+from glue_run_history import GB, RunHistory, DEFAULT_HISTORY_DB, percentile, throughput
+from glue_sizing_policy import WORKER_TYPE_DPUS
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# successful runs, newest first, the throughput estimate is taken from
+DEFAULT_WINDOW = 10
+DEFAULT_MIN_RUNS = 3
+# share of the target runtime kept free for run to run variance
+DEFAULT_HEADROOM = 0.1
+# largest change of NumberOfWorkers from one run to the next, as a fraction of the last count
+DEFAULT_MAX_STEP = 0.5
+DEFAULT_MIN_WORKERS = 2
+DEFAULT_MAX_WORKERS = 100
+
+
+class SlaAutotuner(object):
+    """ Pick NumberOfWorkers so that a job's runs finish within a target runtime.
+
+    The runs of the job recorded in the run history give its throughput in
+    GB per DPU-hour (median over the last window successful runs); the
+    smallest worker count expected to process the current input within
+    the target, less headroom, is chosen. Every run feeds the history, so
+    the count follows the data as it grows or shrinks and corrects itself
+    when a run misses or easily beats the target.
+
+    Guardrails: the count moves at most max_step of the last run's count
+    per run (at least one worker), never drops below the last count right
+    after a run that missed the target, and stays within min_workers and
+    max_workers and under max_dpus. The worker type is left to the sizing
+    policy; only the count is tuned.
+    """
+
+    def __init__(self, history, window=DEFAULT_WINDOW, min_runs=DEFAULT_MIN_RUNS, headroom=DEFAULT_HEADROOM,
+                 max_step=DEFAULT_MAX_STEP, min_workers=DEFAULT_MIN_WORKERS, max_workers=DEFAULT_MAX_WORKERS,
+                 max_dpus=None):
+        self.history = history
+        self.window = window
+        self.min_runs = min_runs
+        self.headroom = headroom
+        self.max_step = max_step
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.max_dpus = max_dpus
+
+    def recent_runs(self, job_name):
+        runs = [run for run in self.history.runs(job_name, state='SUCCEEDED')
+                if run['execution_time'] and run['number_of_workers']]
+        return runs[-self.window:]
+
+    def tune(self, job_name, target_runtime, input_bytes, job_dpu):
+        """ Tune the worker count of job_dpu for a run over input_bytes.
+        Args:
+            job_name (string): Name of the glue job.
+            target_runtime (float): Runtime in seconds the run should finish within.
+            input_bytes (int): Size of the input of the coming run.
+            job_dpu (dict): WorkerType and NumberOfWorkers chosen by the sizing policy.
+        Returns:
+            (dict)
+            WorkerType, NumberOfWorkers (strings, ready for the config), the
+            predicted ExecutionTime and the reason of the decision.
+        """
+        worker_type = job_dpu['WorkerType']
+        proposed = int(job_dpu['NumberOfWorkers'])
+        decision = {'WorkerType': worker_type, 'NumberOfWorkers': str(proposed), 'ExecutionTime': None}
+
+        runs = self.recent_runs(job_name)
+        throughputs = [value for value in (throughput(run) for run in runs) if value]
+        if len(throughputs) < self.min_runs:
+            decision['reason'] = "{} of {} runs with throughput, keeping the policy's count".format(
+                len(throughputs), self.min_runs)
+            return decision
+
+        rate = percentile(throughputs, 50)
+        worker_dpus = WORKER_TYPE_DPUS.get(worker_type, 1)
+        dpu_hours = input_bytes / float(GB) / rate
+        budget = target_runtime * (1 - self.headroom)
+        wanted = int(math.ceil(dpu_hours * 3600 / budget / worker_dpus)) if budget > 0 else self.max_workers
+
+        # steps are taken from the count the last run actually used, in DPUs when the worker type changed
+        latest = runs[-1]
+        last = max(1, int(round(latest['number_of_workers'] *
+                                WORKER_TYPE_DPUS.get(latest['worker_type'], 1) / float(worker_dpus))))
+        step = max(1, int(last * self.max_step))
+        workers = min(max(wanted, last - step), last + step)
+        reasons = ["{:.2f} GB/DPU-hour over {} runs wants {}".format(rate, len(throughputs), wanted)]
+        if workers != wanted:
+            reasons.append("step limited from {}".format(last))
+        if latest['execution_time'] > target_runtime and workers < last:
+            workers = last
+            reasons.append("last run missed the target")
+
+        upper = self.max_workers
+        if self.max_dpus:
+            upper = min(upper, int(self.max_dpus // worker_dpus))
+        bounded = min(max(workers, self.min_workers), max(upper, self.min_workers))
+        if bounded != workers:
+            reasons.append("bounded to {}..{}".format(self.min_workers, upper))
+            workers = bounded
+
+        decision['NumberOfWorkers'] = str(workers)
+        decision['ExecutionTime'] = dpu_hours * 3600 / (workers * worker_dpus)
+        if decision['ExecutionTime'] > target_runtime:
+            reasons.append("target of {:.0f}s not expected to be met".format(target_runtime))
+            logger.warning("{}: {} x {} expected to take {:.0f}s, over the target of {:.0f}s".format(
+                job_name, workers, worker_type, decision['ExecutionTime'], target_runtime))
+        decision['reason'] = ', '.join(reasons)
+        logger.info("Autotuned {} to {} x {} ({})".format(job_name, workers, worker_type, decision['reason']))
+        return decision
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show the worker count the autotuner picks for a job')
+    parser.add_argument('job', help="glue job name")
+    parser.add_argument('--target_runtime', type=float, required=True, help="target runtime in seconds")
+    parser.add_argument('--input_gb', type=float, help="input size of the coming run, the latest run's by default")
+    parser.add_argument('--worker_type', default='G.1X', choices=sorted(WORKER_TYPE_DPUS))
+    parser.add_argument('--workers', type=int, default=DEFAULT_MIN_WORKERS,
+                        help="count used when the job has too little history")
+    parser.add_argument('--max_step', type=float, default=DEFAULT_MAX_STEP)
+    parser.add_argument('--max_dpus', type=float, help="upper bound on the DPUs of one run")
+    parser.add_argument('--db', default=DEFAULT_HISTORY_DB, help="path of the history database")
+    args = parser.parse_args(argv)
+
+    history = RunHistory(args.db)
+    try:
+        tuner = SlaAutotuner(history, max_step=args.max_step, max_dpus=args.max_dpus)
+        if args.input_gb is not None:
+            input_bytes = args.input_gb * GB
+        else:
+            runs = [run for run in tuner.recent_runs(args.job) if run['input_bytes'] is not None]
+            if not runs:
+                parser.error("no recorded input size for {}, give --input_gb".format(args.job))
+            input_bytes = runs[-1]['input_bytes']
+        decision = tuner.tune(args.job, args.target_runtime, input_bytes,
+                              {'WorkerType': args.worker_type, 'NumberOfWorkers': str(args.workers)})
+        print(json.dumps(decision, indent=2))
+        return 0
+    finally:
+        history.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
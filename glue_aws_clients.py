@@ -0,0 +1,132 @@
+import datetime
+import logging
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+from glue_tracing import instrument_client
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_MAX_POOL_CONNECTIONS = int(os.environ.get('GLUE_AWS_MAX_POOL_CONNECTIONS', 50))
+DEFAULT_RETRY_MODE = os.environ.get('GLUE_AWS_RETRY_MODE', 'adaptive')
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get('GLUE_AWS_MAX_ATTEMPTS', 10))
+# assumed role credentials are renewed this long before they expire
+ROLE_REFRESH_SECONDS = 300
+ROLE_SESSION_NAME = 'glue-deploy'
+
+_lock = threading.RLock()
+_session = None
+_role_sessions = {}
+_clients = {}
+_resources = {}
+_settings = {
+    'max_pool_connections': DEFAULT_MAX_POOL_CONNECTIONS,
+    'retry_mode': DEFAULT_RETRY_MODE,
+    'max_attempts': DEFAULT_MAX_ATTEMPTS,
+}
+
+
+def configure(max_pool_connections=None, retry_mode=None, max_attempts=None):
+    """ Change the connection pool and retry settings of the clients created from now on.
+
+    Cached clients are dropped when a setting changes, so call this once at
+    start-up, before the clients are shared between threads.
+
+    Args:
+        max_pool_connections (int): HTTP connections kept per client.
+        retry_mode (string): botocore retry mode, 'adaptive', 'standard' or 'legacy'.
+        max_attempts (int): Maximum attempts of one API call, retries included.
+    """
+    updates = {'max_pool_connections': max_pool_connections, 'retry_mode': retry_mode,
+               'max_attempts': max_attempts}
+    with _lock:
+        changed = False
+        for name, value in updates.items():
+            if value is not None and _settings[name] != value:
+                _settings[name] = value
+                changed = True
+        if changed:
+            _clients.clear()
+            _resources.clear()
+
+
+def client_config(**overrides):
+    """ botocore Config with the pool and retry settings of the factory. """
+    settings = dict(_settings)
+    settings.update(overrides)
+    return Config(max_pool_connections=settings['max_pool_connections'],
+                  retries={'mode': settings['retry_mode'], 'max_attempts': settings['max_attempts']})
+
+
+def get_session():
+    """ Return the boto3 session shared by every client, so credentials are resolved once. """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session()
+        return _session
+
+
+def _expiring(expiration):
+    now = datetime.datetime.now(expiration.tzinfo)
+    return (expiration - now).total_seconds() < ROLE_REFRESH_SECONDS
+
+
+def get_role_session(role_arn):
+    """ Return a boto3 session with the credentials of role_arn, assumed from the shared session.
+
+    The credentials are renewed shortly before they expire; the clients made
+    from the previous credentials are dropped at the same time.
+    """
+    with _lock:
+        session, expiration = _role_sessions.get(role_arn, (None, None))
+        if session is None or _expiring(expiration):
+            logger.info("Assuming role {}".format(role_arn))
+            credentials = get_client('sts').assume_role(RoleArn=role_arn,
+                                                        RoleSessionName=ROLE_SESSION_NAME)['Credentials']
+            session = boto3.session.Session(aws_access_key_id=credentials['AccessKeyId'],
+                                            aws_secret_access_key=credentials['SecretAccessKey'],
+                                            aws_session_token=credentials['SessionToken'])
+            _role_sessions[role_arn] = (session, credentials['Expiration'])
+            for cache in (_clients, _resources):
+                for key in [key for key in cache if key[2] == role_arn]:
+                    del cache[key]
+        return session
+
+
+def _session_for(role_arn):
+    return get_role_session(role_arn) if role_arn else get_session()
+
+
+def get_client(service, region_name=None, role_arn=None):
+    """ Return the cached client of service in region_name, creating it on first use.
+
+    Clients are thread safe, so one client per service, region and role is
+    shared by every thread and keeps its pool of warm HTTP connections.
+    With role_arn the client acts as that role, e.g. in another account.
+    """
+    with _lock:
+        session = _session_for(role_arn)
+        key = (service, region_name, role_arn)
+        if key not in _clients:
+            logger.info("Creating {} client for region {}{}".format(
+                service, region_name or 'default', ' as ' + role_arn if role_arn else ''))
+            _clients[key] = instrument_client(
+                session.client(service, region_name=region_name, config=client_config()))
+        return _clients[key]
+
+
+def get_resource(service, region_name=None, role_arn=None):
+    """ Return the cached resource of service in region_name, creating it on first use. """
+    with _lock:
+        session = _session_for(role_arn)
+        key = (service, region_name, role_arn)
+        if key not in _resources:
+            _resources[key] = session.resource(service, region_name=region_name, config=client_config())
+            instrument_client(_resources[key].meta.client)
+        return _resources[key]
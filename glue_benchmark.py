@@ -0,0 +1,607 @@
+import argparse
+import contextlib
+import datetime
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from botocore.exceptions import ClientError
+
+import glue_dynamic_wrapper
+import glue_spark_deploy
+from glue_job_monitor import JobRunMonitor
+from glue_run_history import RunHistory
+from glue_tracing import current_span
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PHASES = ('list', 'size', 'config rewrite', 'deploy', 'start', 'poll')
+PAGE_SIZE = 1000
+DEFAULT_FILES_PER_PARTITION = 1000
+DEFAULT_OBJECT_SIZE = 64 * 1024 * 1024
+
+CONFIG_TEMPLATE = """[JOB]
+Execution_Enviornment = benchmark
+source_folder_prefix = {source_prefix}
+
+[job-paramters]
+glueJobName = {job_name}
+runtime-type = glueetl
+glueExecutionRole = benchmark-role
+concurrency = 1
+glueScriptLocation = s3://{bucket}/scripts/{job_name}.py
+environment = benchmark
+
+[script-language]
+--job-language = python
+
+[job-dpu]
+WorkerType = G.1X
+NumberOfWorkers = 2
+"""
+
+
+class SyntheticPrefix(object):
+    """ A date-partitioned prefix of generated objects that is never held in memory.
+
+    Keys look like <prefix>part=00000/file-000000.parquet and are produced
+    in key order, so listings behave like S3 without storing 10^7 entries.
+    """
+
+    def __init__(self, prefix, object_count, files_per_partition=DEFAULT_FILES_PER_PARTITION,
+                 object_size=DEFAULT_OBJECT_SIZE):
+        self.prefix = prefix
+        self.object_count = object_count
+        self.files_per_partition = files_per_partition
+        self.object_size = object_size
+        self.partitions = (object_count + files_per_partition - 1) // files_per_partition
+
+    def partition_prefix(self, partition):
+        return "{}part={:05d}/".format(self.prefix, partition)
+
+    def _files(self, partition):
+        first = partition * self.files_per_partition
+        last = min(first + self.files_per_partition, self.object_count)
+        partition_prefix = self.partition_prefix(partition)
+        for index in range(first, last):
+            yield partition_prefix + "file-{:06d}.parquet".format(index - first), self.object_size
+
+    def entries(self, prefix, delimiter=None, start_after=None):
+        """ Yield (key, size) for objects and (common_prefix, None) for prefixes, in key order. """
+        if not (self.prefix.startswith(prefix) or prefix.startswith(self.prefix)):
+            return
+        for partition in range(self.partitions):
+            partition_prefix = self.partition_prefix(partition)
+            if start_after and partition_prefix + '\xff' < start_after:
+                continue
+            if partition_prefix.startswith(prefix):
+                rest = partition_prefix[len(prefix):]
+                if delimiter and delimiter in rest:
+                    common_prefix = prefix + rest[:rest.index(delimiter) + 1]
+                    if not start_after or common_prefix > start_after:
+                        yield common_prefix, None
+                    continue
+            elif not prefix.startswith(partition_prefix):
+                continue
+            for key, size in self._files(partition):
+                if key.startswith(prefix) and (not start_after or key > start_after):
+                    yield key, size
+
+
+class ApiRecorder(object):
+    """ Counts and times the API calls made against the fakes, and injects latency. """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+
+    def call(self, operation, started=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls[operation] += 1
+            if started is not None:
+                self.seconds[operation] += time.time() - started
+        # the fakes are not botocore clients, so they report their calls to the trace themselves
+        current_span().record_call(operation)
+
+
+def _client_error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class _ListObjectsPaginator(object):
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, Bucket, Prefix='', Delimiter=None, StartAfter=None, PaginationConfig=None):
+        page_size = (PaginationConfig or {}).get('PageSize', PAGE_SIZE)
+        entries = self.client._entries(Bucket, Prefix, Delimiter, StartAfter)
+        while True:
+            started = time.time()
+            chunk = list(itertools.islice(entries, page_size))
+            page = {'Contents': [], 'CommonPrefixes': [], 'KeyCount': len(chunk)}
+            for key, size in chunk:
+                if size is None:
+                    page['CommonPrefixes'].append({'Prefix': key})
+                else:
+                    page['Contents'].append({'Key': key, 'Size': size, 'ETag': self.client._etag(Bucket, key)})
+            self.client.recorder.call('list_objects_v2', started)
+            yield page
+            if len(chunk) < page_size:
+                return
+
+
+class FakeS3Client(object):
+    """ In-process stand-in for the s3 client calls made by the wrapper and the deployer. """
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.lock = threading.Lock()
+        self.objects = {}
+        self.synthetic = defaultdict(list)
+
+    def add_synthetic_prefix(self, bucket, synthetic_prefix):
+        self.synthetic[bucket].append(synthetic_prefix)
+
+    def _entries(self, bucket, prefix, delimiter, start_after):
+        with self.lock:
+            stored = sorted((key, len(body)) for (object_bucket, key), (body, etag) in self.objects.items()
+                            if object_bucket == bucket and key.startswith(prefix))
+        stored_entries = []
+        for key, size in stored:
+            rest = key[len(prefix):]
+            if delimiter and delimiter in rest:
+                key, size = prefix + rest[:rest.index(delimiter) + 1], None
+            if (not start_after or key > start_after) and (not stored_entries or stored_entries[-1][0] != key):
+                stored_entries.append((key, size))
+        streams = [stored_entries] + [synthetic.entries(prefix, delimiter, start_after)
+                                      for synthetic in self.synthetic[bucket]]
+        previous = None
+        for key, size in heapq.merge(*streams, key=lambda entry: entry[0]):
+            if size is None and key == previous:
+                continue
+            previous = key
+            yield key, size
+
+    def _etag(self, bucket, key):
+        with self.lock:
+            stored = self.objects.get((bucket, key))
+        # synthetic objects never change
+        return stored[1] if stored else '"synthetic"'
+
+    def get_paginator(self, operation):
+        return _ListObjectsPaginator(self)
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None, StartAfter=None, MaxKeys=PAGE_SIZE):
+        return next(_ListObjectsPaginator(self).paginate(Bucket, Prefix, Delimiter, StartAfter,
+                                                         {'PageSize': MaxKeys}))
+
+    def get_object(self, Bucket, Key):
+        started = time.time()
+        with self.lock:
+            stored = self.objects.get((Bucket, Key))
+        self.recorder.call('get_object', started)
+        if stored is None:
+            raise _client_error('NoSuchKey', 'GetObject')
+        body, etag = stored
+        return {'Body': io.BytesIO(body), 'ETag': etag, 'ContentLength': len(body)}
+
+    def head_object(self, Bucket, Key):
+        started = time.time()
+        with self.lock:
+            stored = self.objects.get((Bucket, Key))
+        self.recorder.call('head_object', started)
+        if stored is None:
+            raise _client_error('404', 'HeadObject')
+        return {'ETag': stored[1], 'ContentLength': len(stored[0])}
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None, **kwargs):
+        started = time.time()
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        with self.lock:
+            stored = self.objects.get((Bucket, Key))
+            if IfNoneMatch == '*' and stored is not None:
+                raise _client_error('PreconditionFailed', 'PutObject')
+            if IfMatch and (stored is None or stored[1] != IfMatch):
+                raise _client_error('PreconditionFailed', 'PutObject')
+            etag = '"{}"'.format(hashlib.md5(Body).hexdigest())
+            self.objects[(Bucket, Key)] = (Body, etag)
+        self.recorder.call('put_object', started)
+        return {'ETag': etag}
+
+
+class _FakeObjectSummary(object):
+    def __init__(self, key, size):
+        self.key = key
+        self.size = size
+
+
+class _FakeObjects(object):
+    def __init__(self, client, bucket):
+        self.client = client
+        self.bucket = bucket
+
+    def filter(self, Prefix=''):
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=Prefix):
+            for obj in page['Contents']:
+                yield _FakeObjectSummary(obj['Key'], obj['Size'])
+
+
+class _FakeBucket(object):
+    def __init__(self, client, name):
+        self.name = name
+        self.objects = _FakeObjects(client, name)
+
+
+class _FakeObject(object):
+    def __init__(self, client, bucket, key):
+        self.client = client
+        self.bucket_name = bucket
+        self.key = key
+
+    def get(self):
+        return self.client.get_object(Bucket=self.bucket_name, Key=self.key)
+
+
+class _FakeMeta(object):
+    def __init__(self, client):
+        self.client = client
+
+
+class FakeS3Resource(object):
+    def __init__(self, client):
+        self.meta = _FakeMeta(client)
+
+    def Bucket(self, name):
+        return _FakeBucket(self.meta.client, name)
+
+    def Object(self, bucket_name, key):
+        return _FakeObject(self.meta.client, bucket_name, key)
+
+
+class _GlueExceptions(object):
+    class EntityNotFoundException(ClientError):
+        def __init__(self):
+            ClientError.__init__(self, {'Error': {'Code': 'EntityNotFoundException',
+                                                  'Message': 'Job not found'}}, 'GetJob')
+
+    class ConcurrentRunsExceededException(ClientError):
+        def __init__(self):
+            ClientError.__init__(self, {'Error': {'Code': 'ConcurrentRunsExceededException',
+                                                  'Message': 'Concurrent runs exceeded'}}, 'StartJobRun')
+
+
+class _GetJobRunsPaginator(object):
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, JobName, PaginationConfig=None):
+        page_size = (PaginationConfig or {}).get('PageSize', 200)
+        started = time.time()
+        job_runs = self.client._job_runs(JobName)
+        self.client.recorder.call('get_job_runs', started)
+        for index in range(0, max(len(job_runs), 1), page_size):
+            if index:
+                self.client.recorder.call('get_job_runs')
+            yield {'JobRuns': job_runs[index:index + page_size]}
+
+
+class _GetJobsPaginator(object):
+    def __init__(self, client, page_size=100):
+        self.client = client
+        self.page_size = page_size
+
+    def paginate(self, **kwargs):
+        with self.client.lock:
+            jobs = [dict(job) for name, job in sorted(self.client.jobs.items())]
+        for index in range(0, max(len(jobs), 1), self.page_size):
+            self.client.recorder.call('get_jobs')
+            yield {'Jobs': jobs[index:index + self.page_size]}
+
+
+class FakeGlueClient(object):
+    """ In-process stand-in for the glue client; runs last run_seconds of wall time. """
+
+    exceptions = _GlueExceptions
+
+    def __init__(self, recorder, run_seconds=1.0):
+        self.recorder = recorder
+        self.run_seconds = run_seconds
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.runs = defaultdict(list)
+
+    def _job_run(self, job_name, run):
+        elapsed = time.time() - run['started']
+        if run.get('stopped'):
+            state = 'STOPPED'
+        elif elapsed < self.run_seconds * 0.1:
+            state = 'STARTING'
+        elif elapsed < self.run_seconds:
+            state = 'RUNNING'
+        else:
+            state = 'SUCCEEDED'
+        job_run = {
+            'Id': run['id'],
+            'JobName': job_name,
+            'JobRunState': state,
+            'StartedOn': datetime.datetime.fromtimestamp(run['started'], datetime.timezone.utc),
+            'ExecutionTime': max(1, int(min(elapsed, self.run_seconds))),
+            'WorkerType': run['WorkerType'],
+            'NumberOfWorkers': run['NumberOfWorkers'],
+            'Arguments': run['Arguments'],
+        }
+        if state in ('SUCCEEDED', 'STOPPED'):
+            job_run['CompletedOn'] = datetime.datetime.fromtimestamp(
+                run['started'] + self.run_seconds, datetime.timezone.utc)
+        return job_run
+
+    def _running(self, run):
+        return not run.get('stopped') and time.time() - run['started'] < self.run_seconds
+
+    def _job_runs(self, job_name):
+        with self.lock:
+            runs = list(self.runs[job_name])
+        return [self._job_run(job_name, run) for run in reversed(runs)]
+
+    def get_job(self, JobName):
+        started = time.time()
+        with self.lock:
+            job = self.jobs.get(JobName)
+        self.recorder.call('get_job', started)
+        if job is None:
+            raise self.exceptions.EntityNotFoundException()
+        return {'Job': dict(job)}
+
+    def create_job(self, Name, **kwargs):
+        started = time.time()
+        kwargs.pop('Tags', None)
+        with self.lock:
+            self.jobs[Name] = dict(kwargs, Name=Name)
+        self.recorder.call('create_job', started)
+        return {'Name': Name}
+
+    def update_job(self, JobName, JobUpdate):
+        started = time.time()
+        with self.lock:
+            if JobName not in self.jobs:
+                raise self.exceptions.EntityNotFoundException()
+            self.jobs[JobName] = dict(JobUpdate, Name=JobName)
+        self.recorder.call('update_job', started)
+        return {'JobName': JobName}
+
+    def start_job_run(self, JobName, Arguments=None, **kwargs):
+        started = time.time()
+        with self.lock:
+            job = self.jobs[JobName]
+            max_runs = job.get('ExecutionProperty', {}).get('MaxConcurrentRuns')
+            if max_runs and sum(1 for run in self.runs[JobName] if self._running(run)) >= max_runs:
+                self.recorder.call('start_job_run', started)
+                raise self.exceptions.ConcurrentRunsExceededException()
+            run = {'id': 'jr_' + uuid.uuid4().hex, 'started': time.time(), 'Arguments': Arguments or {},
+                   'WorkerType': job.get('WorkerType'), 'NumberOfWorkers': job.get('NumberOfWorkers')}
+            self.runs[JobName].append(run)
+        self.recorder.call('start_job_run', started)
+        return {'JobRunId': run['id']}
+
+    def get_job_run(self, JobName, RunId, **kwargs):
+        started = time.time()
+        with self.lock:
+            runs = [run for run in self.runs[JobName] if run['id'] == RunId]
+        self.recorder.call('get_job_run', started)
+        if not runs:
+            raise self.exceptions.EntityNotFoundException()
+        return {'JobRun': self._job_run(JobName, runs[0])}
+
+    def batch_get_jobs(self, JobNames):
+        started = time.time()
+        with self.lock:
+            jobs = [dict(self.jobs[name]) for name in JobNames if name in self.jobs]
+            missing = [name for name in JobNames if name not in self.jobs]
+        self.recorder.call('batch_get_jobs', started)
+        return {'Jobs': jobs, 'JobsNotFound': missing}
+
+    def get_paginator(self, operation):
+        if operation == 'get_jobs':
+            return _GetJobsPaginator(self)
+        return _GetJobRunsPaginator(self)
+
+    def batch_stop_job_run(self, JobName, JobRunIds):
+        with self.lock:
+            for run in self.runs[JobName]:
+                if run['id'] in JobRunIds:
+                    run['stopped'] = True
+        self.recorder.call('batch_stop_job_run')
+        return {'SuccessfulSubmissions': [{'JobName': JobName, 'JobRunId': run_id} for run_id in JobRunIds]}
+
+
+class PhaseTimer(object):
+    """ Accumulates the time spent in each benchmark phase by wrapping module functions. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self._patched = []
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.seconds[phase] += seconds
+            self.calls[phase] += 1
+
+    def wrap(self, module, name, phase, **bound_kwargs):
+        original = getattr(module, name)
+
+        def timed(*args, **kwargs):
+            kwargs.update(bound_kwargs)
+            started = time.time()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.add(phase, time.time() - started)
+
+        self._patched.append((module, name, original))
+        setattr(module, name, timed)
+
+    def restore(self):
+        for module, name, original in reversed(self._patched):
+            setattr(module, name, original)
+        self._patched = []
+
+
+def run_scenario(object_count, config_count, latency=0.0, run_seconds=1.0, fleet_workers=8, max_workers=16,
+                 settle_scale=1.0, existing_jobs=False, poll_interval=0.1):
+    """ Run one fleet of config_count configs, each sizing a prefix of object_count objects.
+    Returns:
+        (dict)
+        wall time, per-phase seconds and calls, and API call counts of the scenario.
+    """
+    bucket = 'benchmark'
+    recorder = ApiRecorder(latency)
+    s3_client = FakeS3Client(recorder)
+    glue_client = FakeGlueClient(recorder, run_seconds=run_seconds)
+    entries = []
+    for index in range(config_count):
+        job_name = 'benchmark-job-{:04d}'.format(index)
+        source_prefix = 'data/{}/'.format(job_name)
+        s3_client.add_synthetic_prefix(bucket, SyntheticPrefix(source_prefix, object_count))
+        configfile = job_name + '.conf'
+        s3_client.put_object(Bucket=bucket, Key='config/' + configfile, Body=CONFIG_TEMPLATE.format(
+            bucket=bucket, job_name=job_name, source_prefix=source_prefix))
+        entries.append((configfile, source_prefix))
+    recorder.calls.clear()
+    recorder.seconds.clear()
+
+    args = glue_dynamic_wrapper.parse_arguments([
+        '--bucket', bucket, '--sample_config_prefix', 'config/', '--config_dest_prefix', 'deployed/',
+        '--threshold', '100', '--g1xworkernodes', '10', '--g2xworkernodes', '20',
+        '--max_workers', str(max_workers), '--fleet_workers', str(fleet_workers), '--fleet'])
+
+    if existing_jobs:
+        for configfile, source_prefix in entries:
+            config = glue_dynamic_wrapper.new_config_parser()
+            config.read_string(CONFIG_TEMPLATE.format(bucket=bucket, job_name=configfile[:-5],
+                                                      source_prefix=source_prefix))
+            with contextlib.redirect_stdout(io.StringIO()):
+                glue_dynamic_wrapper.resize_config(config, glue_dynamic_wrapper.build_policy(args),
+                                                   glue_dynamic_wrapper.SizingInput(
+                                                       object_count * DEFAULT_OBJECT_SIZE, object_count, None))
+            glue_params, glue_script_params, glue_dpus = glue_spark_deploy.parse_config(config)
+            glue_client.jobs[glue_params['glueJobName']] = dict(
+                glue_spark_deploy.build_job_spec(glue_params, glue_script_params, glue_dpus),
+                Name=glue_params['glueJobName'])
+
+    saved = (glue_dynamic_wrapper.s3_res, glue_spark_deploy.glue, glue_spark_deploy.s3,
+             glue_spark_deploy.DEPLOY_SETTLE_SECONDS, glue_spark_deploy.START_SETTLE_SECONDS)
+    glue_dynamic_wrapper.s3_res = FakeS3Resource(s3_client)
+    glue_spark_deploy.glue = glue_client
+    glue_spark_deploy.s3 = glue_dynamic_wrapper.s3_res
+    glue_spark_deploy.DEPLOY_SETTLE_SECONDS = saved[3] * settle_scale
+    glue_spark_deploy.START_SETTLE_SECONDS = saved[4] * settle_scale
+
+    timer = PhaseTimer()
+    timer.wrap(glue_dynamic_wrapper, 'get_folder_size', 'size', s3_client=s3_client)
+    timer.wrap(glue_dynamic_wrapper, 'read_config_object', 'config rewrite')
+    timer.wrap(glue_dynamic_wrapper, 'write_config_if_changed', 'config rewrite')
+    timer.wrap(glue_spark_deploy, 'glue_job_deployment', 'deploy')
+    timer.wrap(glue_dynamic_wrapper, 'wait_for_runs', 'poll')
+    monitor = JobRunMonitor(glue_client, min_interval=poll_interval, max_interval=poll_interval * 10)
+    history = RunHistory(':memory:')
+    try:
+        started = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = glue_dynamic_wrapper.run_fleet(args, entries, monitor=monitor, history=history)
+        wall = time.time() - started
+    finally:
+        timer.restore()
+        history.close()
+        (glue_dynamic_wrapper.s3_res, glue_spark_deploy.glue, glue_spark_deploy.s3,
+         glue_spark_deploy.DEPLOY_SETTLE_SECONDS, glue_spark_deploy.START_SETTLE_SECONDS) = saved
+
+    phases = dict(timer.seconds)
+    phase_calls = dict(timer.calls)
+    phases['list'] = recorder.seconds['list_objects_v2']
+    phase_calls['list'] = recorder.calls['list_objects_v2']
+    phases['start'] = recorder.seconds['start_job_run']
+    phase_calls['start'] = recorder.calls['start_job_run']
+    return {
+        'objects': object_count,
+        'configs': config_count,
+        'latency_ms': latency * 1000,
+        'wall': wall,
+        'succeeded': sum(1 for result in results if result['status'] == 'SUCCEEDED'),
+        'phases': {phase: phases.get(phase, 0.0) for phase in PHASES},
+        'phase_calls': {phase: phase_calls.get(phase, 0) for phase in PHASES},
+        'api_calls': dict(recorder.calls),
+    }
+
+
+def print_results(results):
+    print("{:>10} {:>7} {:>8} {:>9} {:>4}  ".format("objects", "configs", "latency", "wall s", "ok") +
+          " ".join("{:>14}".format(phase) for phase in PHASES) + "  {:>9}".format("api calls"))
+    for result in results:
+        print("{:>10} {:>7} {:>8.0f} {:>9.2f} {:>4}  ".format(
+            result['objects'], result['configs'], result['latency_ms'], result['wall'], result['succeeded']) +
+              " ".join("{:>14}".format("{:.2f}s/{}".format(result['phases'][phase], result['phase_calls'][phase]))
+                       for phase in PHASES) +
+              "  {:>9}".format(sum(result['api_calls'].values())))
+    print("phase columns are seconds summed over threads / number of calls")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the wrapper and deployer against local S3/Glue fakes')
+    parser.add_argument('--objects', dest="objects", type=int, nargs='+', default=[1000, 100000],
+                        help="objects in each synthetic source prefix, e.g. 1000 10000000")
+    parser.add_argument('--configs', dest="configs", type=int, nargs='+', default=[1, 10, 50],
+                        help="number of job configs in the fleet, e.g. 1 500")
+    parser.add_argument('--latency_ms', dest="latency_ms", type=float, default=20.0,
+                        help="latency injected into every fake API call")
+    parser.add_argument('--run_seconds', dest="run_seconds", type=float, default=1.0,
+                        help="wall time of every fake job run")
+    parser.add_argument('--poll_interval', dest="poll_interval", type=float, default=0.1,
+                        help="minimum poll interval of the run monitor")
+    parser.add_argument('--settle_scale', dest="settle_scale", type=float, default=1.0,
+                        help="scale of the fixed deploy sleeps, 0 to skip them")
+    parser.add_argument('--existing_jobs', dest="existing_jobs", action="store_true",
+                        help="create up to date jobs first so deploys are no-ops")
+    parser.add_argument('--fleet_workers', dest="fleet_workers", type=int, default=8)
+    parser.add_argument('--max_workers', dest="max_workers", type=int, default=16)
+    parser.add_argument('--json', dest="json", help="also write the results to this json file")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    for module_logger in ('glue_spark_deploy', 'glue_job_monitor', 'glue_folder_size', 'glue_sizing_policy'):
+        logging.getLogger(module_logger).setLevel(logging.WARNING)
+
+    results = []
+    for object_count in args.objects:
+        for config_count in args.configs:
+            results.append(run_scenario(object_count, config_count, latency=args.latency_ms / 1000.0,
+                                        run_seconds=args.run_seconds, fleet_workers=args.fleet_workers,
+                                        max_workers=args.max_workers, settle_scale=args.settle_scale,
+                                        existing_jobs=args.existing_jobs, poll_interval=args.poll_interval))
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,238 @@
+import argparse
+import datetime
+import difflib
+import hashlib
+import json
+import logging
+import re
+import sys
+
+from botocore.exceptions import ClientError
+
+from glue_aws_clients import get_client
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+VERSIONS_DIR = 'versions/'
+INDEX_WRITE_ATTEMPTS = 3
+# versions are named by an index of up to 5 digits or a hash prefix of at least 6 characters, never both
+INDEX_PATTERN = re.compile(r'^-?\d{1,5}$')
+MIN_HASH_PREFIX = 6
+
+
+def content_hash(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+class ConfigVersionStore(object):
+    """ Content-addressed store of config versions on s3.
+
+    Every distinct config body is stored once, under
+    <prefix>objects/<sha256>, whichever config or job it belongs to. Each
+    config has a small index, <prefix>index/<configfile>.json, listing its
+    versions as (timestamp, hash, job) in the order they were recorded.
+    Recording a body already stored uploads nothing but the index entry,
+    and recording the body of the latest version changes nothing. Any
+    version is read back with two gets, the index and the object, without
+    listing the store.
+
+    Version objects carry no .conf extension, so listings of configs never
+    pick them up.
+    """
+
+    def __init__(self, bucket, prefix, s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3_client = s3_client or get_client('s3')
+
+    def object_key(self, version_hash):
+        return "{}objects/{}".format(self.prefix, version_hash)
+
+    def index_key(self, configfile):
+        return "{}index/{}.json".format(self.prefix, configfile)
+
+    def _read_index(self, configfile):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.index_key(configfile))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return [], None
+            raise
+        return json.loads(response['Body'].read().decode('utf-8'))['versions'], response['ETag']
+
+    def versions(self, configfile):
+        """ Recorded versions of configfile, oldest first, as dicts of timestamp, hash, job and source. """
+        return self._read_index(configfile)[0]
+
+    def _put_object(self, version_hash, body):
+        # bodies are immutable, a body stored by any config before is not sent again
+        try:
+            self.s3_client.put_object(Bucket=self.bucket, Key=self.object_key(version_hash), Body=body,
+                                      IfNoneMatch='*')
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+            return False
+
+    def _additions(self, versions, body, source, previous=None):
+        """ (hash, body, source) of each version record() appends to versions, in order. """
+        candidates = [(previous, 'existing')] if previous is not None and not versions else []
+        candidates.append((body, source))
+        additions = []
+        last = versions[-1]['hash'] if versions else None
+        for entry_body, entry_source in candidates:
+            entry_hash = content_hash(entry_body)
+            if entry_hash != last:
+                additions.append((entry_hash, entry_body, entry_source))
+                last = entry_hash
+        return additions
+
+    def record(self, configfile, body, job_name=None, source='wrapper', previous=None):
+        """ Record body as the latest version of configfile.
+
+        The index is read once and written once, with the version objects
+        not stored yet put in between.
+
+        Args:
+            body (bytes): Rendered config.
+            source (string): What produced the version, e.g. 'wrapper' or 'rollback'.
+            previous (bytes): Config body replaced. When configfile has no
+                              versions yet it is recorded first, as an
+                              'existing' version, so it stays reachable for rollback.
+        Returns:
+            (string) hash of the version.
+        """
+        version_hash = content_hash(body)
+        for attempt in range(INDEX_WRITE_ATTEMPTS):
+            versions, etag = self._read_index(configfile)
+            additions = self._additions(versions, body, source, previous)
+            if not additions:
+                return version_hash
+            stored = set(version['hash'] for version in versions)
+            for entry_hash, entry_body, entry_source in additions:
+                if entry_hash not in stored and self._put_object(entry_hash, entry_body):
+                    logger.info("Stored config version {} of {}".format(entry_hash[:12], configfile))
+                stored.add(entry_hash)
+                versions.append({'timestamp': datetime.datetime.utcnow().isoformat(), 'hash': entry_hash,
+                                 'job': job_name, 'source': entry_source})
+            condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+            try:
+                self.s3_client.put_object(Bucket=self.bucket, Key=self.index_key(configfile),
+                                          Body=json.dumps({'configfile': configfile, 'versions': versions},
+                                                          indent=1).encode('utf-8'), **condition)
+                return version_hash
+            except ClientError as e:
+                if e.response['Error']['Code'] not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                    raise
+                logger.info("Index of {} changed concurrently, reading it again".format(configfile))
+        raise RuntimeError("Index of {} kept changing, gave up after {} attempts".format(
+            configfile, INDEX_WRITE_ATTEMPTS))
+
+    def plan_record(self, configfile, body, previous=None):
+        """ API calls record() would make without a concurrent change, reading the index to count them.
+        Returns:
+            (dict) count of each s3 operation, e.g. {'s3:get_object': 1, 's3:put_object': 2}.
+        """
+        versions = self.versions(configfile)
+        additions = self._additions(versions, body, 'wrapper', previous)
+        stored = set(version['hash'] for version in versions)
+        objects = len(set(entry_hash for entry_hash, _, _ in additions) - stored)
+        return {'s3:get_object': 1, 's3:put_object': objects + 1 if additions else 0}
+
+    def resolve(self, configfile, version):
+        """ Full hash of version, a hash prefix of at least 6 characters or an index into the versions.
+
+        An index has at most 5 digits, -1 is the latest version and -2 the one before.
+        """
+        versions = self.versions(configfile)
+        if isinstance(version, int) or INDEX_PATTERN.match(version):
+            try:
+                return versions[int(version)]['hash']
+            except IndexError:
+                raise ValueError("{} has {} versions, no version {}".format(configfile, len(versions), version))
+        if len(version) < MIN_HASH_PREFIX:
+            raise ValueError("Hash prefix {} is shorter than {} characters".format(version, MIN_HASH_PREFIX))
+        matches = set(entry['hash'] for entry in versions if entry['hash'].startswith(version))
+        if len(matches) != 1:
+            raise ValueError("{} matches {} versions of {}".format(version, len(matches), configfile))
+        return matches.pop()
+
+    def read(self, version_hash):
+        """ Body of the stored version version_hash. """
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=self.object_key(version_hash))
+        return response['Body'].read()
+
+    def diff(self, configfile, old, new=-1):
+        """ Unified diff between two versions of configfile, see resolve for how versions are named. """
+        old_hash = self.resolve(configfile, old)
+        new_hash = self.resolve(configfile, new)
+        return ''.join(difflib.unified_diff(
+            self.read(old_hash).decode('utf-8').splitlines(True), self.read(new_hash).decode('utf-8').splitlines(True),
+            fromfile=old_hash[:12], tofile=new_hash[:12]))
+
+    def rollback(self, configfile, version, dest_key):
+        """ Write an earlier version of configfile back to dest_key and record it as the latest version.
+
+        The write is guarded by the ETag the config had when the rollback
+        started, as the wrapper's writes are, so a config rewritten in between
+        is left alone and the rollback fails instead.
+
+        Returns:
+            (string) hash of the restored version.
+        """
+        version_hash = self.resolve(configfile, version)
+        body = self.read(version_hash)
+        try:
+            condition = {'IfMatch': self.s3_client.head_object(Bucket=self.bucket, Key=dest_key)['ETag']}
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+                raise
+            condition = {'IfNoneMatch': '*'}
+        try:
+            self.s3_client.put_object(Bucket=self.bucket, Key=dest_key, Body=body, **condition)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+            raise RuntimeError("s3://{}/{} changed during the rollback, not rolled back".format(self.bucket, dest_key))
+        job_names = [entry['job'] for entry in self.versions(configfile) if entry['hash'] == version_hash]
+        self.record(configfile, body, job_name=job_names[-1] if job_names else None, source='rollback')
+        logger.info("Rolled s3://{}/{} back to version {}".format(self.bucket, dest_key, version_hash[:12]))
+        return version_hash
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Browse, diff and roll back the config versions of the wrapper')
+    parser.add_argument('command', choices=['history', 'show', 'diff', 'rollback'])
+    parser.add_argument('configfile', help="file name of the config under --config_dest_prefix")
+    parser.add_argument('versions', nargs='*',
+                        help="hash prefixes (6 characters or more) or indexes (-1 the latest): "
+                             "one for show and rollback, one or two for diff, against the latest by default")
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--config_dest_prefix', dest="dest_prefix", required=True,
+                        help="prefix the wrapper writes configs to, its store is under <prefix>" + VERSIONS_DIR)
+    parser.add_argument('--versions_prefix', help="prefix of the version store, when not the default one")
+    args = parser.parse_args(argv)
+
+    store = ConfigVersionStore(args.bucket, args.versions_prefix or args.dest_prefix + VERSIONS_DIR)
+    if args.command == 'history':
+        for index, entry in enumerate(store.versions(args.configfile)):
+            print("{:>4}  {}  {}  {:<30} {}".format(index, entry['timestamp'], entry['hash'][:12], entry['job'] or '',
+                                                    entry['source']))
+    elif args.command == 'show':
+        sys.stdout.write(store.read(store.resolve(args.configfile, (args.versions or ['-1'])[0])).decode('utf-8'))
+    elif args.command == 'diff':
+        if not args.versions:
+            parser.error("diff needs at least one version")
+        sys.stdout.write(store.diff(args.configfile, *args.versions[:2]))
+    else:
+        if len(args.versions) != 1:
+            parser.error("rollback needs exactly one version")
+        store.rollback(args.configfile, args.versions[0], args.dest_prefix + args.configfile)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,379 @@
+import argparse
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import glue_spark_deploy
+from glue_job_monitor import JobRunMonitor, TERMINAL_STATES
+from glue_run_history import get_run_history, percentile
+from glue_spark_deploy import config_dpus, deploy, load_config, parse_config, parse_targets, record_results
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+ON_FAILURE_STOP = 'stop'
+ON_FAILURE_CONTINUE = 'continue'
+ON_FAILURE_POLICIES = (ON_FAILURE_STOP, ON_FAILURE_CONTINUE)
+
+DEFAULT_START_WORKERS = 8
+DEFAULT_HISTORY_RUNS = 10
+
+SKIPPED = 'SKIPPED'
+
+
+class DagNode(object):
+    """ One JOB config of the DAG and the state of its run. """
+
+    def __init__(self, name, config, depends_on=(), on_failure=ON_FAILURE_STOP):
+        self.name = name
+        self.config = config
+        self.depends_on = list(depends_on)
+        self.on_failure = on_failure
+        glue_params, _, glue_dpus = parse_config(config)
+        if parse_targets(config):
+            # the DPU budget and the single monitor of the runner cover one region and account
+            raise ValueError("{} deploys to several targets, which the DAG runner does not support".format(
+                name or glue_params['glueJobName']))
+        self.job_name = glue_params['glueJobName']
+        self.concurrency = int(glue_params.get('concurrency', 1))
+        self.dpus = config_dpus(glue_params, glue_dpus)
+        self.result = None
+        self.state = None
+        self.started = None
+        self.finished = None
+
+    @property
+    def duration(self):
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+
+def load_dag(path):
+    """ Read a DAG file.
+
+    The file is JSON, for example
+        {"dpu_budget": 200, "on_failure": "stop",
+         "jobs": [{"name": "ingest", "config": "s3://bucket/conf/ingest.conf"},
+                  {"name": "report", "config": "report.conf", "depends_on": ["ingest"],
+                   "on_failure": "continue"}]}
+    name defaults to the glueJobName of the config. on_failure of a job
+    decides whether the jobs depending on it still run when it fails.
+
+    Returns:
+        (tuple) a dict mapping each name to its DagNode, and the dpu_budget of the file or None.
+    """
+    with open(path) as dag_file:
+        spec = json.load(dag_file)
+    default_on_failure = spec.get('on_failure', ON_FAILURE_STOP)
+    nodes = {}
+    for job in spec['jobs']:
+        config = load_config(job['config'])
+        on_failure = job.get('on_failure', default_on_failure)
+        if on_failure not in ON_FAILURE_POLICIES:
+            raise ValueError("on_failure of {} must be one of {}".format(job['config'], ON_FAILURE_POLICIES))
+        node = DagNode(job.get('name'), config, job.get('depends_on', ()), on_failure)
+        node.name = node.name or node.job_name
+        if node.name in nodes:
+            raise ValueError("Job {} appears twice in {}".format(node.name, path))
+        nodes[node.name] = node
+    return nodes, spec.get('dpu_budget')
+
+
+def topological_order(nodes):
+    """ Return the node names so that every node comes after its dependencies.
+    Raises:
+        ValueError when a dependency is unknown or the dependencies form a cycle.
+    """
+    for node in nodes.values():
+        for dependency in node.depends_on:
+            if dependency not in nodes:
+                raise ValueError("{} depends on unknown job {}".format(node.name, dependency))
+    order = []
+    remaining = dict((name, set(node.depends_on)) for name, node in nodes.items())
+    while remaining:
+        ready = [name for name, dependencies in remaining.items() if not dependencies]
+        if not ready:
+            raise ValueError("Dependency cycle between {}".format(', '.join(sorted(remaining))))
+        for name in ready:
+            order.append(name)
+            del remaining[name]
+        for dependencies in remaining.values():
+            dependencies.difference_update(ready)
+    return order
+
+
+def expected_runtimes(nodes, history):
+    """ Median execution time of the recent successful runs of each node's job, 0 when unknown. """
+    expected = {}
+    for node in nodes.values():
+        exec_times = []
+        if history is not None:
+            exec_times = [run['execution_time'] for run in history.runs(node.job_name, state='SUCCEEDED',
+                                                                         limit=DEFAULT_HISTORY_RUNS)
+                          if run['execution_time']]
+        expected[node.name] = percentile(exec_times, 50) or 0
+    return expected
+
+
+def longest_paths(nodes, order, durations):
+    """ Longest path through the DAG ending at each node.
+    Returns:
+        (dict) mapping each name to (length, path).
+    """
+    paths = {}
+    for name in order:
+        node = nodes[name]
+        length, path = 0, []
+        for dependency in node.depends_on:
+            if paths[dependency][0] > length:
+                length, path = paths[dependency]
+        paths[name] = (length + durations[name], path + [name])
+    return paths
+
+
+class DagRunner(object):
+    """ Run the jobs of a DAG, each as soon as its dependencies are done.
+
+    Ready jobs are started longest remaining chain first, estimated from
+    the run history, as long as the DPUs held by the running jobs stay
+    within dpu_budget and each Glue job has fewer running runs than its
+    MaxConcurrentRuns (the concurrency option of job-paramters). A job that
+    needs more than the whole budget is started alone. Starts are deployed
+    concurrently and every running job is watched with one JobRunMonitor.
+
+    When a job fails, the jobs depending on it are skipped if its
+    on_failure policy is 'stop' and run anyway if it is 'continue'.
+    """
+
+    def __init__(self, nodes, dpu_budget=None, monitor=None, history=None, start_workers=DEFAULT_START_WORKERS):
+        self.nodes = nodes
+        self.order = topological_order(nodes)
+        self.dpu_budget = float(dpu_budget) if dpu_budget else None
+        self.monitor = monitor or JobRunMonitor(glue_spark_deploy.glue)
+        self.history = get_run_history() if history is None else history
+        self.start_workers = start_workers
+        self.dependents = dict((name, []) for name in nodes)
+        for node in nodes.values():
+            for dependency in node.depends_on:
+                self.dependents[dependency].append(node.name)
+
+    def _priorities(self):
+        expected = expected_runtimes(self.nodes, self.history)
+        priority = {}
+        for name in reversed(self.order):
+            priority[name] = expected[name] + max([priority[child] for child in self.dependents[name]] or [0])
+        return priority
+
+    def _ready(self, name):
+        for dependency in self.nodes[name].depends_on:
+            upstream = self.nodes[dependency]
+            if upstream.state not in TERMINAL_STATES + (SKIPPED,):
+                return False
+        return True
+
+    def _blocked_by(self, name):
+        """ Name of a failed dependency whose policy stops this node, None otherwise. """
+        for dependency in self.nodes[name].depends_on:
+            upstream = self.nodes[dependency]
+            if upstream.state == SKIPPED or (upstream.state != 'SUCCEEDED' and upstream.on_failure == ON_FAILURE_STOP):
+                return dependency
+        return None
+
+    def _select(self, waiting, running, priority):
+        """ Pick the ready nodes that fit in the DPU budget and their job's concurrency. """
+        used_dpus = sum(self.nodes[name].dpus for name in running)
+        job_runs = {}
+        for name in running:
+            job_runs[self.nodes[name].job_name] = job_runs.get(self.nodes[name].job_name, 0) + 1
+
+        selected = []
+        for name in sorted(waiting, key=lambda n: -priority[n]):
+            if not self._ready(name):
+                continue
+            node = self.nodes[name]
+            if job_runs.get(node.job_name, 0) >= node.concurrency:
+                continue
+            if self.dpu_budget is not None and used_dpus + node.dpus > self.dpu_budget:
+                if used_dpus > 0 or node.dpus <= self.dpu_budget:
+                    continue
+                logger.warning("{} needs {} DPUs, more than the budget of {}, starting it alone".format(
+                    name, node.dpus, self.dpu_budget))
+            selected.append(name)
+            used_dpus += node.dpus
+            job_runs[node.job_name] = job_runs.get(node.job_name, 0) + 1
+        return selected
+
+    def _start(self, name):
+        node = self.nodes[name]
+        node.started = time.time()
+        try:
+            node.result = deploy(node.config, wait=False)
+        except Exception as e:
+            # any start error, e.g. a missing config section or an unreachable endpoint, fails only this node
+            node.finished = time.time()
+            node.state = 'ERROR'
+            node.result = {'JobName': node.job_name, 'JobRunId': None, 'JobRunState': 'ERROR', 'Error': str(e)}
+            logger.error("Unable to start {}: {}".format(name, e))
+        else:
+            logger.info("Started {} as run {}".format(name, node.result['JobRunId']))
+
+    def _skip(self, name, reason):
+        node = self.nodes[name]
+        node.state = SKIPPED
+        node.result = {'JobName': node.job_name, 'JobRunId': None, 'JobRunState': SKIPPED, 'Error': reason}
+        logger.info("Skipping {}: {}".format(name, reason))
+
+    def _finish(self, name, job_run):
+        node = self.nodes[name]
+        node.finished = time.time()
+        record_results([node.result], {(node.job_name, node.result['JobRunId']): job_run}, history=self.history)
+        node.state = node.result['JobRunState']
+        logger.info("{} finished as {} after {:.0f}s".format(name, node.state, node.duration))
+
+    def _stop(self, running, reason):
+        for name in running:
+            result = self.nodes[name].result
+            response = glue_spark_deploy.glue.batch_stop_job_run(JobName=result['JobName'],
+                                                                 JobRunIds=[result['JobRunId']])
+            logger.info("Recieved Kill Signal as {} . GraceFully Terminated the Job {}".format(reason, response))
+            self._finish(name, {})
+
+    def run(self):
+        """ Run the DAG to completion.
+        Returns:
+            (dict) the report of report().
+        """
+        priority = self._priorities()
+        waiting = list(self.order)
+        running = []
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=max(1, self.start_workers)) as executor:
+            try:
+                while waiting or running:
+                    # waiting is in topological order, so skips cascade in one pass
+                    for name in list(waiting):
+                        blocker = self._blocked_by(name) if self._ready(name) else None
+                        if blocker is not None:
+                            waiting.remove(name)
+                            self._skip(name, "upstream {} did not succeed".format(blocker))
+
+                    launch = self._select(waiting, running, priority)
+                    for name in launch:
+                        waiting.remove(name)
+                    list(executor.map(self._start, launch))
+                    launched = [name for name in launch if self.nodes[name].state is None]
+                    running.extend(launched)
+                    if len(launched) < len(launch):
+                        # a start failed, its dependents can be resolved right away
+                        continue
+                    if not running:
+                        if waiting and not launch:
+                            raise RuntimeError("No job can start, waiting on {}".format(', '.join(waiting)))
+                        continue
+
+                    runs = dict(((self.nodes[name].job_name, self.nodes[name].result['JobRunId']), name)
+                                for name in running)
+                    current = self.monitor.poll(list(runs))
+                    intervals = []
+                    done = False
+                    for key, name in runs.items():
+                        job_run = current.get(key)
+                        if job_run is None:
+                            intervals.append(self.monitor.min_interval)
+                        elif job_run['JobRunState'] in TERMINAL_STATES:
+                            running.remove(name)
+                            self._finish(name, job_run)
+                            done = True
+                        else:
+                            intervals.append(self.monitor.next_interval(key[0], job_run))
+                    if not done and intervals:
+                        time.sleep(min(intervals))
+            except (Exception, KeyboardInterrupt) as e:
+                self._stop(running, e)
+                for name in waiting:
+                    self._skip(name, "DAG interrupted: {}".format(e))
+                if isinstance(e, KeyboardInterrupt):
+                    raise
+                logger.error("DAG run aborted: {}".format(e))
+        return self.report(time.time() - started)
+
+    def report(self, wall_clock):
+        """ Summarise the run of the DAG.
+        Returns:
+            (dict)
+            per job results, the wall clock time of the DAG, the time the jobs
+            would have taken one after another, the critical path (the chain of
+            dependent jobs with the longest total runtime) and the time saved.
+        """
+        durations = dict((name, node.duration) for name, node in self.nodes.items())
+        paths = longest_paths(self.nodes, self.order, durations)
+        critical_time, critical_path = max(paths.values(), key=lambda path: path[0]) if paths else (0, [])
+        serial_time = sum(durations.values())
+        jobs = []
+        for name in self.order:
+            node = self.nodes[name]
+            jobs.append({
+                'name': name,
+                'JobName': node.job_name,
+                'JobRunId': (node.result or {}).get('JobRunId'),
+                'status': node.state,
+                'dpus': node.dpus,
+                'elapsed': durations[name],
+                'ExecutionTime': (node.result or {}).get('ExecutionTime'),
+                'error': (node.result or {}).get('Error'),
+            })
+        return {
+            'jobs': jobs,
+            'wall_clock': wall_clock,
+            'serial_time': serial_time,
+            'critical_path': critical_path,
+            'critical_path_time': critical_time,
+            'saved': serial_time - wall_clock,
+        }
+
+
+def print_dag_summary(report):
+    print("{:<30} {:<30} {:<10} {:>6} {:>9}  {}".format("name", "job", "status", "DPUs", "elapsed s", "run id"))
+    for job in report['jobs']:
+        print("{:<30} {:<30} {:<10} {:>6g} {:>9.0f}  {}".format(
+            job['name'], job['JobName'], job['status'], job['dpus'], job['elapsed'],
+            job['JobRunId'] or job['error'] or ''))
+    print("Wall clock: {:.0f}s, one after another: {:.0f}s, saved: {:.0f}s".format(
+        report['wall_clock'], report['serial_time'], report['saved']))
+    print("Critical path ({:.0f}s): {}".format(report['critical_path_time'], ' -> '.join(report['critical_path'])))
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Run a DAG of Glue job configs")
+    parser.add_argument('dag', help="JSON file listing the job configs and their dependencies")
+    parser.add_argument('--dpu_budget', type=float, default=None,
+                        help="maximum DPUs held by running jobs, overrides dpu_budget of the DAG file")
+    parser.add_argument('--on_failure', choices=ON_FAILURE_POLICIES, default=None,
+                        help="failure policy of every job, overrides the DAG file")
+    parser.add_argument('--start_workers', type=int, default=DEFAULT_START_WORKERS,
+                        help="jobs deployed and started concurrently")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    nodes, dpu_budget = load_dag(args.dag)
+    if args.on_failure:
+        for node in nodes.values():
+            node.on_failure = args.on_failure
+    runner = DagRunner(nodes, dpu_budget=args.dpu_budget or dpu_budget, start_workers=args.start_workers)
+    report = runner.run()
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print_dag_summary(report)
+    return 0 if all(job['status'] == 'SUCCEEDED' for job in report['jobs']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,126 +1,684 @@
-import boto3
 import argparse
 from six.moves import configparser
-import os
-from datetime import date
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from deepdiff import DeepDiff
+from botocore.exceptions import ClientError
+import glue_spark_deploy
+import glue_tracing
+from glue_autotune import SlaAutotuner, DEFAULT_MAX_STEP
+from glue_config_store import ConfigVersionStore, VERSIONS_DIR
+from glue_aws_clients import configure, get_resource, DEFAULT_MAX_POOL_CONNECTIONS
+from glue_folder_size import FolderSize, SizeHistogram, get_folder_size, DEFAULT_MAX_WORKERS
+from glue_inventory_size import InventorySizer, DEFAULT_MAX_AGE_HOURS
+from glue_sizing_cache import IncrementalSizer, SizingCache, DEFAULT_SIZING_CACHE_DB
+from glue_spark_deploy import deploy, plan_deploy, print_plan, wait_for_runs
+from glue_job_monitor import TERMINAL_STATES
+from glue_journal import DeployJournal, rollout_id, DEFAULT_JOURNAL_DB
+from glue_run_history import get_run_history
+from glue_sizing_policy import (SizingInput, ThresholdPolicy, compaction_candidates, grouping_arguments, load_policy,
+                                 DEFAULT_GROUP_SIZE, MB)
+from glue_tracing import span
 
+CONFIG_WRITE_ATTEMPTS = 3
+DEFAULT_FLEET_WORKERS = 8
+
+# configs are read from s3, changed in memory and written back only when they changed
+s3_res = get_resource('s3')
+
+
+def parse_arguments(argv=None):
+    parser1 = argparse.ArgumentParser(description='Readingconfig file')
+    parser1.add_argument('--bucket', dest="bucket", help="table_name", required=True)
+    parser1.add_argument('--sample_config_prefix', dest="config_prefix", help="table_name", required=True)
+    parser1.add_argument('--source_folder_prefix', dest="folder_prefix", help="table_name")
+    parser1.add_argument('--config_dest_prefix', dest="dest_prefix", help="table_name", required=True)
+    parser1.add_argument('--threshold', dest="threshold", help="table_name")
+    parser1.add_argument('--g1xworkernodes', dest="g1xworkernodes", help="table_name")
+    parser1.add_argument('--g2xworkernodes', dest="g2xworkernodes", help="table_name")
+    parser1.add_argument('--sizing_policy', dest="sizing_policy",
+                         help="json file of a tiered sizing policy, used instead of --threshold")
+    parser1.add_argument('--autotune', dest="autotune", action="store_true",
+                         help="tune NumberOfWorkers from the run history to meet each job's target runtime")
+    parser1.add_argument('--target_runtime', dest="target_runtime",
+                         help="target runtime in seconds for configs without a target_runtime option in JOB")
+    parser1.add_argument('--autotune_max_step', dest="autotune_max_step", default=DEFAULT_MAX_STEP,
+                         help="largest change of NumberOfWorkers between two runs, as a fraction of the last count")
+    parser1.add_argument('--autotune_max_dpus', dest="autotune_max_dpus",
+                         help="upper bound on the DPUs the autotuner gives one run")
+    parser1.add_argument('--group_files', dest="group_files", action="store_true",
+                         help="add --groupFiles/--groupSize to opt-paramters when small files dominate the source")
+    parser1.add_argument('--group_size_mb', dest="group_size_mb", default=DEFAULT_GROUP_SIZE // MB,
+                         help="size of the file groups set by --group_files")
+    parser1.add_argument('--compaction_report', dest="compaction_report",
+                         help="write the directories whose small files are most worth merging to this local file")
+    parser1.add_argument('--journal', dest="journal", nargs='?', const=DEFAULT_JOURNAL_DB,
+                         help="record completed steps in this sqlite journal, so the rollout can be resumed")
+    parser1.add_argument('--resume', dest="resume", action="store_true",
+                         help="resume the unfinished rollout of the same configs (or --rollout_id) from the journal "
+                              "instead of starting it again")
+    parser1.add_argument('--rollout_id', dest="rollout_id",
+                         help="name of the rollout in the journal, by default derived from the configs rolled out")
+    parser1.add_argument('--config_versions_prefix', dest="versions_prefix",
+                         help="prefix of the content-addressed store of config versions, "
+                              "<config_dest_prefix>" + VERSIONS_DIR + " by default")
+    parser1.add_argument('--configfile', dest="configfile", help="table_name")
+    parser1.add_argument('--max_workers', dest="max_workers", help="concurrent listings used to size the source prefix",
+                         default=DEFAULT_MAX_WORKERS)
+    parser1.add_argument('--fleet', dest="fleet", action="store_true",
+                         help="process every .conf file under --sample_config_prefix")
+    parser1.add_argument('--manifest', dest="manifest",
+                         help="local path or s3:// uri of a manifest with one 'configfile,source_folder_prefix' per line")
+    parser1.add_argument('--fleet_workers', dest="fleet_workers", help="configs processed concurrently in fleet mode",
+                         default=DEFAULT_FLEET_WORKERS)
+    parser1.add_argument('--inventory', dest="inventory",
+                         help="s3 uri of an S3 Inventory manifest.json or configuration prefix to size from")
+    parser1.add_argument('--inventory_max_age_hours', dest="inventory_max_age_hours", default=DEFAULT_MAX_AGE_HOURS,
+                         help="older inventories are ignored and the source prefix is listed live")
+    parser1.add_argument('--incremental', dest="incremental", action="store_true",
+                         help="size append-only source prefixes from the watermark kept in --sizing_cache")
+    parser1.add_argument('--sizing_cache', dest="sizing_cache", default=DEFAULT_SIZING_CACHE_DB,
+                         help="sqlite file holding the running totals and watermark of each prefix")
+    parser1.add_argument('--full_rescan', dest="full_rescan", action="store_true",
+                         help="with --incremental, list every prefix in full and reset its watermark")
+    parser1.add_argument('--plan', dest="plan", action="store_true",
+                         help="show the sizing decision, config rewrite and glue requests without changing anything")
+    parser1.add_argument('--watch', dest="watch", action="store_true",
+                         help="keep running and process configs again only when the config or its source data changed")
+    parser1.add_argument('--watch_interval', dest="watch_interval", default=60,
+                         help="seconds between two change detection cycles in --watch mode")
+    parser1.add_argument('--metrics_port', dest="metrics_port",
+                         help="in --watch mode, serve /health and /metrics on this localhost port")
+    parser1.add_argument('--trace_file', dest="trace_file", default=glue_tracing.DEFAULT_TRACE_FILE,
+                         help="write timing spans of every phase to this local file")
+    parser1.add_argument('--trace_format', dest="trace_format", choices=glue_tracing.TRACE_FORMATS,
+                         default=glue_tracing.DEFAULT_TRACE_FORMAT,
+                         help="jsonl, one span per line, or otlp, an OpenTelemetry OTLP/JSON document")
+    parser1.add_argument('--max_pool_connections', dest="max_pool_connections",
+                         help="http connections per aws client, by default enough for every sizing thread")
+    parser1.add_argument('--retry_mode', dest="retry_mode", help="botocore retry mode, adaptive by default")
+    parser1.add_argument('--max_attempts', dest="max_attempts", help="maximum attempts of one aws api call")
+
+    #parse all the arguments provided and copy it to local variable
+    parser1_config = parser1.parse_args(argv)
+    if not (parser1_config.fleet or parser1_config.manifest):
+        if not parser1_config.configfile or not parser1_config.folder_prefix:
+            parser1.error("--configfile and --source_folder_prefix are required unless --fleet or --manifest is used")
+    if not parser1_config.sizing_policy:
+        if not (parser1_config.threshold and parser1_config.g1xworkernodes and parser1_config.g2xworkernodes):
+            parser1.error("--threshold, --g1xworkernodes and --g2xworkernodes are required unless --sizing_policy is used")
+    if parser1_config.incremental and parser1_config.inventory:
+        parser1.error("--incremental and --inventory cannot be used together")
+    if parser1_config.watch and parser1_config.plan:
+        parser1.error("--watch and --plan cannot be used together")
+    if parser1_config.resume and not parser1_config.journal:
+        parser1_config.journal = DEFAULT_JOURNAL_DB
+    if parser1_config.watch and parser1_config.journal:
+        parser1.error("--watch cannot be used with --journal or --resume")
+    return parser1_config
+
+
+def configure_clients(args):
+    #one pooled client per service is shared by every sizing and deploy thread
+    global s3_res
+    pool_size = args.max_pool_connections
+    if pool_size is None:
+        concurrency = int(args.max_workers)
+        if args.fleet or args.manifest:
+            concurrency *= int(args.fleet_workers)
+        pool_size = max(DEFAULT_MAX_POOL_CONNECTIONS, concurrency)
+    configure(max_pool_connections=int(pool_size), retry_mode=args.retry_mode,
+              max_attempts=int(args.max_attempts) if args.max_attempts else None)
+    s3_res = get_resource('s3')
+    glue_spark_deploy.refresh_clients()
+
+
+def build_sizer(args):
+    #sizing from an S3 Inventory or from the watermark cache when asked, live listing otherwise
+    if args.inventory:
+        return InventorySizer(args.inventory, max_age_hours=float(args.inventory_max_age_hours),
+                              max_workers=int(args.max_workers), s3_client=s3_res.meta.client)
+    if args.incremental:
+        return IncrementalSizer(SizingCache(args.sizing_cache), full_rescan=args.full_rescan)
+    return None
+
+
+def prefetch_sizes(args, sizer, entries):
+    """ Size the source prefixes of entries in one inventory pass, when sizing from an inventory.
+
+    Entries without a source prefix are resolved from the source_folder_prefix
+    option of their config first, so they are part of the pass too.
+
+    Returns:
+        (list) entries, with the source prefixes resolved when an inventory is used.
+    """
+    if not isinstance(sizer, InventorySizer):
+        return entries
+
+    def resolve(entry):
+        configfile, folder_prefix = entry
+        if folder_prefix is None:
+            try:
+                parser, etag = read_config_object(args.bucket, args.config_prefix + configfile)
+            except (ClientError, configparser.Error) as e:
+                #left unresolved, processing the config reports the error
+                print("Unable to read the source prefix of {}: {}".format(configfile, e))
+                return entry
+            if parser is not None:
+                folder_prefix = parser.get('JOB', 'source_folder_prefix', fallback=None)
+        return configfile, folder_prefix
+
+    with ThreadPoolExecutor(max_workers=max(1, int(args.fleet_workers))) as executor:
+        entries = list(executor.map(glue_tracing.bind(resolve), entries))
+    sizer.prefetch(args.bucket, [folder_prefix for configfile, folder_prefix in entries])
+    return entries
+
+
+def build_tuner(args):
+    #tuning needs the run history, without it the policy's count is kept
+    if not args.autotune:
+        return None
+    history = get_run_history()
+    if history is None:
+        print("Run history disabled, --autotune ignored")
+        return None
+    return SlaAutotuner(history, max_step=float(args.autotune_max_step),
+                        max_dpus=float(args.autotune_max_dpus) if args.autotune_max_dpus else None)
+
+
+def group_size(args):
+    #file grouping is only injected when asked for
+    return int(float(args.group_size_mb) * MB) if args.group_files else None
+
+
+def build_journal(args):
+    #the rollout is named after its configs unless named explicitly, and only --resume continues it
+    if not args.journal or args.plan:
+        return None, None
+    journal = DeployJournal(args.journal)
+    rollout = args.rollout_id or rollout_id(args.bucket, args.config_prefix, args.dest_prefix, args.configfile,
+                                            args.folder_prefix, args.manifest, args.fleet)
+    journal.begin(rollout, resume=args.resume)
+    return journal, rollout
+
+
+def build_policy(args):
+    #the tiered policy file wins over the legacy single threshold
+    if args.sizing_policy:
+        return load_policy(args.sizing_policy)
+    return ThresholdPolicy(int(args.threshold), args.g1xworkernodes, args.g2xworkernodes)
 
-# config prefix a  downloading to my talend /data/  then i will be making the changes to the local copy, uploading
-s3_res = boto3.resource('s3')
-parser1 = argparse.ArgumentParser(description='Readingconfig file')
-parser1.add_argument('--bucket', dest="bucket", help="table_name", required=True)
-parser1.add_argument('--sample_config_prefix', dest="config_prefix", help="table_name", required=True)
-parser1.add_argument('--source_folder_prefix', dest="folder_prefix", help="table_name", required=True)
-parser1.add_argument('--config_dest_prefix', dest="dest_prefix", help="table_name", required=True)
-parser1.add_argument('--threshold', dest="threshold", help="table_name", required=True)
-parser1.add_argument('--g1xworkernodes', dest="g1xworkernodes", help="table_name", required=True)
-parser1.add_argument('--g2xworkernodes', dest="g2xworkernodes", help="table_name", required=True)
-parser1.add_argument('--configfile', dest="configfile", help="table_name", required=True)
-
-#parse all the arguments provided and copy it to local variable
-parser1_config = parser1.parse_args()
-bucket = parser1_config.bucket
-config_prefix = parser1_config.config_prefix
-folder_prefix = parser1_config.folder_prefix
-dest_prefix = parser1_config.dest_prefix
-threshold = int(parser1_config.threshold)
-g1xworkernodes=parser1_config.g1xworkernodes
-g2xworkernodes=parser1_config.g2xworkernodes
-configfile = parser1_config.configfile
 
 def adhoc_path_generation(bucket,prefix):
     #Responsible for getting the config file from the given prefix
-    bucket_name = s3_res.Bucket(bucket)
-    keys = ["s3://"+bucket+"/"+o.key for o in bucket_name.objects.filter(Prefix=prefix)]
+    with span('adhoc_path_generation', bucket=bucket, prefix=prefix) as listing_span:
+        bucket_name = s3_res.Bucket(bucket)
+        keys = ["s3://"+bucket+"/"+o.key for o in bucket_name.objects.filter(Prefix=prefix)]
+        listing_span.set(keys=len(keys))
     print(keys)
     return keys
 
-def get_folder_size(bucket, prefix):
-    #responsible for getting the size of the folder.  Return in bytes.
-    total_size = 0
-    for obj in boto3.resource('s3').Bucket(bucket).objects.filter(Prefix=prefix):
-        # print(obj.size)
-        total_size += obj.size
-    return total_size
-
-keys = adhoc_path_generation(bucket,config_prefix)
-
-#downloading the config locally and create a copy with the local changes
-for key in keys:
-    split_string = key.split('/')
-    print(split_string)
-    if (split_string[-1] == configfile):
-        dest_filename = split_string[-1]
-        s3_res.meta.client.download_file(bucket, config_prefix + split_string[-1],
-                                         '/data/dynamic_config_wrapper/' + split_string[-1])
-        parser = configparser.ConfigParser()
-        parser.optionxform = str
-        file = parser.read("/data/dynamic_config_wrapper/" + split_string[-1])
-
-file_size = get_folder_size(bucket,folder_prefix)
-print("In bytes"+str(file_size))
-
-#computing the file size in GB.
-file_size_in_gb = file_size/1024/1024/1024
-print("In GB"+str(file_size_in_gb))
-if(file_size_in_gb<threshold):
-    parser.set("job-dpu", "WorkerType",
-               "G.1X")
-    parser.set("job-dpu", "NumberOfWorkers",
-               g1xworkernodes)
-
-elif(file_size_in_gb>threshold):
-    parser.set("job-dpu", "WorkerType",
-               "G.2X")
-    parser.set("job-dpu", "NumberOfWorkers",
-               g2xworkernodes)
-
-print(dest_filename)
-split_string_arr = dest_filename.split('.')
-
-upload_file_name = split_string_arr[0] +"_upd.conf"
-print(upload_file_name)
-with open('/data/dynamic_config_wrapper/'+split_string_arr[0]+upload_file_name, 'w') as configfile:
-    parser.write(configfile)
-
-print(dest_filename)
-split_string_arr = dest_filename.split('.')
-old_config = configparser.ConfigParser()
-new_config = configparser.ConfigParser()
-
-#reading both old config and new config and do the comparison
-old_config.read("/data/dynamic_config_wrapper/" + dest_filename)
-new_config.read("/data/dynamic_config_wrapper/"+ upload_file_name)
-
-old_dict = old_config._sections
-new_dict = new_config._sections
-# print(old_dict)
-# print(new_dict)
-if old_dict==new_dict:
-    pass
-else:
-    s3_res.meta.client.upload_file("/data/dynamic_config_wrapper/"+ upload_file_name, bucket,
-                                   dest_prefix + dest_filename)
-    today = date.today()
-
-    dest_filename_fors3=split_string_arr[0]+"_"+str(today)+".conf"
-    s3_res.meta.client.upload_file("/data/dynamic_config_wrapper/" + dest_filename, bucket,
-                                   dest_prefix + dest_filename_fors3)
-
-s3_res.meta.client.upload_file('/data/dynamic_config_wrapper/'+split_string_arr[0]+'_upd.conf', bucket,
-                                           dest_prefix + dest_filename)
-
-s3_conf_file_location = "s3://" + bucket + "/" + dest_prefix + dest_filename
-
-#executing glue_spark_deploy wrapper script.
-cmd = """python3 glue_spark_deploy.py {config_file}""".format(
-    config_file=s3_conf_file_location)
-print(cmd)
-os.system(cmd)
-os.remove('/data/dynamic_config_wrapper/' + upload_file_name)
-os.remove('/data/dynamic_config_wrapper/' + dest_filename)
 
+def read_manifest(manifest):
+    """ Read the (configfile, source_folder_prefix) pairs of a fleet manifest.
+    Args:
+        manifest (string): Local path or s3:// uri of the manifest. Blank lines
+                           and lines starting with '#' are ignored.
+    Returns:
+        (list) of (configfile, source_folder_prefix) tuples.
+    """
+    if manifest[:2] == 's3':
+        s3_uri = manifest.split("//")[1]
+        manifest_bucket = s3_uri.split('/')[0]
+        manifest_key = '/'.join(s3_uri.split('/')[1:])
+        body = s3_res.Object(manifest_bucket, manifest_key).get()['Body'].read().decode('utf-8')
+    else:
+        with open(manifest) as manifest_file:
+            body = manifest_file.read()
+
+    entries = []
+    for line in body.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        configfile, folder_prefix = [elem.strip() for elem in line.split(',', 1)]
+        entries.append((configfile, folder_prefix))
+    return entries
+
+
+def resize_config(parser, policy, sizing_input, tuner=None, target_runtime=None):
+    #computing the file size in GB.
+    file_size_in_gb = sizing_input.total_size/1024/1024/1024
+    print("In GB"+str(file_size_in_gb))
+    job_dpu = policy.job_dpu(sizing_input)
+    decision = None
+    #the target_runtime option of the JOB section wins over the command line default
+    target_runtime = parser.get('JOB', 'target_runtime', fallback=target_runtime)
+    if tuner is not None and target_runtime:
+        decision = tuner.tune(parser.get('job-paramters', 'glueJobName'), float(target_runtime),
+                              sizing_input.total_size, job_dpu)
+        job_dpu = {'WorkerType': decision['WorkerType'], 'NumberOfWorkers': decision['NumberOfWorkers']}
+    for option, value in job_dpu.items():
+        parser.set("job-dpu", option, value)
+    return decision
+
+
+def group_small_files(parser, histogram, group_size):
+    #grouping options already in the config are left as they are
+    grouping = grouping_arguments(histogram, group_size=group_size)
+    if not parser.has_section('opt-paramters'):
+        if not grouping:
+            return {}
+        parser.add_section('opt-paramters')
+    added = dict((option, value) for option, value in grouping.items() if not parser.has_option('opt-paramters', option))
+    for option, value in added.items():
+        parser.set('opt-paramters', option, value)
+    return added
+
+
+def new_config_parser():
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    return parser
+
+
+def config_sections(parser):
+    #raw values of every section, comparable across parsers
+    return {section: dict(parser.items(section, raw=True)) for section in parser.sections()}
+
+
+def read_config_object(bucket, key):
+    """ Read a config from s3 with a single get_object.
+    Returns:
+        (tuple)
+        ConfigParser and ETag of the object, (None, None) if it does not exist.
+    """
+    try:
+        response = s3_res.meta.client.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None, None
+        raise
+    parser = new_config_parser()
+    parser.read_string(response['Body'].read().decode('utf-8'))
+    return parser, response['ETag']
+
+
+def render_config(parser):
+    body = io.StringIO()
+    parser.write(body)
+    return body.getvalue().encode('utf-8')
+
+
+def write_config_if_changed(bucket, key, parser, current, current_etag, versions=None):
+    """ Write parser to key with one conditional put_object, only if its content changed.
+
+    The put is guarded by the ETag of the object the comparison was made
+    against (or by IfNoneMatch when it did not exist), so a concurrent run
+    that rewrote the config in between is not silently overwritten: the
+    object is read again and compared once more instead.
+
+    Args:
+        parser (ConfigParser): Desired config.
+        current (ConfigParser): Config currently stored at key, None if absent.
+        current_etag (string): ETag of the stored config.
+        versions (ConfigVersionStore): Store recording the written config as
+                                       a new version of the file named by key, if any.
+    Returns:
+        (boolean)
+        True if the config was written, False if it was already up to date.
+    """
+    for attempt in range(CONFIG_WRITE_ATTEMPTS):
+        if current is not None and config_sections(current) == config_sections(parser):
+            return False
+
+        if current_etag:
+            condition = {'IfMatch': current_etag}
+        else:
+            condition = {'IfNoneMatch': '*'}
+        try:
+            s3_res.meta.client.put_object(Bucket=bucket, Key=key, Body=render_config(parser), **condition)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+            print("s3://{}/{} changed concurrently, comparing again".format(bucket, key))
+            current, current_etag = read_config_object(bucket, key)
+            continue
+
+        if versions is not None:
+            configfile = key.split('/')[-1]
+            versions.record(configfile, render_config(parser),
+                            job_name=parser.get('job-paramters', 'glueJobName', fallback=None),
+                            previous=render_config(current) if current is not None else None)
+        return True
+
+    raise RuntimeError("s3://{}/{} kept changing, gave up after {} attempts".format(
+        bucket, key, CONFIG_WRITE_ATTEMPTS))
+
+
+def process_config(bucket, config_prefix, configfile, folder_prefix, dest_prefix, policy,
+                   max_workers=DEFAULT_MAX_WORKERS, wait=True, sizer=None, plan=False, tuner=None,
+                   target_runtime=None, group_size=None, journal=None,
+                   versions_prefix=None):
+    """ Size the source prefix of one config, rewrite its job-dpu section and deploy it.
+    Args:
+        configfile (string): File name of the config under config_prefix.
+        folder_prefix (string): Source prefix to size. When None the
+                                source_folder_prefix option of the JOB section is used.
+        policy (SizingPolicy): Policy producing the job-dpu section.
+        wait (boolean): Wait for the started run to finish.
+        sizer (callable): Sizes the source prefix like get_folder_size, live listing when None.
+        plan (boolean): Only plan the config rewrite and deployment, with read-only calls.
+        tuner (SlaAutotuner): Tunes the policy's worker count to the job's target runtime, if any.
+        target_runtime (float): Target runtime for configs without a target_runtime option.
+        group_size (int): When set, small files dominating the source turn on file grouping in groups of this size.
+        journal (JournalEntry): Journal of the config in a resumable rollout. Steps
+                                it records as done are skipped, and the finished
+                                config is reported from it without any work.
+        versions_prefix (string): Prefix of the store every written config is
+                                  recorded in, <dest_prefix>versions/ when None.
+    Returns:
+        (dict) summary of the run for this config, with the deployment plan under 'plan' when planning.
+    """
+    with span('process_config', configfile=configfile) as config_span:
+        summary = _process_config(bucket, config_prefix, configfile, folder_prefix, dest_prefix, policy,
+                                  max_workers=max_workers, wait=wait, sizer=sizer, plan=plan, tuner=tuner,
+                                  target_runtime=target_runtime, group_size=group_size, journal=journal,
+                                  versions_prefix=versions_prefix)
+        config_span.set(job_name=summary['JobName'], changed=summary['changed'])
+    return summary
+
+
+def _process_config(bucket, config_prefix, configfile, folder_prefix, dest_prefix, policy,
+                    max_workers=DEFAULT_MAX_WORKERS, wait=True, sizer=None, plan=False, tuner=None,
+                    target_runtime=None, group_size=None, journal=None,
+                    versions_prefix=None):
+    started = time.time()
+    if plan:
+        journal = None
+    if journal and journal.done('finished'):
+        print("Skipping {}, finished earlier in this rollout".format(configfile))
+        return dict(journal.get('finished'), elapsed=time.time() - started, resumed=True)
+
+    #reading the config and the deployed copy it replaces in memory
+    dest_filename = configfile
+    source_key = config_prefix + configfile
+    dest_key = dest_prefix + dest_filename
+    with span('read_config', key=source_key):
+        parser, source_etag = read_config_object(bucket, source_key)
+        if parser is None:
+            raise ValueError("Config file {} not found under s3://{}/{}".format(configfile, bucket, config_prefix))
+        if dest_key == source_key:
+            current, current_etag = new_config_parser(), source_etag
+            current.read_dict(config_sections(parser))
+        else:
+            current, current_etag = read_config_object(bucket, dest_key)
+
+    if folder_prefix is None:
+        folder_prefix = parser.get('JOB', 'source_folder_prefix')
+
+    sized = journal.get('sized') if journal else None
+    if sized:
+        folder_size = FolderSize(sized['object_count'], sized['total_size'], sized['last_key'],
+                                 SizeHistogram.from_dict(sized['histogram']) if sized.get('histogram') else None)
+    else:
+        with span('get_folder_size', prefix=folder_prefix) as sizing_span:
+            folder_size = (sizer or get_folder_size)(bucket, folder_prefix, max_workers=max_workers,
+                                                     s3_client=s3_res.meta.client)
+            sizing_span.set(object_count=folder_size.object_count, total_size=folder_size.total_size)
+        if journal:
+            journal.record('sized', {'object_count': folder_size.object_count, 'total_size': folder_size.total_size,
+                                     'last_key': folder_size.last_key,
+                                     'histogram': folder_size.histogram.to_dict() if folder_size.histogram else None})
+    file_size = folder_size.total_size
+    print("Objects"+str(folder_size.object_count))
+    print("In bytes"+str(file_size))
+
+    written = journal.get('config_written') if journal else None
+    if written:
+        #the config as written before the restart, not sized again
+        parser = new_config_parser()
+        parser.read_string(written['config'])
+        autotune, grouping = written['autotune'], written['grouping']
+    else:
+        #the optional source_format option of the JOB section is a hint for the policy
+        sizing_input = SizingInput(file_size, folder_size.object_count,
+                                   parser.get('JOB', 'source_format', fallback=None))
+        autotune = resize_config(parser, policy, sizing_input, tuner=tuner, target_runtime=target_runtime)
+        grouping = group_small_files(parser, folder_size.histogram, group_size) if group_size else {}
+
+    summary = {
+        'configfile': configfile,
+        'folder_prefix': folder_prefix,
+        'object_count': folder_size.object_count,
+        'total_size': file_size,
+        'last_key': folder_size.last_key,
+        'WorkerType': parser.get('job-dpu', 'WorkerType', fallback=''),
+        'NumberOfWorkers': parser.get('job-dpu', 'NumberOfWorkers', fallback=''),
+        'autotune': autotune,
+        'grouping': grouping,
+        'compaction': compaction_candidates(folder_size.histogram, group_size=group_size or DEFAULT_GROUP_SIZE),
+    }
+    versions = ConfigVersionStore(bucket, versions_prefix or dest_prefix + VERSIONS_DIR,
+                                  s3_client=s3_res.meta.client)
+    if plan:
+        changed = current is None or config_sections(current) != config_sections(parser)
+        deployment = plan_deploy(parser, input_size=folder_size)
+        if changed:
+            #the config itself, then the calls recording it in the version store
+            api_calls = deployment['api_calls']
+            api_calls['s3:put_object'] = api_calls.get('s3:put_object', 0) + 1
+            for operation, count in versions.plan_record(
+                    dest_key.split('/')[-1], render_config(parser),
+                    previous=render_config(current) if current is not None else None).items():
+                api_calls[operation] = api_calls.get(operation, 0) + count
+        summary.update({'changed': changed, 'JobName': deployment['JobName'], 'JobRunId': None,
+                        'ExecutionTime': deployment['ExecutionTime'], 'status': 'PLANNED',
+                        'elapsed': time.time() - started, 'plan': deployment})
+        return summary
+
+    if written:
+        changed = written['changed']
+    else:
+        with span('config_rewrite', key=dest_key) as rewrite_span:
+            changed = write_config_if_changed(bucket, dest_key, parser, current, current_etag,
+                                              versions=versions)
+            rewrite_span.set(changed=changed)
+        if journal:
+            journal.record('config_written', {'config': render_config(parser).decode('utf-8'), 'changed': changed,
+                                              'autotune': autotune, 'grouping': grouping})
+
+    #deploying the updated config in process with glue_spark_deploy.
+    print("Deploying s3://" + bucket + "/" + dest_prefix + dest_filename)
+    run = deploy(parser, wait=wait, input_size=folder_size, journal=journal)
+
+    summary.update({
+        'changed': changed,
+        'JobName': run['JobName'],
+        'JobRunId': run['JobRunId'],
+        'ExecutionTime': run['ExecutionTime'],
+        'status': run['JobRunState'],
+        'elapsed': time.time() - started,
+        'targets': run.get('targets'),
+    })
+    if journal and summary['status'] in TERMINAL_STATES:
+        journal.record('finished', summary)
+    return summary
+
+
+def run_fleet(args, entries, monitor=None, history=None, journal=None, rollout=None):
+    """ Process many configs concurrently on a bounded worker pool.
+    Args:
+        args: Parsed wrapper arguments.
+        entries (list): (configfile, source_folder_prefix) tuples. A None
+                        source prefix is read from the config itself.
+        monitor (JobRunMonitor): Monitor watching the started runs, a default one when None.
+        history (RunHistory): Store the runs are recorded in, the default one when None.
+        journal (DeployJournal): Journal the steps of rollout are recorded in, if any.
+    Returns:
+        (list) of per-config summaries, in the order of entries.
+    """
+    policy = build_policy(args)
+    sizer = build_sizer(args)
+    tuner = build_tuner(args)
+    #one inventory pass sizes every source prefix
+    entries = prefetch_sizes(args, sizer, entries)
+
+    def run_one(entry):
+        configfile, folder_prefix = entry
+        try:
+            return process_config(args.bucket, args.config_prefix, configfile, folder_prefix, args.dest_prefix,
+                                  policy, max_workers=int(args.max_workers), wait=False, sizer=sizer,
+                                  plan=args.plan, tuner=tuner, target_runtime=args.target_runtime,
+                                  group_size=group_size(args), versions_prefix=args.versions_prefix,
+                                  journal=journal.entry(rollout, configfile) if journal else None)
+        except Exception as e:
+            return {'configfile': configfile, 'folder_prefix': folder_prefix,
+                    'status': 'ERROR ({})'.format(e)}
+
+    with span('fleet', configs=len(entries)):
+        with ThreadPoolExecutor(max_workers=max(1, int(args.fleet_workers))) as executor:
+            results = list(executor.map(glue_tracing.bind(run_one), entries))
+
+    #watching every started run with a single monitor, the runs in deploy targets with one per target
+    started = [result for result in results
+               if (result.get('JobRunId') or result.get('targets')) and not result.get('resumed')]
+    runs = wait_for_runs([{'JobName': result['JobName'], 'JobRunId': result['JobRunId'],
+                           'InputBytes': result['total_size'], 'ObjectCount': result['object_count'],
+                           'targets': result.get('targets')}
+                          for result in started], monitor=monitor, history=history)
+    for result, run in zip(started, runs):
+        result['status'] = run['JobRunState']
+        result['ExecutionTime'] = run['ExecutionTime']
+        if journal is not None and result['status'] in TERMINAL_STATES:
+            journal.record(rollout, result['configfile'], 'finished', result)
+    return results
+
+
+def print_fleet_summary(results):
+    print("{:<40} {:>12} {:>10} {:<6} {:>7} {:<7} {:>8}  {:<12} {}".format(
+        "config", "objects", "GB", "type", "workers", "changed", "seconds", "status", "run id"))
+    for result in results:
+        print("{:<40} {:>12} {:>10.2f} {:<6} {:>7} {:<7} {:>8.1f}  {:<12} {}".format(
+            result['configfile'],
+            result.get('object_count', ''),
+            result.get('total_size', 0)/1024/1024/1024,
+            result.get('WorkerType', ''),
+            result.get('NumberOfWorkers', ''),
+            str(result.get('changed', '')),
+            result.get('elapsed', 0.0),
+            result['status'],
+            result.get('JobRunId', '')))
+        for target in result.get('targets') or []:
+            print("    {:<20} {:<15} {:<12} {}".format(target['target'], target['region'], target['JobRunState'],
+                                                     target['error'] or target['JobRunId'] or ''))
+
+
+def print_plan_summary(results):
+    for result in results:
+        if 'plan' in result:
+            print("Config {}: {:.2f} GB in {} objects -> {} x {}, config {}".format(
+                result['configfile'], result['total_size']/1024/1024/1024, result['object_count'],
+                result['WorkerType'], result['NumberOfWorkers'], 'rewritten' if result['changed'] else 'unchanged'))
+            if result.get('autotune'):
+                print("  Autotuned: {}".format(result['autotune']['reason']))
+            if result.get('grouping'):
+                print("  File grouping: {}".format(', '.join(
+                    '{}={}'.format(option, value) for option, value in sorted(result['grouping'].items()))))
+            print_plan(result['plan'])
+        else:
+            print("Config {}: {}".format(result['configfile'], result['status']))
+
+    plans = [result['plan'] for result in results if 'plan' in result]
+    api_calls = {}
+    for plan in plans:
+        for name, count in plan['api_calls'].items():
+            api_calls[name] = api_calls.get(name, 0) + count
+    actions = [plan['action'] for plan in plans]
+    print("Jobs: {} to create, {} to update, {} unchanged".format(
+        actions.count('create'), actions.count('update'), actions.count('unchanged')))
+    print("API calls: {} ({})".format(sum(api_calls.values()), ', '.join(
+        '{} x{}'.format(name, count) for name, count in sorted(api_calls.items()))))
+    unpolled = sum(1 for plan in plans if plan['action'] != 'error' and plan.get('polls') is None)
+    if unpolled:
+        print("Polls of {} jobs without history are not counted, one get_job_run each after the first".format(
+            unpolled))
+    estimated = [plan['DPUHours'] for plan in plans if plan['DPUHours'] is not None]
+    print("Estimated cost: {:.2f} DPU-hours, {} of {} jobs without history".format(
+        sum(estimated), len(plans) - len(estimated), len(plans)))
+
+
+def write_compaction_report(path, results):
+    """ Write the compaction candidates of every config to path, one tab separated line per directory. """
+    with open(path, 'w') as report:
+        report.write("config\tprefix\tsmall_files\tsmall_bytes\tfiles_after\n")
+        for result in results:
+            for candidate in result.get('compaction') or []:
+                report.write("{}\t{}\t{}\t{}\t{}\n".format(result['configfile'], candidate['prefix'],
+                                                          candidate['small_files'], candidate['small_bytes'],
+                                                          candidate['files_after']))
+    print("Compaction report written to " + path)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    configure_clients(args)
+    if args.trace_file:
+        glue_tracing.configure(args.trace_file, args.trace_format)
+
+    if args.watch:
+        from glue_watch import WatchDaemon
+        if args.manifest:
+            entries = read_manifest(args.manifest)
+        elif args.fleet:
+            entries = None
+        else:
+            entries = [(args.configfile, args.folder_prefix)]
+        daemon = WatchDaemon(args, entries, interval=float(args.watch_interval))
+        if args.metrics_port:
+            daemon.serve_metrics(int(args.metrics_port))
+        try:
+            daemon.run_forever()
+        except KeyboardInterrupt:
+            daemon.stop()
+        return 0
+
+    journal, rollout = build_journal(args)
+    if args.manifest or args.fleet:
+        if args.manifest:
+            entries = read_manifest(args.manifest)
+        else:
+            #only the configs directly under the prefix, as in watch mode, a nested one has no config name of its own
+            listed = "s3://{}/{}".format(args.bucket, args.config_prefix)
+            entries = [(key[len(listed):], args.folder_prefix)
+                       for key in adhoc_path_generation(args.bucket, args.config_prefix)
+                       if key.endswith('.conf') and '/' not in key[len(listed):]]
+        results = run_fleet(args, entries, journal=journal, rollout=rollout)
+        if not args.plan:
+            print_fleet_summary(results)
+    else:
+        sizer = build_sizer(args)
+        prefetch_sizes(args, sizer, [(args.configfile, args.folder_prefix)])
+        results = [process_config(args.bucket, args.config_prefix, args.configfile, args.folder_prefix,
+                                  args.dest_prefix, build_policy(args), max_workers=int(args.max_workers),
+                                  sizer=sizer, plan=args.plan, tuner=build_tuner(args),
+                                  target_runtime=args.target_runtime, group_size=group_size(args),
+                                  versions_prefix=args.versions_prefix,
+                                  journal=journal.entry(rollout, args.configfile) if journal else None)]
+    if journal is not None and all(result['status'] in TERMINAL_STATES for result in results):
+        #every config finished, the next rollout of the same configs starts afresh
+        journal.complete(rollout)
+
+    if args.compaction_report:
+        write_compaction_report(args.compaction_report, results)
 
+    if args.plan:
+        print_plan_summary(results)
+        return 0 if all(result['status'] == 'PLANNED' for result in results) else 1
+    return 0 if all(result['status'] == 'SUCCEEDED' for result in results) else 1
 
 
+if __name__ == '__main__':
+    sys.exit(main())
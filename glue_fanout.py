@@ -0,0 +1,313 @@
+import argparse
+import datetime
+import json
+import logging
+import random
+import sys
+import time
+from collections import deque
+
+from botocore.exceptions import ClientError
+
+import glue_spark_deploy
+from glue_job_monitor import JobRunMonitor, TERMINAL_STATES
+from glue_journal import DeployJournal, rollout_id, DEFAULT_JOURNAL_DB
+from glue_spark_deploy import find_started_run, load_config, parse_config, parse_targets, prepare_job, record_results
+from glue_tracing import span
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_MIN_BACKOFF = 5
+DEFAULT_MAX_BACKOFF = 300
+
+# start_job_run errors that mean "not now" rather than "not ever"
+RETRYABLE_START_ERRORS = ('ConcurrentRunsExceededException', 'ThrottlingException', 'ResourceNumberLimitExceededException')
+
+
+def date_partitions(start, end, argument, date_format='%Y-%m-%d'):
+    """ One argument set per day from start to end included, e.g. {'--run_date': '2024-06-01'}. """
+    day = datetime.datetime.strptime(start, date_format).date()
+    last = datetime.datetime.strptime(end, date_format).date()
+    argument_sets = []
+    while day <= last:
+        argument_sets.append({argument: day.strftime(date_format)})
+        day += datetime.timedelta(days=1)
+    return argument_sets
+
+
+def load_argument_sets(path):
+    """ Read a JSON list of argument dicts, or JSON lines with one dict per line.
+
+    Glue job arguments are strings, so other values are passed as their
+    JSON text, e.g. {"--n": 5} as {'--n': '5'} and true as 'true'.
+    """
+    with open(path) as arguments_file:
+        body = arguments_file.read()
+    try:
+        argument_sets = json.loads(body)
+    except ValueError:
+        argument_sets = [json.loads(line) for line in body.splitlines() if line.strip()]
+    if not isinstance(argument_sets, list) or not all(isinstance(arguments, dict) for arguments in argument_sets):
+        raise ValueError("{} must hold a list of argument dicts".format(path))
+    return [dict((name, value if isinstance(value, str) else json.dumps(value)) for name, value in arguments.items())
+            for arguments in argument_sets]
+
+
+class FanOut(object):
+    """ Run one Glue job once per argument set, as many at a time as the job allows.
+
+    The job is deployed once. Runs are then started until max_concurrent
+    are in flight (the job's MaxConcurrentRuns by default) and the rest wait
+    in a queue; a slot freed by a finished run is refilled at the next poll.
+    A start refused with ConcurrentRunsExceededException or a throttling
+    error, e.g. because other runs of the job exist outside this fan-out,
+    is put back at the head of the queue and retried with exponential
+    backoff and jitter. Any other start error fails only its argument set.
+
+    With a journal, the start and the end of every run are recorded under
+    rollout, and resuming the rollout skips the finished argument sets and
+    re-attaches to the runs still in flight.
+    """
+
+    def __init__(self, glue_parameters, glue_opt_params, glue_dpus, argument_sets, max_concurrent=None,
+                 monitor=None, history=None, min_backoff=DEFAULT_MIN_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF,
+                 journal=None, rollout=None):
+        self.glue_parameters = dict(glue_parameters)
+        self.glue_opt_params = glue_opt_params
+        self.glue_dpus = glue_dpus
+        self.argument_sets = list(argument_sets)
+        self.job_name = glue_parameters['glueJobName']
+        self.max_concurrent = max(1, int(max_concurrent or glue_parameters.get('concurrency', 1)))
+        self.monitor = monitor or JobRunMonitor(glue_spark_deploy.glue)
+        self.history = history
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.journal = journal
+        self.rollout = rollout
+        self.results = [{'index': index, 'Arguments': arguments, 'JobName': self.job_name, 'JobRunId': None,
+                         'JobRunState': None, 'ExecutionTime': None, 'attempts': 0, 'error': None}
+                        for index, arguments in enumerate(self.argument_sets)]
+
+    def _arguments(self, result):
+        arguments = dict(self.glue_opt_params)
+        arguments.update(result['Arguments'])
+        return arguments
+
+    def _record(self, result, step, data=None):
+        if self.journal is not None:
+            self.journal.record(self.rollout, json.dumps(result['Arguments'], sort_keys=True), step, data)
+
+    def _resume(self, result):
+        """ Restore result from the journal.
+        Returns:
+            (boolean) True when the argument set needs no new run.
+        """
+        if self.journal is None:
+            return False
+        steps = self.journal.steps(self.rollout, json.dumps(result['Arguments'], sort_keys=True))
+        if 'finished' in steps:
+            result.update(steps['finished'])
+            logger.info("Argument set {} finished earlier as {}".format(result['index'], result['JobRunState']))
+            return True
+        if 'run_started' in steps:
+            result['JobRunId'] = steps['run_started']['JobRunId']
+        elif 'start_requested' in steps:
+            result['JobRunId'] = find_started_run(self.job_name, steps['start_requested']['at'],
+                                                  self._arguments(result))
+        if result['JobRunId']:
+            logger.info("Re-attaching argument set {} to run {}".format(result['index'], result['JobRunId']))
+            self._record(result, 'run_started', {'JobRunId': result['JobRunId']})
+            return True
+        return False
+
+    def _backoff(self, refusals):
+        delay = min(self.max_backoff, self.min_backoff * (2 ** (refusals - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _start(self, result):
+        """ Start the run of one argument set.
+        Returns:
+            (boolean) False when the start was refused for now and should be retried.
+        """
+        arguments = self._arguments(result)
+        result['attempts'] += 1
+        self._record(result, 'start_requested', {'at': time.time()})
+        try:
+            with span('start_job_run', job_name=self.job_name, index=result['index']):
+                response = glue_spark_deploy.glue.start_job_run(JobName=self.job_name, Arguments=arguments)
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code in RETRYABLE_START_ERRORS:
+                logger.info("Start of argument set {} refused with {}".format(result['index'], code))
+                return False
+            result['JobRunState'] = 'ERROR'
+            result['error'] = code
+            logger.error("Unable to start argument set {}: {}".format(result['index'], e))
+            return True
+        except Exception as e:
+            # e.g. a ParamValidationError of its arguments, which only this argument set has
+            result['JobRunState'] = 'ERROR'
+            result['error'] = type(e).__name__
+            logger.error("Unable to start argument set {}: {}".format(result['index'], e))
+            return True
+        result['JobRunId'] = response['JobRunId']
+        self._record(result, 'run_started', {'JobRunId': result['JobRunId']})
+        logger.info("Started argument set {} as run {}".format(result['index'], result['JobRunId']))
+        return True
+
+    def _stop(self, running, reason):
+        run_ids = [run_id for job_name, run_id in running]
+        for index in range(0, len(run_ids), 25):
+            response = glue_spark_deploy.glue.batch_stop_job_run(JobName=self.job_name,
+                                                                 JobRunIds=run_ids[index:index + 25])
+            logger.info("Recieved Kill Signal as {} . GraceFully Terminated the Job {}".format(reason, response))
+        record_results([self.results[i] for i in running.values()], {}, history=self.history)
+
+    def run(self):
+        """ Run every argument set to completion.
+        Returns:
+            (dict) the report of report().
+        """
+        started = time.time()
+        with span('fanout', job_name=self.job_name, runs=len(self.argument_sets)):
+            queue = deque()
+            running = {}
+            for result in self.results:
+                if not self._resume(result):
+                    queue.append(result)
+                elif result['JobRunState'] is None:
+                    running[(self.job_name, result['JobRunId'])] = result['index']
+            if queue:
+                prepare_job(self.glue_parameters, self.glue_opt_params, self.glue_dpus)
+            refusals = 0
+            retry_at = 0
+            try:
+                while queue or running:
+                    while queue and len(running) < self.max_concurrent and time.time() >= retry_at:
+                        result = queue[0]
+                        if not self._start(result):
+                            refusals += 1
+                            retry_at = time.time() + self._backoff(refusals)
+                            break
+                        refusals = 0
+                        queue.popleft()
+                        if result['JobRunId']:
+                            running[(self.job_name, result['JobRunId'])] = result['index']
+
+                    # a free slot waits for the backoff of the refused start, a full pool for the next poll
+                    intervals = []
+                    if queue and len(running) < self.max_concurrent:
+                        intervals.append(max(0, retry_at - time.time()))
+                    if running:
+                        current = self.monitor.poll(list(running))
+                        for key in list(running):
+                            job_run = current.get(key)
+                            if job_run is None:
+                                intervals.append(self.monitor.min_interval)
+                            elif job_run['JobRunState'] in TERMINAL_STATES:
+                                result = record_results([self.results[running.pop(key)]], {key: job_run},
+                                                        history=self.history)[0]
+                                self._record(result, 'finished', dict(
+                                    (name, result[name]) for name in ('JobRunId', 'JobRunState', 'ExecutionTime',
+                                                                      'attempts')))
+                                # a slot is free, refill it right away
+                                intervals.append(0)
+                            else:
+                                intervals.append(self.monitor.next_interval(key[0], job_run))
+                    if intervals and (queue or running):
+                        time.sleep(min(intervals))
+            except (Exception, KeyboardInterrupt) as e:
+                self._stop(running, e)
+                for result in queue:
+                    result['JobRunState'] = 'NOT_STARTED'
+                if isinstance(e, KeyboardInterrupt):
+                    raise
+                logger.error("Fan-out aborted: {}".format(e))
+        return self.report(time.time() - started)
+
+    def report(self, wall_clock):
+        """ Combined status of the fan-out.
+        Returns:
+            (dict)
+            per argument set results, the count of each final state, the wall
+            clock time and the summed execution time of the runs.
+        """
+        states = {}
+        for result in self.results:
+            states[result['JobRunState']] = states.get(result['JobRunState'], 0) + 1
+        return {
+            'JobName': self.job_name,
+            'runs': self.results,
+            'states': states,
+            'max_concurrent': self.max_concurrent,
+            'wall_clock': wall_clock,
+            'execution_time': sum(result['ExecutionTime'] or 0 for result in self.results),
+        }
+
+
+def print_fanout_summary(report):
+    print("{:>5}  {:<40} {:<12} {:>8} {:>8}  {}".format("set", "arguments", "status", "seconds", "attempts",
+                                                         "run id"))
+    for result in report['runs']:
+        print("{:>5}  {:<40} {:<12} {:>8} {:>8}  {}".format(
+            result['index'], json.dumps(result['Arguments'], sort_keys=True)[:40], result['JobRunState'],
+            result['ExecutionTime'] or '', result['attempts'], result['JobRunId'] or result['error'] or ''))
+    print("{}: {} with up to {} runs at a time, {:.0f}s wall clock for {:.0f}s of runs".format(
+        report['JobName'], ', '.join('{} {}'.format(count, state) for state, count in sorted(report['states'].items())),
+        report['max_concurrent'], report['wall_clock'], report['execution_time']))
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Run one Glue job over many argument sets")
+    parser.add_argument('config', help="local path or s3 uri of the conf file")
+    parser.add_argument('--arguments', help="JSON list (or JSON lines) of argument dicts, one run each")
+    parser.add_argument('--date_range', nargs=2, metavar=('START', 'END'),
+                        help="one run per day from START to END (YYYY-MM-DD), passed as --date_argument")
+    parser.add_argument('--date_argument', default='--run_date', help="job argument receiving the date")
+    parser.add_argument('--max_concurrent', type=int,
+                        help="runs in flight at once, the job's concurrency by default")
+    parser.add_argument('--journal', nargs='?', const=DEFAULT_JOURNAL_DB,
+                        help="record every run in this sqlite journal, so the fan-out can be resumed")
+    parser.add_argument('--resume', action='store_true',
+                        help="resume the unfinished fan-out of the same inputs (or --rollout_id) from the journal")
+    parser.add_argument('--rollout_id', help="name of the fan-out in the journal, by default derived from its inputs")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+    if bool(args.arguments) == bool(args.date_range):
+        parser.error("give either --arguments or --date_range")
+    if args.resume and not args.journal:
+        args.journal = DEFAULT_JOURNAL_DB
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if args.arguments:
+        argument_sets = load_argument_sets(args.arguments)
+    else:
+        argument_sets = date_partitions(args.date_range[0], args.date_range[1], args.date_argument)
+    config = load_config(args.config)
+    glue_params, glue_script_params, glue_dpus = parse_config(config)
+    if parse_targets(config):
+        # the concurrency limit and the single monitor of a fan-out cover one region and account
+        raise ValueError("{} deploys to several targets, which the fan-out does not support".format(
+            glue_params['glueJobName']))
+    journal = DeployJournal(args.journal) if args.journal else None
+    rollout = args.rollout_id or rollout_id(args.config, json.dumps(argument_sets, sort_keys=True))
+    if journal is not None:
+        journal.begin(rollout, resume=args.resume)
+    report = FanOut(glue_params, glue_script_params, glue_dpus, argument_sets,
+                    max_concurrent=args.max_concurrent, journal=journal, rollout=rollout).run()
+    if journal is not None and all(result['JobRunState'] in TERMINAL_STATES for result in report['runs']):
+        journal.complete(rollout)
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print_fanout_summary(report)
+    return 0 if report['states'].get('SUCCEEDED', 0) == len(argument_sets) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
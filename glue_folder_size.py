@@ -0,0 +1,212 @@
+import bisect
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from glue_aws_clients import get_client
+from glue_sizing_policy import DEFAULT_SMALL_FILE_SIZE, MB
+from glue_tracing import bind
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_DISCOVERY_DEPTH = 3
+
+# upper bounds of the size histogram buckets, the last bucket holds every larger object
+SIZE_BUCKETS = (64 * 1024, MB, 8 * MB, 32 * MB, 128 * MB, 512 * MB, 1024 * MB)
+
+# last_key is the greatest key seen, the watermark of incremental sizing.
+# histogram is the SizeHistogram of the objects, None when the sizer does not build one.
+FolderSize = namedtuple('FolderSize', ['object_count', 'total_size', 'last_key', 'histogram'],
+                        defaults=(None, None))
+
+
+class SizeHistogram(object):
+    """ Object counts and bytes per size bucket, built while listing.
+
+    Objects smaller than small_file_size are also counted per directory
+    (the key up to its last '/'), which tells where small files pile up.
+    """
+
+    def __init__(self, small_file_size=DEFAULT_SMALL_FILE_SIZE):
+        self.small_file_size = small_file_size
+        self.counts = [0] * (len(SIZE_BUCKETS) + 1)
+        self.sizes = [0] * (len(SIZE_BUCKETS) + 1)
+        self.small_prefixes = {}
+
+    def add(self, key, size):
+        bucket = bisect.bisect_right(SIZE_BUCKETS, size)
+        self.counts[bucket] += 1
+        self.sizes[bucket] += size
+        if size < self.small_file_size:
+            directory = key[:key.rfind('/') + 1]
+            stats = self.small_prefixes.get(directory)
+            if stats is None:
+                stats = self.small_prefixes[directory] = [0, 0]
+            stats[0] += 1
+            stats[1] += size
+
+    def merge(self, other):
+        for bucket, count in enumerate(other.counts):
+            self.counts[bucket] += count
+            self.sizes[bucket] += other.sizes[bucket]
+        for directory, (count, size) in other.small_prefixes.items():
+            stats = self.small_prefixes.setdefault(directory, [0, 0])
+            stats[0] += count
+            stats[1] += size
+        return self
+
+    @property
+    def object_count(self):
+        return sum(self.counts)
+
+    @property
+    def small_count(self):
+        return sum(count for count, size in self.small_prefixes.values())
+
+    @property
+    def small_bytes(self):
+        return sum(size for count, size in self.small_prefixes.values())
+
+    def to_dict(self):
+        return {'small_file_size': self.small_file_size, 'counts': self.counts, 'sizes': self.sizes,
+                'small_prefixes': self.small_prefixes}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['small_file_size'])
+        histogram.counts = list(data['counts'])
+        histogram.sizes = list(data['sizes'])
+        histogram.small_prefixes = dict((directory, list(stats))
+                                        for directory, stats in data['small_prefixes'].items())
+        return histogram
+
+
+def _max_key(*keys):
+    keys = [key for key in keys if key is not None]
+    return max(keys) if keys else None
+
+
+def _list_level(s3_client, bucket, prefix):
+    """ List the objects directly under prefix and the sub-prefixes below it.
+    Args:
+        s3_client: boto3 s3 client.
+        bucket (string): Name of the bucket.
+        prefix (string): Prefix to list with the '/' delimiter.
+    Returns:
+        (tuple)
+        object count, total bytes, last key, size histogram and the list of discovered sub-prefixes.
+    """
+    object_count = 0
+    total_size = 0
+    last_key = None
+    histogram = SizeHistogram()
+    sub_prefixes = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+        for obj in page.get('Contents', []):
+            object_count += 1
+            total_size += obj['Size']
+            last_key = obj['Key']
+            histogram.add(last_key, obj['Size'])
+        for common_prefix in page.get('CommonPrefixes', []):
+            sub_prefixes.append(common_prefix['Prefix'])
+    return object_count, total_size, last_key, histogram, sub_prefixes
+
+
+def _list_all(s3_client, bucket, prefix, start_after=None):
+    """ List every object below prefix, without a delimiter.
+    Args:
+        start_after (string): Only list the keys after this one.
+    Returns:
+        (tuple)
+        object count, total bytes, last key and size histogram.
+    """
+    object_count = 0
+    total_size = 0
+    last_key = None
+    histogram = SizeHistogram()
+    paginator = s3_client.get_paginator('list_objects_v2')
+    pagination = {'Bucket': bucket, 'Prefix': prefix}
+    if start_after:
+        pagination['StartAfter'] = start_after
+    for page in paginator.paginate(**pagination):
+        for obj in page.get('Contents', []):
+            object_count += 1
+            total_size += obj['Size']
+            last_key = obj['Key']
+            histogram.add(last_key, obj['Size'])
+    return object_count, total_size, last_key, histogram
+
+
+def get_folder_size(bucket, prefix, max_workers=DEFAULT_MAX_WORKERS,
+                    discovery_depth=DEFAULT_DISCOVERY_DEPTH, s3_client=None):
+    """ Return the number of objects, the total size in bytes and the size histogram below prefix.
+
+    Sub-prefixes are discovered level by level with the '/' delimiter until
+    there is enough of them to keep the worker pool busy (or discovery_depth
+    is reached). Each discovered sub-prefix is then listed on its own worker
+    and the counts are merged.
+
+    Args:
+        bucket (string): Name of the bucket.
+        prefix (string): Prefix to size.
+        max_workers (int): Maximum number of concurrent listings.
+        discovery_depth (int): Maximum number of levels to expand before
+                               listing the remaining sub-prefixes in full.
+        s3_client: Optional boto3 s3 client, the shared one from glue_aws_clients by default.
+                   Its connection pool should be at least max_workers.
+    Returns:
+        (FolderSize)
+    """
+    max_workers = max(1, int(max_workers))
+    if s3_client is None:
+        s3_client = get_client('s3')
+
+    object_count = 0
+    total_size = 0
+    last_key = None
+    histogram = SizeHistogram()
+    frontier = [prefix]
+    depth = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while frontier and len(frontier) < max_workers and depth < discovery_depth:
+            next_frontier = []
+            for count, size, level_last_key, level_histogram, sub_prefixes in executor.map(
+                    bind(lambda p: _list_level(s3_client, bucket, p)), frontier):
+                object_count += count
+                total_size += size
+                last_key = _max_key(last_key, level_last_key)
+                histogram.merge(level_histogram)
+                next_frontier.extend(sub_prefixes)
+            frontier = next_frontier
+            depth += 1
+
+        logger.info("Sizing {} sub-prefixes of s3://{}/{} with {} workers".format(
+            len(frontier), bucket, prefix, max_workers))
+        for count, size, prefix_last_key, prefix_histogram in executor.map(
+                bind(lambda p: _list_all(s3_client, bucket, p)), frontier):
+            object_count += count
+            total_size += size
+            last_key = _max_key(last_key, prefix_last_key)
+            histogram.merge(prefix_histogram)
+
+    return FolderSize(object_count, total_size, last_key, histogram)
+
+
+def get_folder_size_after(bucket, prefix, start_after, s3_client=None):
+    """ Return the number of objects and the total bytes below prefix whose key is after start_after.
+    Args:
+        bucket (string): Name of the bucket.
+        prefix (string): Prefix to size.
+        start_after (string): Key the listing starts after.
+        s3_client: Optional boto3 s3 client, the shared one from glue_aws_clients by default.
+    Returns:
+        (FolderSize)
+        last_key is None when there is no key after start_after.
+    """
+    if s3_client is None:
+        s3_client = get_client('s3')
+    return FolderSize(*_list_all(s3_client, bucket, prefix, start_after=start_after))
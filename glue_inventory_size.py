@@ -0,0 +1,270 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+from botocore.exceptions import ClientError
+
+from glue_aws_clients import get_client
+from glue_folder_size import FolderSize, SizeHistogram, get_folder_size, DEFAULT_MAX_WORKERS
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_MAX_AGE_HOURS = 48
+
+
+def split_s3_uri(s3_uri):
+    s3_path = s3_uri.split("//")[1]
+    return s3_path.split('/')[0], '/'.join(s3_path.split('/')[1:])
+
+
+def load_manifest(s3_client, inventory_uri):
+    """ Load the manifest.json of an S3 Inventory.
+    Args:
+        inventory_uri (string): s3 uri of a manifest.json, or of the inventory
+                                configuration prefix (<dest>/<source bucket>/<config id>/),
+                                in which case its most recent manifest is used.
+    Returns:
+        (dict) the manifest, None when no manifest could be found.
+    """
+    bucket, key = split_s3_uri(inventory_uri)
+    if not key.endswith('manifest.json'):
+        prefix = key if key.endswith('/') else key + '/'
+        dated_prefixes = []
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/'):
+            for common_prefix in page.get('CommonPrefixes', []):
+                # inventory deliveries are in YYYY-MM-DDTHH-MMZ/ folders, hive/ and data/ are not
+                if common_prefix['Prefix'][len(prefix):][:1].isdigit():
+                    dated_prefixes.append(common_prefix['Prefix'])
+        if not dated_prefixes:
+            return None
+        key = max(dated_prefixes) + 'manifest.json'
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    manifest = json.loads(body)
+    logger.info("Using inventory manifest s3://{}/{}".format(bucket, key))
+    return manifest
+
+
+def manifest_age(manifest):
+    """ Age in seconds of the inventory, from its creationTimestamp (milliseconds since epoch). """
+    return time.time() - int(manifest['creationTimestamp']) / 1000.0
+
+
+def _schema(manifest):
+    return [column.strip() for column in manifest['fileSchema'].split(',')]
+
+
+def has_size_column(manifest):
+    """ Whether the inventory lists object sizes, which is an optional field of S3 Inventory. """
+    if manifest['fileFormat'] == 'CSV':
+        return 'Size' in _schema(manifest)
+    # ORC and Parquet schemas name their columns in lower case, e.g. struct<bucket:string,key:string,size:bigint>
+    return re.search(r'\bsize\b', manifest['fileSchema'].lower()) is not None
+
+
+def _is_current(row):
+    # versioned inventories list every version; only the latest non delete marker counts
+    if str(row.get('IsLatest', 'true')).lower() != 'true':
+        return False
+    return str(row.get('IsDeleteMarker', 'false')).lower() != 'true'
+
+
+def _iter_csv(body, columns):
+    with gzip.GzipFile(fileobj=body) as unzipped:
+        for values in csv.reader(io.TextIOWrapper(unzipped, encoding='utf-8')):
+            row = dict(zip(columns, values))
+            if not row.get('Size') or not _is_current(row):
+                continue
+            yield unquote(row['Key']), int(row['Size'])
+
+
+def _iter_columnar(path, file_format):
+    # pyarrow is only needed for ORC and Parquet inventories
+    try:
+        if file_format == 'Parquet':
+            import pyarrow.parquet as columnar
+        else:
+            import pyarrow.orc as columnar
+    except ImportError:
+        raise RuntimeError("pyarrow is required to read {} inventories".format(file_format))
+
+    if file_format == 'Parquet':
+        batches = columnar.ParquetFile(path).iter_batches()
+    else:
+        orc_file = columnar.ORCFile(path)
+        batches = (orc_file.read_stripe(stripe) for stripe in range(orc_file.nstripes))
+    for batch in batches:
+        for row in batch.to_pylist():
+            # columnar inventories use lower case column names
+            row = {name.lower(): value for name, value in row.items()}
+            if row.get('size') is None:
+                continue
+            if row.get('is_latest') is False or row.get('is_delete_marker') is True:
+                continue
+            yield row['key'], int(row['size'])
+
+
+def iter_inventory_file(s3_client, manifest, file_key):
+    """ Stream the (key, size) rows of one inventory data file. """
+    bucket = manifest['destinationBucket'].split(':::')[-1]
+    file_format = manifest['fileFormat']
+    if file_format == 'CSV':
+        body = s3_client.get_object(Bucket=bucket, Key=file_key)['Body']
+        for row in _iter_csv(body, _schema(manifest)):
+            yield row
+        return
+    # columnar files need random access, they are spooled to disk rather than memory
+    with tempfile.NamedTemporaryFile() as local_file:
+        s3_client.download_fileobj(bucket, file_key, local_file)
+        local_file.flush()
+        for row in _iter_columnar(local_file.name, file_format):
+            yield row
+
+
+class PrefixAggregator(object):
+    """ Sums object counts and bytes, and builds the size histogram, of the keys under each prefix.
+
+    Prefixes are grouped by their first path segment, so each key is only
+    compared with the prefixes that can contain it. Memory is bounded by
+    the number of prefixes, not by the number of rows.
+    """
+
+    def __init__(self, prefixes):
+        self.prefixes = list(prefixes)
+        self.groups = {}
+        self.unsegmented = []
+        for prefix in self.prefixes:
+            if '/' in prefix:
+                self.groups.setdefault(prefix.split('/', 1)[0], []).append(prefix)
+            else:
+                self.unsegmented.append(prefix)
+        self.counts = dict((prefix, 0) for prefix in self.prefixes)
+        self.sizes = dict((prefix, 0) for prefix in self.prefixes)
+        self.histograms = dict((prefix, SizeHistogram()) for prefix in self.prefixes)
+
+    def add(self, key, size):
+        candidates = self.groups.get(key.split('/', 1)[0], [])
+        for prefix in candidates + self.unsegmented:
+            if key.startswith(prefix):
+                self.counts[prefix] += 1
+                self.sizes[prefix] += size
+                self.histograms[prefix].add(key, size)
+
+    def merge(self, other):
+        for prefix in self.prefixes:
+            self.counts[prefix] += other.counts[prefix]
+            self.sizes[prefix] += other.sizes[prefix]
+            self.histograms[prefix].merge(other.histograms[prefix])
+
+    def results(self):
+        return dict((prefix, FolderSize(self.counts[prefix], self.sizes[prefix], None, self.histograms[prefix]))
+                    for prefix in self.prefixes)
+
+
+def inventory_folder_sizes(s3_client, manifest, prefixes, max_workers=DEFAULT_MAX_WORKERS):
+    """ Size several prefixes in one pass over an inventory.
+
+    The data files of the inventory are streamed concurrently, each into
+    its own aggregator, and the aggregators are merged at the end.
+
+    Returns:
+        (dict) mapping each prefix to its FolderSize.
+    """
+    def aggregate(file_entry):
+        aggregator = PrefixAggregator(prefixes)
+        for key, size in iter_inventory_file(s3_client, manifest, file_entry['key']):
+            aggregator.add(key, size)
+        return aggregator
+
+    total = PrefixAggregator(prefixes)
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        for aggregator in executor.map(aggregate, manifest['files']):
+            total.merge(aggregator)
+    return total.results()
+
+
+class InventorySizer(object):
+    """ Size prefixes from an S3 Inventory, falling back to live listing.
+
+    Live listing is used when the inventory cannot be found, is older than
+    max_age_hours, belongs to another bucket, has no Size field or cannot
+    be read.
+    prefetch() sizes many prefixes in one inventory pass, and later calls
+    for those prefixes are served from that pass. A prefix that was not
+    prefetched is listed live: a pass over the whole inventory for a
+    single prefix is often slower than listing it.
+    """
+
+    def __init__(self, inventory_uri, max_age_hours=DEFAULT_MAX_AGE_HOURS, max_workers=DEFAULT_MAX_WORKERS,
+                 s3_client=None):
+        self.inventory_uri = inventory_uri
+        self.max_age = max_age_hours * 3600
+        self.max_workers = max_workers
+        self.s3_client = s3_client or get_client('s3')
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._loaded = False
+        self._sizes = {}
+
+    def _usable_manifest(self, bucket):
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                try:
+                    self._manifest = load_manifest(self.s3_client, self.inventory_uri)
+                except (ClientError, ValueError) as e:
+                    logger.warning("Unable to read inventory {}: {}".format(self.inventory_uri, e))
+        manifest = self._manifest
+        if manifest is None:
+            logger.info("No inventory found at {}, listing live".format(self.inventory_uri))
+            return None
+        if manifest['sourceBucket'] != bucket:
+            logger.info("Inventory is for bucket {}, not {}, listing live".format(manifest['sourceBucket'], bucket))
+            return None
+        age = manifest_age(manifest)
+        if age > self.max_age:
+            logger.info("Inventory is {:.1f} hours old, listing live".format(age / 3600))
+            return None
+        if not has_size_column(manifest):
+            # every row would be skipped and every prefix sized as empty
+            logger.warning("Inventory {} does not list object sizes, listing live".format(self.inventory_uri))
+            return None
+        return manifest
+
+    def prefetch(self, bucket, prefixes):
+        """ Size prefixes in one inventory pass. Returns False when live listing will be used instead. """
+        prefixes = [prefix for prefix in set(prefixes) if prefix is not None]
+        manifest = self._usable_manifest(bucket)
+        if manifest is None or not prefixes:
+            return False
+        try:
+            sizes = inventory_folder_sizes(self.s3_client, manifest, prefixes, self.max_workers)
+        except Exception as e:
+            # a malformed row (ValueError, KeyError, csv.Error) is no reason to fail the config
+            logger.warning("Unable to read inventory data, listing live: {}".format(e))
+            return False
+        with self._lock:
+            self._sizes.update(((bucket, prefix), size) for prefix, size in sizes.items())
+        return True
+
+    def __call__(self, bucket, prefix, max_workers=DEFAULT_MAX_WORKERS, s3_client=None):
+        with self._lock:
+            cached = self._sizes.get((bucket, prefix))
+        if cached is not None:
+            return cached
+        return get_folder_size(bucket, prefix, max_workers=max_workers, s3_client=s3_client or self.s3_client)
@@ -0,0 +1,190 @@
+import datetime
+import logging
+import time
+
+from botocore.exceptions import ClientError
+
+from glue_tracing import span
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'STOPPED', 'TIMEOUT', 'ERROR', 'EXPIRED')
+TRANSITION_STATES = ('STARTING', 'STOPPING', 'WAITING')
+
+DEFAULT_MIN_INTERVAL = 5
+DEFAULT_MAX_INTERVAL = 300
+DEFAULT_HISTORY_SIZE = 10
+DEFAULT_PAGE_SIZE = 200
+# consecutive polls a run can be missing from before it is given up as ERROR
+DEFAULT_MAX_MISSES = 5
+
+
+class JobRunMonitor(object):
+    """ Watch Glue job runs until they reach a terminal state.
+
+    Runs are grouped by job name and each group is read with one paginated
+    get_job_runs call per poll, so watching many runs of the same job does
+    not cost one get_job_run per run. The first page also provides the
+    job's recent successful runs, whose median execution time drives the
+    poll interval: runs are polled rarely while far from their expected
+    finish and more often as they approach it. Without history, or once a
+    run overruns its expected time, the interval backs off exponentially.
+
+    A run that cannot be read for max_misses polls in a row (its job was
+    deleted, the run expired, access was denied) is returned in the ERROR
+    state, so the loops waiting on it end instead of polling forever.
+    """
+
+    def __init__(self, glue_client, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 history_size=DEFAULT_HISTORY_SIZE, max_misses=DEFAULT_MAX_MISSES):
+        self.glue = glue_client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.history_size = history_size
+        self.max_misses = max_misses
+        self._expected = {}
+        self._attempts = {}
+        self._misses = {}
+
+    def expected_runtime(self, job_name):
+        """ Median execution time in seconds of the job's recent successful runs, or None. """
+        return self._expected.get(job_name)
+
+    def _record_history(self, job_name, job_runs):
+        if job_name in self._expected:
+            return
+        # get_job_runs returns the most recent runs first
+        exec_times = [job_run['ExecutionTime'] for job_run in job_runs
+                      if job_run.get('JobRunState') == 'SUCCEEDED' and job_run.get('ExecutionTime')]
+        exec_times = sorted(exec_times[:self.history_size])
+        self._expected[job_name] = exec_times[len(exec_times) // 2] if exec_times else None
+
+    def poll(self, runs):
+        """ Fetch the current state of runs, one request group per job name.
+        Args:
+            runs (list): (job_name, run_id) tuples.
+        Returns:
+            (dict)
+            mapping (job_name, run_id) to the JobRun returned by Glue, a run
+            missing for max_misses polls in a row to a JobRun in the ERROR state.
+        """
+        by_job = {}
+        for job_name, run_id in runs:
+            by_job.setdefault(job_name, set()).add(run_id)
+
+        with span('poll', runs=len(runs), jobs=len(by_job)) as poll_span:
+            found = self._poll_jobs(by_job)
+            poll_span.set(found=len(found))
+        for key in runs:
+            if key in found:
+                self._misses.pop(key, None)
+                continue
+            self._misses[key] = self._misses.get(key, 0) + 1
+            if self._misses[key] >= self.max_misses:
+                logger.error("Run {} of {} could not be read in {} polls, giving it up".format(
+                    key[1], key[0], self._misses[key]))
+                self._misses.pop(key)
+                found[key] = {'Id': key[1], 'JobName': key[0], 'JobRunState': 'ERROR',
+                              'ErrorMessage': "Run could not be read in {} polls".format(self.max_misses)}
+        return found
+
+    def _poll_jobs(self, by_job):
+        found = {}
+        for job_name, run_ids in by_job.items():
+            missing = set(run_ids)
+            try:
+                if len(missing) == 1 and job_name in self._expected:
+                    run_id = missing.pop()
+                    found[(job_name, run_id)] = self.glue.get_job_run(JobName=job_name, RunId=run_id)['JobRun']
+                    continue
+
+                paginator = self.glue.get_paginator('get_job_runs')
+                for page in paginator.paginate(JobName=job_name, PaginationConfig={'PageSize': DEFAULT_PAGE_SIZE}):
+                    self._record_history(job_name, page['JobRuns'])
+                    for job_run in page['JobRuns']:
+                        if job_run['Id'] in missing:
+                            found[(job_name, job_run['Id'])] = job_run
+                            missing.discard(job_run['Id'])
+                    if not missing:
+                        break
+                for run_id in missing:
+                    found[(job_name, run_id)] = self.glue.get_job_run(JobName=job_name, RunId=run_id)['JobRun']
+            except ClientError as err:
+                logger.error("Unable to read runs of {}: {}".format(job_name, err.response['Error']['Code']))
+        return found
+
+    def next_interval(self, job_name, job_run):
+        """ Seconds to wait before polling job_run again. """
+        key = (job_name, job_run['Id'])
+        attempt = self._attempts.get(key, 0)
+        self._attempts[key] = attempt + 1
+
+        if job_run['JobRunState'] in TRANSITION_STATES:
+            return self.min_interval
+
+        expected = self._expected.get(job_name)
+        if expected and job_run.get('StartedOn'):
+            started_on = job_run['StartedOn']
+            elapsed = (datetime.datetime.now(started_on.tzinfo) - started_on).total_seconds()
+            remaining = expected - elapsed
+            if remaining > self.min_interval:
+                self._attempts[key] = 0
+                return min(self.max_interval, remaining / 2)
+
+        return max(self.min_interval, min(self.max_interval, self.min_interval * (1.5 ** attempt)))
+
+    def estimate_polls(self, expected_runtime):
+        """ Number of polls wait() makes on a run that finishes after expected_runtime seconds.
+        Returns:
+            (int) None when expected_runtime is unknown.
+        """
+        if not expected_runtime:
+            return None
+        elapsed = 0.0
+        polls = 1
+        attempt = 0
+        while elapsed < expected_runtime:
+            remaining = expected_runtime - elapsed
+            if remaining > self.min_interval:
+                attempt = 0
+                elapsed += min(self.max_interval, remaining / 2)
+            else:
+                elapsed += max(self.min_interval, min(self.max_interval, self.min_interval * (1.5 ** attempt)))
+                attempt += 1
+            polls += 1
+        return polls
+
+    def wait(self, runs):
+        """ Block until every run reaches a terminal state.
+        Args:
+            runs (list): (job_name, run_id) tuples.
+        Returns:
+            (dict) mapping (job_name, run_id) to the final JobRun.
+        """
+        pending = list(runs)
+        finished = {}
+        states = {}
+        started = time.time()
+        while pending:
+            current = self.poll(pending)
+            intervals = []
+            for key in list(pending):
+                job_run = current.get(key)
+                if job_run is None:
+                    intervals.append(self.min_interval)
+                    continue
+                if states.get(key) != job_run['JobRunState']:
+                    states[key] = job_run['JobRunState']
+                    logger.info("Time: %i | Job %s | Run %s | Status %s" % (
+                        time.time() - started, key[0], key[1], job_run['JobRunState']))
+                if job_run['JobRunState'] in TERMINAL_STATES:
+                    finished[key] = job_run
+                    pending.remove(key)
+                    self._attempts.pop(key, None)
+                else:
+                    intervals.append(self.next_interval(key[0], job_run))
+            if pending:
+                time.sleep(min(intervals))
+        return finished
@@ -0,0 +1,138 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Set GLUE_JOURNAL_DB to keep the journal of resumable rollouts elsewhere.
+DEFAULT_JOURNAL_DB = os.environ.get('GLUE_JOURNAL_DB',
+                                    os.path.join(os.path.expanduser('~'), '.glue_deploy_journal.db'))
+
+# steps of one config or argument set, in the order they complete
+STEPS = ('sized', 'config_written', 'script_prepared', 'deployed', 'start_requested', 'run_started', 'finished')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollouts (
+    rollout TEXT NOT NULL PRIMARY KEY,
+    started_on TEXT NOT NULL,
+    completed_on TEXT
+);
+CREATE TABLE IF NOT EXISTS steps (
+    rollout TEXT NOT NULL,
+    item TEXT NOT NULL,
+    step TEXT NOT NULL,
+    data TEXT,
+    recorded_on TEXT NOT NULL,
+    PRIMARY KEY (rollout, item, step)
+);
+"""
+
+
+def rollout_id(*parts):
+    """ Id of the rollout defined by parts, e.g. the arguments naming its configs, so a re-run can resume it. """
+    return hashlib.sha1('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:16]
+
+
+class DeployJournal(object):
+    """ Local SQLite write-ahead journal of the steps completed by a rollout.
+
+    Every step is committed as soon as it completes, before the next one
+    starts, so a rollout killed partway can be resumed and skip the work
+    already done. A rollout is identified by an id. Only an explicit resume
+    continues it; beginning it again otherwise starts from scratch, so the
+    same rollout run again on a later day never picks up the sizing,
+    configs and finished items of one left unfinished.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def begin(self, rollout, resume=False):
+        """ Start rollout, or with resume continue it where it was left unfinished.
+        Returns:
+            (int) number of items with completed steps, 0 for a rollout started from scratch.
+        """
+        now = datetime.datetime.utcnow().isoformat()
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM rollouts WHERE rollout = ?", (rollout,)).fetchone()
+            if row is None or row['completed_on'] or not resume:
+                if row is not None and not row['completed_on']:
+                    logger.warning("Rollout {} started on {} was left unfinished, starting it again from scratch "
+                                   "(pass --resume to continue it)".format(rollout, row['started_on']))
+                elif resume:
+                    logger.info("No unfinished rollout {} to resume, starting it".format(rollout))
+                self._conn.execute("DELETE FROM steps WHERE rollout = ?", (rollout,))
+                self._conn.execute("INSERT OR REPLACE INTO rollouts (rollout, started_on, completed_on) "
+                                   "VALUES (?, ?, NULL)", (rollout, now))
+                self._conn.commit()
+                return 0
+            items = self._conn.execute("SELECT COUNT(DISTINCT item) FROM steps WHERE rollout = ?",
+                                       (rollout,)).fetchone()[0]
+        logger.info("Resuming rollout {} started on {}, {} items with completed steps".format(
+            rollout, row['started_on'], items))
+        return items
+
+    def complete(self, rollout):
+        with self._lock:
+            self._conn.execute("UPDATE rollouts SET completed_on = ? WHERE rollout = ?",
+                               (datetime.datetime.utcnow().isoformat(), rollout))
+            self._conn.commit()
+
+    def steps(self, rollout, item):
+        """ Completed steps of item, as a dict of step to its data. """
+        with self._lock:
+            rows = self._conn.execute("SELECT step, data FROM steps WHERE rollout = ? AND item = ?",
+                                      (rollout, item)).fetchall()
+        return dict((row['step'], json.loads(row['data']) if row['data'] else {}) for row in rows)
+
+    def record(self, rollout, item, step, data=None):
+        if step not in STEPS:
+            raise ValueError("Unknown journal step {}".format(step))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO steps (rollout, item, step, data, recorded_on) VALUES (?, ?, ?, ?, ?)",
+                (rollout, item, step, json.dumps(data, default=str) if data is not None else None,
+                 datetime.datetime.utcnow().isoformat()))
+            self._conn.commit()
+
+    def entry(self, rollout, item):
+        return JournalEntry(self, rollout, item)
+
+
+class JournalEntry(object):
+    """ The journal of one config or argument set within a rollout. """
+
+    def __init__(self, journal, rollout, item):
+        self.journal = journal
+        self.rollout = rollout
+        self.item = item
+        self.completed = journal.steps(rollout, item)
+
+    def done(self, step):
+        return step in self.completed
+
+    def get(self, step):
+        """ Data recorded with step, None when the step is not completed. """
+        return self.completed.get(step)
+
+    def record(self, step, data=None):
+        self.journal.record(self.rollout, self.item, step, data)
+        self.completed[step] = data or {}
+
+    def part(self, name):
+        """ Journal of one part of the item, e.g. one deploy target of a config. """
+        return JournalEntry(self.journal, self.rollout, '{}@{}'.format(self.item, name))
@@ -0,0 +1,245 @@
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+import glue_spark_deploy
+from glue_aws_clients import get_client
+from glue_inventory_size import split_s3_uri
+from glue_spark_deploy import (build_create_job_request, build_job_spec, diff_job_spec, get_glue_jobs,
+                               list_glue_jobs, load_config, parse_config, parse_targets, zip_script_location)
+from glue_tracing import span
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_RECONCILE_WORKERS = 4
+DEFAULT_CALLS_PER_SECOND = 5.0
+DEFAULT_LOAD_WORKERS = 16
+
+FETCH_MODES = ('batch', 'list')
+
+
+class RateLimiter(object):
+    """ Token bucket shared by threads, allowing calls_per_second calls with bursts of up to burst. """
+
+    def __init__(self, calls_per_second, burst=1):
+        self.rate = float(calls_per_second)
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def config_uris(configs, config_prefix=None):
+    """ Conf files to reconcile: the ones given, plus every .conf under the s3 uri config_prefix. """
+    uris = list(configs)
+    if config_prefix:
+        bucket, prefix = split_s3_uri(config_prefix)
+        paginator = get_client('s3').get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith('.conf'):
+                    uris.append("s3://{}/{}".format(bucket, obj['Key']))
+    return uris
+
+
+def desired_job(conf_file):
+    """ Parse one conf file into its job parameters, default arguments and DPU settings.
+
+    A zipped script is pointed at the location extract_zip uploads it to;
+    extraction itself is left to the deployment that runs the job.
+    """
+    config = load_config(conf_file)
+    glue_params, glue_script_params, glue_dpus = parse_config(config)
+    if parse_targets(config):
+        # the jobs are read and written in the default region and account only
+        raise ValueError("{} deploys to several targets, which reconcile does not support".format(
+            glue_params['glueJobName']))
+    if glue_params['glueScriptLocation'].split('.')[-1] == 'zip':
+        glue_params['glueScriptLocation'] = zip_script_location(
+            glue_params['glueJobName'], glue_params['glueScriptLocation']) + glue_params['glueJobName'] + '.txt'
+    return glue_params, glue_script_params, glue_dpus
+
+
+def load_desired(conf_files, max_workers=DEFAULT_LOAD_WORKERS):
+    """ Load conf files concurrently.
+    Returns:
+        (tuple)
+        dict mapping each job name to (conf file, glue_params, glue_script_params, glue_dpus),
+        and a list of (conf file, error) for the configs that could not be read.
+    """
+    def load(conf_file):
+        try:
+            return conf_file, desired_job(conf_file), None
+        except Exception as e:
+            return conf_file, None, e
+
+    desired = {}
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for conf_file, job, error in executor.map(load, conf_files):
+            if error is not None:
+                errors.append((conf_file, str(error)))
+                continue
+            job_name = job[0]['glueJobName']
+            if job_name in desired:
+                errors.append((conf_file, "job {} is also defined by {}".format(job_name, desired[job_name][0])))
+                continue
+            desired[job_name] = (conf_file,) + job
+    return desired, errors
+
+
+def fetch_current(job_names, fetch='batch'):
+    """ Current definitions of job_names, with batch_get_jobs or by listing every job with get_jobs. """
+    if fetch == 'list':
+        jobs = list_glue_jobs()
+        return dict((name, jobs[name]) for name in job_names if name in jobs)
+    return get_glue_jobs(job_names)
+
+
+def plan_reconcile(desired, current):
+    """ Compare the desired jobs with their current definitions.
+    Returns:
+        (list) one action per job, in name order: JobName, config, action
+        ('create', 'update' or 'unchanged'), the changed fields and the request to send.
+    """
+    actions = []
+    for job_name in sorted(desired):
+        conf_file, glue_params, glue_script_params, glue_dpus = desired[job_name]
+        action = {'JobName': job_name, 'config': conf_file, 'changes': [], 'request': None, 'status': None}
+        if job_name not in current:
+            action['action'] = 'create'
+            action['request'] = build_create_job_request(glue_params, glue_script_params, glue_dpus)
+        else:
+            job_spec = build_job_spec(glue_params, glue_script_params, glue_dpus)
+            action['changes'] = diff_job_spec(job_spec, current[job_name])
+            action['action'] = 'update' if action['changes'] else 'unchanged'
+            if action['changes']:
+                action['request'] = {'JobName': job_name, 'JobUpdate': job_spec}
+        actions.append(action)
+    return actions
+
+
+def apply_actions(actions, max_workers=DEFAULT_RECONCILE_WORKERS, calls_per_second=DEFAULT_CALLS_PER_SECOND):
+    """ Send the creates and updates of actions, at most max_workers at once and calls_per_second overall.
+
+    A failed call, whatever its error, is recorded in the status of its action, the others go on.
+    """
+    limiter = RateLimiter(calls_per_second, burst=max_workers)
+
+    def apply(action):
+        limiter.acquire()
+        try:
+            if action['action'] == 'create':
+                glue_spark_deploy.glue.create_job(**action['request'])
+            else:
+                glue_spark_deploy.glue.update_job(**action['request'])
+            action['status'] = 'DONE'
+            logger.info("{}d glue job {}".format(action['action'].capitalize(), action['JobName']))
+        except ClientError as e:
+            action['status'] = 'ERROR ({})'.format(e.response['Error']['Code'])
+            logger.error("Unable to {} glue job {}: {}".format(action['action'], action['JobName'], e))
+        except Exception as e:
+            # e.g. a ParamValidationError from a bad config value, which must not abort the other actions
+            action['status'] = 'ERROR ({})'.format(type(e).__name__)
+            logger.error("Unable to {} glue job {}: {}".format(action['action'], action['JobName'], e))
+
+    pending = [action for action in actions if action['action'] != 'unchanged']
+    for action in actions:
+        if action['action'] == 'unchanged':
+            action['status'] = 'UNCHANGED'
+    with span('apply_reconcile', changes=len(pending)):
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            list(executor.map(apply, pending))
+    return actions
+
+
+def reconcile(conf_files, fetch='batch', apply=True, max_workers=DEFAULT_RECONCILE_WORKERS,
+              calls_per_second=DEFAULT_CALLS_PER_SECOND):
+    """ Bring the Glue jobs defined by conf_files in line with their configs.
+    Args:
+        conf_files (list): Local paths or s3 uris of conf files.
+        fetch (string): 'batch' reads the jobs with batch_get_jobs, 'list'
+                        lists every job of the account with get_jobs, which
+                        is fewer calls when the configs cover most jobs.
+        apply (boolean): Send the creates and updates, otherwise only plan them.
+    Returns:
+        (tuple) the actions of plan_reconcile and the configs that could not be read.
+    """
+    with span('load_configs', configs=len(conf_files)):
+        desired, errors = load_desired(conf_files)
+    with span('fetch_jobs', jobs=len(desired), fetch=fetch):
+        current = fetch_current(list(desired), fetch=fetch)
+    actions = plan_reconcile(desired, current)
+    if apply:
+        apply_actions(actions, max_workers=max_workers, calls_per_second=calls_per_second)
+    return actions, errors
+
+
+def print_reconcile_summary(actions, errors):
+    for action in actions:
+        print("{:<40} {:<10} {}".format(action['JobName'], action['action'], action['status'] or ''))
+        for field, current, desired in action['changes']:
+            print("    {}: {} -> {}".format(field, current, desired))
+    for conf_file, error in errors:
+        print("{:<40} {:<10} {}".format(conf_file, 'error', error))
+    counts = dict((name, sum(1 for action in actions if action['action'] == name))
+                  for name in ('create', 'update', 'unchanged'))
+    print("{create} to create, {update} to update, {unchanged} unchanged, {errors} unreadable".format(
+        errors=len(errors), **counts))
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcile Glue jobs with their conf files")
+    parser.add_argument('configs', nargs='*', help="local paths or s3 uris of conf files")
+    parser.add_argument('--config_prefix', help="s3 uri of a prefix whose .conf files are reconciled too")
+    parser.add_argument('--fetch', choices=FETCH_MODES, default='batch',
+                        help="read current jobs with batch_get_jobs, or list every job with get_jobs")
+    parser.add_argument('--plan', action='store_true', help="only show the creates and updates")
+    parser.add_argument('--workers', type=int, default=DEFAULT_RECONCILE_WORKERS,
+                        help="creates and updates sent concurrently")
+    parser.add_argument('--calls_per_second', type=float, default=DEFAULT_CALLS_PER_SECOND,
+                        help="upper bound on create_job/update_job calls per second, 0 for none")
+    parser.add_argument('--json', action='store_true', help="print the actions as JSON")
+    args = parser.parse_args(argv)
+    if not args.configs and not args.config_prefix:
+        parser.error("give conf files or --config_prefix")
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    actions, errors = reconcile(config_uris(args.configs, args.config_prefix), fetch=args.fetch,
+                                apply=not args.plan, max_workers=args.workers,
+                                calls_per_second=args.calls_per_second)
+    if args.json:
+        print(json.dumps({'actions': actions, 'errors': errors}, indent=2, default=str))
+    else:
+        print_reconcile_summary(actions, errors)
+    failed = errors or [action for action in actions if (action['status'] or '').startswith('ERROR')]
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import argparse
+import datetime
+import logging
+import math
+import os
+import sqlite3
+import sys
+import threading
+
+from glue_sizing_policy import WORKER_TYPE_DPUS
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Set GLUE_RUN_HISTORY_DB to an empty string to stop recording runs.
+DEFAULT_HISTORY_DB = os.environ.get('GLUE_RUN_HISTORY_DB',
+                                    os.path.join(os.path.expanduser('~'), '.glue_run_history.db'))
+DEFAULT_REGRESSION_FACTOR = 1.5
+
+GB = 1024 * 1024 * 1024
+
+RUN_COLUMNS = ('job_name', 'run_id', 'worker_type', 'number_of_workers', 'input_bytes', 'object_count',
+               'execution_time', 'state', 'started_on', 'completed_on', 'recorded_on')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_runs (
+    job_name TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    worker_type TEXT,
+    number_of_workers INTEGER,
+    input_bytes INTEGER,
+    object_count INTEGER,
+    execution_time INTEGER,
+    state TEXT,
+    started_on TEXT,
+    completed_on TEXT,
+    recorded_on TEXT NOT NULL,
+    PRIMARY KEY (job_name, run_id)
+);
+CREATE INDEX IF NOT EXISTS job_runs_started_on ON job_runs (job_name, started_on);
+"""
+
+
+def _timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def percentile(values, pct):
+    """ Nearest-rank percentile of values, None when values is empty. """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def dpu_hours(run):
+    if not run['execution_time'] or not run['number_of_workers']:
+        return None
+    dpus = run['number_of_workers'] * WORKER_TYPE_DPUS.get(run['worker_type'], 1)
+    return dpus * run['execution_time'] / 3600.0
+
+
+def throughput(run):
+    """ GB of input processed per DPU-hour, None when it cannot be computed. """
+    hours = dpu_hours(run)
+    if not hours or run['input_bytes'] is None:
+        return None
+    return run['input_bytes'] / GB / hours
+
+
+class RunHistory(object):
+    """ Local SQLite store of Glue job runs, safe to share between threads. """
+
+    def __init__(self, path=DEFAULT_HISTORY_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def record_run(self, job_name, run_id, job_run=None, input_bytes=None, object_count=None, state=None):
+        """ Insert or replace one run.
+        Args:
+            job_name (string): Name of the glue job.
+            run_id (string): Id of the run.
+            job_run (dict): JobRun returned by Glue, for worker, timing and state fields.
+            input_bytes (int): Size of the input prefix from get_folder_size.
+            object_count (int): Number of input objects from get_folder_size.
+            state (string): Final state, when job_run is not available.
+        """
+        job_run = job_run or {}
+        row = (
+            job_name,
+            run_id,
+            job_run.get('WorkerType'),
+            job_run.get('NumberOfWorkers'),
+            input_bytes,
+            object_count,
+            job_run.get('ExecutionTime'),
+            job_run.get('JobRunState', state),
+            _timestamp(job_run.get('StartedOn')),
+            _timestamp(job_run.get('CompletedOn')),
+            datetime.datetime.utcnow().isoformat(),
+        )
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO job_runs ({}) VALUES ({})".format(
+                ', '.join(RUN_COLUMNS), ', '.join('?' * len(RUN_COLUMNS))), row)
+            self._conn.commit()
+
+    def runs(self, job_name=None, state=None, limit=None):
+        """ Return recorded runs as dicts, oldest first. """
+        query = "SELECT * FROM job_runs"
+        clauses = []
+        params = []
+        if job_name:
+            clauses.append("job_name = ?")
+            params.append(job_name)
+        if state:
+            clauses.append("state = ?")
+            params.append(state)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY COALESCE(started_on, recorded_on) DESC"
+        if limit:
+            query += " LIMIT {}".format(int(limit))
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def job_names(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT job_name FROM job_runs ORDER BY job_name").fetchall()
+        return [row['job_name'] for row in rows]
+
+    def job_report(self, job_name, regression_factor=DEFAULT_REGRESSION_FACTOR):
+        """ Summarise the successful runs of job_name.
+        Returns:
+            (dict)
+            run counts, p50/p95 execution time, median throughput in GB per
+            DPU-hour, and whether the latest run is a regression, i.e. at least
+            regression_factor times slower than the median of the earlier runs.
+        """
+        all_runs = self.runs(job_name)
+        succeeded = [run for run in all_runs if run['state'] == 'SUCCEEDED' and run['execution_time']]
+        exec_times = [run['execution_time'] for run in succeeded]
+        throughputs = [value for value in (throughput(run) for run in succeeded) if value is not None]
+
+        regression = None
+        if len(succeeded) > 1:
+            baseline = percentile([run['execution_time'] for run in succeeded[:-1]], 50)
+            ratio = succeeded[-1]['execution_time'] / float(baseline)
+            regression = {'run_id': succeeded[-1]['run_id'], 'ratio': ratio,
+                          'regressed': ratio >= regression_factor}
+
+        return {
+            'job_name': job_name,
+            'runs': len(all_runs),
+            'succeeded': len(succeeded),
+            'p50': percentile(exec_times, 50),
+            'p95': percentile(exec_times, 95),
+            'throughput': percentile(throughputs, 50),
+            'regression': regression,
+        }
+
+
+_default_history = None
+_default_history_lock = threading.Lock()
+
+
+def get_run_history():
+    """ Return the process wide RunHistory on DEFAULT_HISTORY_DB, None when recording is disabled. """
+    global _default_history
+    with _default_history_lock:
+        if _default_history is None and DEFAULT_HISTORY_DB:
+            try:
+                _default_history = RunHistory(DEFAULT_HISTORY_DB)
+            except sqlite3.Error as e:
+                logger.warning("Run history disabled, unable to open {}: {}".format(DEFAULT_HISTORY_DB, e))
+                return None
+    return _default_history
+
+
+def print_report(reports):
+    print("{:<40} {:>5} {:>5} {:>8} {:>8} {:>12}  {}".format(
+        "job", "runs", "ok", "p50 s", "p95 s", "GB/DPU-h", "latest vs p50"))
+    for report in reports:
+        regression = report['regression']
+        if regression is None:
+            latest = ''
+        else:
+            latest = "{:.2f}x{}".format(regression['ratio'], " REGRESSION" if regression['regressed'] else "")
+        print("{:<40} {:>5} {:>5} {:>8} {:>8} {:>12}  {}".format(
+            report['job_name'],
+            report['runs'],
+            report['succeeded'],
+            report['p50'] if report['p50'] is not None else '-',
+            report['p95'] if report['p95'] is not None else '-',
+            "{:.2f}".format(report['throughput']) if report['throughput'] is not None else '-',
+            latest))
+
+
+def print_runs(runs):
+    print("{:<40} {:<40} {:<6} {:>7} {:>10} {:>10} {:>8} {:<10} {}".format(
+        "job", "run id", "type", "workers", "GB", "objects", "seconds", "state", "started"))
+    for run in runs:
+        print("{:<40} {:<40} {:<6} {:>7} {:>10} {:>10} {:>8} {:<10} {}".format(
+            run['job_name'],
+            run['run_id'],
+            run['worker_type'] or '',
+            run['number_of_workers'] or '',
+            "{:.2f}".format(run['input_bytes'] / GB) if run['input_bytes'] is not None else '',
+            run['object_count'] if run['object_count'] is not None else '',
+            run['execution_time'] if run['execution_time'] is not None else '',
+            run['state'] or '',
+            run['started_on'] or ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query the local Glue run history')
+    parser.add_argument('command', choices=['report', 'runs', 'regressions'])
+    parser.add_argument('--db', dest="db", default=DEFAULT_HISTORY_DB, help="path of the history database")
+    parser.add_argument('--job', dest="job", help="limit the output to one glue job")
+    parser.add_argument('--limit', dest="limit", type=int, help="number of runs listed by 'runs'")
+    parser.add_argument('--regression_factor', dest="regression_factor", type=float,
+                        default=DEFAULT_REGRESSION_FACTOR,
+                        help="slowdown of the latest run over the p50 of earlier runs flagged as a regression")
+    args = parser.parse_args(argv)
+
+    history = RunHistory(args.db)
+    try:
+        if args.command == 'runs':
+            print_runs(history.runs(args.job, limit=args.limit))
+            return 0
+
+        job_names = [args.job] if args.job else history.job_names()
+        reports = [history.job_report(job_name, args.regression_factor) for job_name in job_names]
+        if args.command == 'regressions':
+            reports = [report for report in reports if report['regression'] and report['regression']['regressed']]
+        print_report(reports)
+        return 1 if args.command == 'regressions' and reports else 0
+    finally:
+        history.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from glue_folder_size import FolderSize, SizeHistogram, get_folder_size, get_folder_size_after, DEFAULT_MAX_WORKERS
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_SIZING_CACHE_DB = os.environ.get('GLUE_SIZING_CACHE_DB',
+                                         os.path.join(os.path.expanduser('~'), '.glue_sizing_cache.db'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prefix_sizes (
+    bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    object_count INTEGER NOT NULL,
+    total_size INTEGER NOT NULL,
+    last_key TEXT,
+    full_scan_on TEXT NOT NULL,
+    updated_on TEXT NOT NULL,
+    histogram TEXT,
+    PRIMARY KEY (bucket, prefix)
+);
+"""
+
+
+class SizingCache(object):
+    """ Local SQLite store of the running totals and watermark of each sized prefix. """
+
+    def __init__(self, path=DEFAULT_SIZING_CACHE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            columns = [row['name'] for row in self._conn.execute("PRAGMA table_info(prefix_sizes)")]
+            if 'histogram' not in columns:
+                # caches written before size histograms were kept
+                self._conn.execute("ALTER TABLE prefix_sizes ADD COLUMN histogram TEXT")
+                self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, bucket, prefix):
+        """ Return the cached row of prefix as a dict, None if it was never sized.
+
+        Its histogram is a SizeHistogram, None when the prefix was sized without one.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM prefix_sizes WHERE bucket = ? AND prefix = ?",
+                                     (bucket, prefix)).fetchone()
+        if not row:
+            return None
+        cached = dict(row)
+        if cached['histogram']:
+            cached['histogram'] = SizeHistogram.from_dict(json.loads(cached['histogram']))
+        return cached
+
+    def put(self, bucket, prefix, folder_size, full_scan_on):
+        now = datetime.datetime.utcnow().isoformat()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO prefix_sizes "
+                "(bucket, prefix, object_count, total_size, last_key, full_scan_on, updated_on, histogram) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (bucket, prefix, folder_size.object_count, folder_size.total_size, folder_size.last_key,
+                 full_scan_on or now, now,
+                 json.dumps(folder_size.histogram.to_dict()) if folder_size.histogram else None))
+            self._conn.commit()
+
+    def forget(self, bucket, prefix):
+        with self._lock:
+            self._conn.execute("DELETE FROM prefix_sizes WHERE bucket = ? AND prefix = ?", (bucket, prefix))
+            self._conn.commit()
+
+
+class IncrementalSizer(object):
+    """ Size append-only prefixes from a persisted watermark.
+
+    The first sizing of a prefix is a full listing, which stores its totals
+    and the greatest key seen. Later sizings only list the keys after that
+    watermark with StartAfter and add them to the stored totals, so their
+    cost follows the new data rather than the whole history. Keys are
+    listed in order, so new date partitions (part=2024-06-02/ after
+    part=2024-06-01/) fall after the watermark. Objects deleted, rewritten
+    or added before the watermark are only seen by a full rescan, which
+    full_rescan forces on every call.
+    """
+
+    def __init__(self, cache, full_rescan=False, full_sizer=None):
+        self.cache = cache
+        self.full_rescan = full_rescan
+        self.full_sizer = full_sizer or get_folder_size
+
+    def __call__(self, bucket, prefix, max_workers=DEFAULT_MAX_WORKERS, s3_client=None):
+        cached = None if self.full_rescan else self.cache.get(bucket, prefix)
+        if cached is None or cached['last_key'] is None:
+            folder_size = self.full_sizer(bucket, prefix, max_workers=max_workers, s3_client=s3_client)
+            logger.info("Full scan of s3://{}/{}: {} objects".format(bucket, prefix, folder_size.object_count))
+            self.cache.put(bucket, prefix, folder_size, None)
+            return folder_size
+
+        new_objects = get_folder_size_after(bucket, prefix, cached['last_key'], s3_client=s3_client)
+        logger.info("Incremental scan of s3://{}/{} after {}: {} new objects".format(
+            bucket, prefix, cached['last_key'], new_objects.object_count))
+        # a histogram cached before histograms were kept would only cover the new objects
+        histogram = cached['histogram'].merge(new_objects.histogram) if cached['histogram'] else None
+        folder_size = FolderSize(cached['object_count'] + new_objects.object_count,
+                                 cached['total_size'] + new_objects.total_size,
+                                 new_objects.last_key or cached['last_key'], histogram)
+        self.cache.put(bucket, prefix, folder_size, cached['full_scan_on'])
+        return folder_size
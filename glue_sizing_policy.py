@@ -0,0 +1,182 @@
+import json
+import logging
+import math
+from collections import namedtuple
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+GB = 1024 * 1024 * 1024
+MB = 1024 * 1024
+
+# DPUs of one worker of each Glue worker type, smallest first.
+WORKER_TYPE_DPUS = {'G.1X': 1, 'G.2X': 2, 'G.4X': 4, 'G.8X': 8}
+WORKER_TYPES = sorted(WORKER_TYPE_DPUS, key=WORKER_TYPE_DPUS.get)
+
+# In-memory expansion of each source format relative to its size on s3.
+DEFAULT_FORMAT_FACTORS = {
+    'parquet': 1.0,
+    'orc': 1.0,
+    'avro': 1.2,
+    'csv': 1.3,
+    'json': 1.5,
+    'gz': 2.0,
+}
+NON_SPLITTABLE_FORMATS = ('gz', 'json')
+
+DEFAULT_TIERS = [
+    {'max_gb': 10, 'WorkerType': 'G.1X', 'NumberOfWorkers': 10},
+    {'max_gb': 100, 'WorkerType': 'G.2X', 'NumberOfWorkers': 10},
+    {'max_gb': 500, 'WorkerType': 'G.2X', 'NumberOfWorkers': 40},
+    {'max_gb': 2000, 'WorkerType': 'G.4X', 'NumberOfWorkers': 40},
+    {'WorkerType': 'G.8X', 'NumberOfWorkers': 60},
+]
+DEFAULT_SMALL_FILE_SIZE = 32 * MB
+DEFAULT_LARGE_OBJECT_SIZE = 1024 * MB
+
+# small files dominate a prefix when they are at least this share of its objects, and this many
+DEFAULT_SMALL_FILE_SHARE = 0.5
+DEFAULT_MIN_SMALL_FILES = 1000
+# bytes Glue reads per task when grouping files
+DEFAULT_GROUP_SIZE = 128 * MB
+DEFAULT_COMPACTION_PREFIXES = 20
+
+SizingInput = namedtuple('SizingInput', ['total_size', 'object_count', 'file_format'])
+
+
+def average_object_size(sizing_input):
+    if not sizing_input.object_count:
+        return 0
+    return sizing_input.total_size / sizing_input.object_count
+
+
+class SizingPolicy(object):
+    """ Turn the measurements of a source prefix into a job-dpu section. """
+
+    def job_dpu(self, sizing_input):
+        """ Return the job-dpu options for sizing_input.
+        Args:
+            sizing_input (SizingInput): Total bytes, object count and file format hint.
+        Returns:
+            (dict)
+            WorkerType and NumberOfWorkers, as strings ready for the config.
+        """
+        raise NotImplementedError
+
+
+class ThresholdPolicy(SizingPolicy):
+    """ The original two-way split: G.1X below threshold GB, G.2X from threshold up. """
+
+    def __init__(self, threshold, g1xworkernodes, g2xworkernodes):
+        self.threshold = threshold
+        self.g1xworkernodes = g1xworkernodes
+        self.g2xworkernodes = g2xworkernodes
+
+    def job_dpu(self, sizing_input):
+        if sizing_input.total_size / GB < self.threshold:
+            return {'WorkerType': 'G.1X', 'NumberOfWorkers': str(self.g1xworkernodes)}
+        return {'WorkerType': 'G.2X', 'NumberOfWorkers': str(self.g2xworkernodes)}
+
+
+class TieredPolicy(SizingPolicy):
+    """ Pick a tier from the input size, then correct it for object size and format.
+
+    The input size is scaled by the format factor of the source format and
+    the first tier whose max_gb covers it is used (the last tier has no
+    bound). Inputs dominated by small files are bound by per-file overhead
+    rather than executor memory, so they keep the tier's worker count on
+    the smallest worker type. Large objects of a format Spark cannot split
+    are read by a single task each, so they get the next bigger worker type.
+    """
+
+    def __init__(self, tiers=None, small_file_size=DEFAULT_SMALL_FILE_SIZE,
+                 large_object_size=DEFAULT_LARGE_OBJECT_SIZE, format_factors=None):
+        self.tiers = tiers or DEFAULT_TIERS
+        for tier in self.tiers:
+            if tier['WorkerType'] not in WORKER_TYPE_DPUS:
+                raise ValueError("Unknown WorkerType {}".format(tier['WorkerType']))
+        self.small_file_size = small_file_size
+        self.large_object_size = large_object_size
+        self.format_factors = dict(DEFAULT_FORMAT_FACTORS)
+        self.format_factors.update(format_factors or {})
+
+    def _tier(self, effective_gb):
+        for tier in self.tiers:
+            if 'max_gb' not in tier or effective_gb <= tier['max_gb']:
+                return tier
+        return self.tiers[-1]
+
+    def job_dpu(self, sizing_input):
+        file_format = (sizing_input.file_format or '').lower()
+        effective_gb = sizing_input.total_size / GB * self.format_factors.get(file_format, 1.0)
+        tier = self._tier(effective_gb)
+        worker_type = tier['WorkerType']
+        workers = int(tier['NumberOfWorkers'])
+
+        avg_size = average_object_size(sizing_input)
+        if sizing_input.object_count and avg_size < self.small_file_size:
+            logger.info("Average object size {:.0f} bytes, sizing for small files".format(avg_size))
+            worker_type = WORKER_TYPES[0]
+        elif avg_size > self.large_object_size and file_format in NON_SPLITTABLE_FORMATS:
+            logger.info("Large {} objects of {:.0f} bytes on average, using a bigger worker".format(
+                file_format, avg_size))
+            worker_type = WORKER_TYPES[min(WORKER_TYPES.index(worker_type) + 1, len(WORKER_TYPES) - 1)]
+
+        logger.info("Effective input {:.2f} GB sized to {} x {}".format(effective_gb, workers, worker_type))
+        return {'WorkerType': worker_type, 'NumberOfWorkers': str(workers)}
+
+
+def load_policy(path):
+    """ Load a TieredPolicy from a json file.
+
+    The file holds 'tiers' (a list of {max_gb, WorkerType, NumberOfWorkers},
+    the last one without max_gb) and optionally 'small_file_size_mb',
+    'large_object_size_mb' and 'format_factors'.
+    """
+    with open(path) as policy_file:
+        policy = json.load(policy_file)
+    return TieredPolicy(
+        tiers=policy.get('tiers'),
+        small_file_size=policy.get('small_file_size_mb', DEFAULT_SMALL_FILE_SIZE // MB) * MB,
+        large_object_size=policy.get('large_object_size_mb', DEFAULT_LARGE_OBJECT_SIZE // MB) * MB,
+        format_factors=policy.get('format_factors'))
+
+
+def grouping_arguments(histogram, min_share=DEFAULT_SMALL_FILE_SHARE, min_small_files=DEFAULT_MIN_SMALL_FILES,
+                       group_size=DEFAULT_GROUP_SIZE):
+    """ Job arguments turning on Glue file grouping when small files dominate the input.
+    Args:
+        histogram (SizeHistogram): Size histogram of the source prefix.
+    Returns:
+        (dict)
+        --groupFiles and --groupSize, empty when grouping is not needed.
+    """
+    if histogram is None or not histogram.object_count:
+        return {}
+    small_count = histogram.small_count
+    share = small_count / float(histogram.object_count)
+    if small_count < min_small_files or share < min_share:
+        return {}
+    logger.info("{} of {} objects are below {} bytes, grouping files by {} bytes".format(
+        small_count, histogram.object_count, histogram.small_file_size, group_size))
+    return {'--groupFiles': 'inPartition', '--groupSize': str(int(group_size))}
+
+
+def compaction_candidates(histogram, group_size=DEFAULT_GROUP_SIZE, limit=DEFAULT_COMPACTION_PREFIXES):
+    """ Directories whose small files are most worth merging, most objects saved first.
+    Returns:
+        (list)
+        dicts of prefix, small_files, small_bytes and files_after, the number
+        of group_size objects the small files would merge into.
+    """
+    if histogram is None:
+        return []
+    candidates = []
+    for prefix, (count, size) in histogram.small_prefixes.items():
+        files_after = max(1, int(math.ceil(size / float(group_size))))
+        if count > files_after:
+            candidates.append({'prefix': prefix, 'small_files': count, 'small_bytes': size,
+                               'files_after': files_after})
+    candidates.sort(key=lambda candidate: (candidate['files_after'] - candidate['small_files'], candidate['prefix']))
+    return candidates[:limit]
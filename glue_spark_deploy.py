@@ -10,55 +10,131 @@ import logging
 import configparser
 import os
 import subprocess
+import tempfile
+import threading
 import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from configparser import NoOptionError, NoSectionError
+from contextlib import contextmanager
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 from botocore.exceptions import ClientError
+from glue_aws_clients import get_client, get_resource
+from glue_job_monitor import JobRunMonitor
+from glue_run_history import get_run_history
+from glue_sizing_policy import GB, WORKER_TYPE_DPUS
+from glue_tracing import bind, current_span, span
 
-glue = boto3.client('glue', region_name='us-east-1')
+DEFAULT_ZIP_WORKERS = 8
+DEFAULT_ZIP_MEMORY_LIMIT = 256 * 1024 * 1024
+ZIP_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+ZIP_EXTRACT_PREFIX = 'glue/tempScript/{}/'
+EXTRACT_MANIFEST_NAME = '.extract_manifest.json'
 
-if len(sys.argv) < 2:
-    logger.info(
-        "Not enough arguments. Try again. Please ensure that conf file is added as argumnet : python3 glue_deploy.py glue_deployment.conf")
-    sys.exit()
+# Seconds given to Glue to settle after a create/update, and before a start.
+DEPLOY_SETTLE_SECONDS = 5
+START_SETTLE_SECONDS = 2
 
-# Arguments passed
-logger.info(f"Name of Python script: {sys.argv[0]}")
-logger.info(f"Name of Conf File: {sys.argv[1]}")
+GLUE_REGION = os.environ.get('GLUE_REGION', 'us-east-1')
 
-# Initialise s3 Resource
-s3 = boto3.resource('s3')
+BATCH_GET_JOBS_SIZE = 100
 
-# Reading Config File
-config = configparser.ConfigParser()
-config.optionxform = str
+JOB_TAGS = {
+    'access-org': 'edo',
+    'access-department': 'dps',
+    'access-team': 'mt'
+}
 
-if sys.argv[1][:2] == 's3':
-    logger.info("Reading Conf file from s3 Path {}".format(sys.argv[1]))
-    s3_uri = sys.argv[1].split("//")[1]
-    bucket = s3_uri.split('/')[0]
-    file_key = '/'.join([str(elem) for elem in s3_uri.split('/')[1:]])
-    local_file = file_key.split('/')[-1]
+
+def refresh_clients():
+    """ Take the glue client and s3 resource from the shared factory.
+    Call again after glue_aws_clients.configure() to pick up the new settings.
+    """
+    global glue, s3
+    glue = get_client('glue', region_name=GLUE_REGION)
+    # Initialise s3 Resource
+    s3 = get_resource('s3')
+
+
+refresh_clients()
+
+# one deployment target of a config: a region, and optionally a role assumed in another account
+Target = namedtuple('Target', ['name', 'region', 'role_arn'])
+
+_target = threading.local()
+
+
+def glue_client():
+    """ The glue client of the target this thread deploys to, the default glue client otherwise. """
+    return getattr(_target, 'glue', None) or glue
+
+
+@contextmanager
+def use_glue_client(client):
+    """ Make the glue calls of this module in the current thread go to client. """
+    previous = getattr(_target, 'glue', None)
+    _target.glue = client
     try:
-        s3.Bucket(bucket).download_file(file_key, local_file)
-        logger.info("Sucessfully Downloaded Conf File to local file {}".format(local_file))
-    except botocore.exceptions.ClientError as e:
-        if e.response['Error']['Code'] == "404":
-            print("The Conf File does not exist.")
-        else:
-            raise
-    config = configparser.ConfigParser()
-    config.optionxform = str
-    config.read(local_file)
-    os.remove(local_file)
-else:
-    config.read(sys.argv[1])
+        yield client
+    finally:
+        _target.glue = previous
+
+
+def target_glue_client(target):
+    return get_client('glue', region_name=target.region, role_arn=target.role_arn)
 
-logger.info(f" config.sections {config.sections()}")
+
+def result_target(result):
+    """ Target of a per-target result of deploy_to_targets. """
+    return Target(result['target'], result['region'], result['role_arn'])
+
+
+def get_glue_job(job_name):
+    """ Fetch the current definition of Glue Job job_name.
+    Args:
+        job_name (string): Name of glue job to fetch.
+    Returns:
+        (dict)
+        Job section of the get_job response, None if the job does not exist.
+    """
+    try:
+        return glue_client().get_job(JobName=job_name)['Job']
+    except glue_client().exceptions.EntityNotFoundException:
+        return None
+
+
+def get_glue_jobs(job_names):
+    """ Fetch the current definitions of many Glue jobs with batch_get_jobs.
+    Args:
+        job_names (list): Names of the glue jobs to fetch.
+    Returns:
+        (dict)
+        mapping each existing job name to its Job, missing jobs are left out.
+    """
+    job_names = sorted(set(job_names))
+    jobs = {}
+    for index in range(0, len(job_names), BATCH_GET_JOBS_SIZE):
+        response = glue_client().batch_get_jobs(JobNames=job_names[index:index + BATCH_GET_JOBS_SIZE])
+        for job in response.get('Jobs', []):
+            jobs[job['Name']] = job
+    return jobs
+
+
+def list_glue_jobs():
+    """ Fetch the definition of every Glue job of the account with paginated get_jobs.
+    Returns:
+        (dict) mapping each job name to its Job.
+    """
+    jobs = {}
+    paginator = glue_client().get_paginator('get_jobs')
+    for page in paginator.paginate():
+        for job in page['Jobs']:
+            jobs[job['Name']] = job
+    return jobs
 
 
 def check_glue_job_exists(job_name):
@@ -70,11 +146,7 @@ def check_glue_job_exists(job_name):
         True if job already exists.
         False otherwise.
     """
-    try:
-        glue.get_job(JobName=job_name)
-        return True
-    except glue.exceptions.EntityNotFoundException:
-        False
+    return get_glue_job(job_name) is not None
 
 
 def create_glue_job(job_params, opt_params, glue_dpus):
@@ -94,153 +166,97 @@ def create_glue_job(job_params, opt_params, glue_dpus):
     """
     if job_params['runtime-type'] == 'glueetl':
         logger.info("Creating Glue Spark ETL Job")
-        if 'connection' in job_params:
-            logger.info("Creating Glue Job with Connection")
-            if 'WorkerType' in glue_dpus:
-                logger.info("Creating Glue Job with WorkerType as {}".format(glue_dpus['WorkerType']))
-                response = glue.create_job(
-                    Name=job_params['glueJobName'],
-                    Role=job_params['glueExecutionRole'],
-                    ExecutionProperty={
-                        'MaxConcurrentRuns': int(job_params['concurrency'])
-                    },
-                    Command={
-                        'Name': job_params['runtime-type'],
-                        'ScriptLocation': job_params['glueScriptLocation'],
-                        'PythonVersion': '3'
-                    },
-                    DefaultArguments=opt_params,
-                    GlueVersion='2.0',
-                    WorkerType=glue_dpus['WorkerType'],
-                    NumberOfWorkers=int(glue_dpus['NumberOfWorkers']),
-                    Tags={
-                        'access-org': 'edo',
-                        'access-department': 'dps',
-                        'access-team': 'mt'
-                    },
-                    Connections={'Connections': [job_params['connection']]}
-                )
-            else:
-                logger.info(
-                    "Creating Glue Job with Standard Worker type & MaxCapacity as {}".format(glue_dpus['MaxCapacity']))
-                response = glue.create_job(
-                    Name=job_params['glueJobName'],
-                    Role=job_params['glueExecutionRole'],
-                    ExecutionProperty={
-                        'MaxConcurrentRuns': int(job_params['concurrency'])
-                    },
-                    Command={
-                        'Name': job_params['runtime-type'],
-                        'ScriptLocation': job_params['glueScriptLocation'],
-                        'PythonVersion': '3'
-                    },
-                    DefaultArguments=opt_params,
-                    GlueVersion='2.0',
-                    MaxCapacity=glue_dpus['MaxCapacity'],
-                    Tags={
-                        'access-org': 'edo',
-                        'access-department': 'dps',
-                        'access-team': 'mt'
-                    },
-                    Connections={'Connections': [job_params['connection']]}
-                )
-            logger.info("Job Creation Started {}".format(response))
+        if 'WorkerType' in glue_dpus:
+            logger.info("Creating Glue Job with WorkerType as {}".format(glue_dpus['WorkerType']))
         else:
-            if 'WorkerType' in glue_dpus:
-                logger.info("Creating Glue Job with WorkerType as {}".format(glue_dpus['WorkerType']))
-                response = glue.create_job(
-                    Name=job_params['glueJobName'],
-                    Role=job_params['glueExecutionRole'],
-                    ExecutionProperty={
-                        'MaxConcurrentRuns': int(job_params['concurrency'])
-                    },
-                    Command={
-                        'Name': job_params['runtime-type'],
-                        'ScriptLocation': job_params['glueScriptLocation'],
-                        'PythonVersion': '3'
-                    },
-                    DefaultArguments=opt_params,
-                    GlueVersion='2.0',
-                    WorkerType=glue_dpus['WorkerType'],
-                    NumberOfWorkers=int(glue_dpus['NumberOfWorkers']),
-                    Tags={
-                        'access-org': 'edo',
-                        'access-department': 'dps',
-                        'access-team': 'mt'
-                    })
-            else:
-                logger.info(
-                    "Creating Glue Job with Standard Worker type & MaxCapacity as {}".format(glue_dpus['MaxCapacity']))
-
-                response = glue.create_job(
-                    Name=job_params['glueJobName'],
-                    Role=job_params['glueExecutionRole'],
-                    ExecutionProperty={
-                        'MaxConcurrentRuns': int(job_params['concurrency'])
-                    },
-                    Command={
-                        'Name': job_params['runtime-type'],
-                        'ScriptLocation': job_params['glueScriptLocation'],
-                        'PythonVersion': '3'
-                    },
-                    DefaultArguments=opt_params,
-                    GlueVersion='2.0',
-                    MaxCapacity=glue_dpus['MaxCapacity'],
-                    Tags={
-                        'access-org': 'edo',
-                        'access-department': 'dps',
-                        'access-team': 'mt'
-                    }
-                )
-            logger.info("Job Creation Started {}".format(response))
-
+            logger.info(
+                "Creating Glue Job with Standard Worker type & MaxCapacity as {}".format(glue_dpus['MaxCapacity']))
     elif job_params['runtime-type'] == 'pythonshell':
         logger.info("Creating Glue PythonShell Job")
-        if 'connection' in job_params:
-            logger.info("Creating Glue Job with Connection")
-            response = glue.create_job(
-                Name=job_params['glueJobName'],
-                Role=job_params['glueExecutionRole'],
-                ExecutionProperty={
-                    'MaxConcurrentRuns': int(job_params['concurrency'])
-                },
-                Command={
-                    'Name': 'pythonshell',
-                    'ScriptLocation': job_params['glueScriptLocation'],
-                    'PythonVersion': '3'
-                },
-                DefaultArguments=opt_params,
-                GlueVersion='1.0',
-                MaxCapacity=1,
-                Tags={
-                    'access-org': 'edo',
-                    'access-department': 'dps',
-                    'access-team': 'mt'
-                },
-                Connections={'Connections': [job_params['connection']]}
-            )
+    else:
+        return
+    if 'connection' in job_params:
+        logger.info("Creating Glue Job with Connection")
+
+    response = glue_client().create_job(**build_create_job_request(job_params, opt_params, glue_dpus))
+    logger.info("Job Creation Started {}".format(response))
+
+
+def build_job_spec(job_params, opt_params, glue_dpus):
+    """ Build the JobUpdate definition for the input configuration.
+    Args:
+        job_params (dict): job-paramters section of the conf file.
+        opt_params (dict): Default arguments of the job.
+        glue_dpus (dict): job-dpu section of the conf file.
+    Returns:
+        (dict)
+        JobUpdate as accepted by update_job.
+    """
+    if job_params['runtime-type'] == 'pythonshell':
+        job_spec = {
+            'Role': job_params['glueExecutionRole'],
+            'ExecutionProperty': {
+                'MaxConcurrentRuns': int(job_params['concurrency'])
+            },
+            'Command': {
+                'Name': 'pythonshell',
+                'ScriptLocation': job_params['glueScriptLocation'],
+                'PythonVersion': '3'
+            },
+            'DefaultArguments': opt_params,
+            'GlueVersion': '1.0',
+            'MaxCapacity': 1,
+        }
+    else:
+        job_spec = {
+            'Role': job_params['glueExecutionRole'],
+            'ExecutionProperty': {
+                'MaxConcurrentRuns': int(job_params['concurrency'])
+            },
+            'Command': {
+                'Name': job_params['runtime-type'],
+                'ScriptLocation': job_params['glueScriptLocation'],
+                'PythonVersion': '3'
+            },
+            'DefaultArguments': opt_params,
+            'GlueVersion': '2.0',
+        }
+        if 'WorkerType' in glue_dpus:
+            job_spec['WorkerType'] = glue_dpus['WorkerType']
+            job_spec['NumberOfWorkers'] = int(glue_dpus['NumberOfWorkers'])
         else:
-            response = glue.create_job(
-                Name=job_params['glueJobName'],
-                Role=job_params['glueExecutionRole'],
-                ExecutionProperty={
-                    'MaxConcurrentRuns': int(job_params['concurrency'])
-                },
-                Command={
-                    'Name': 'pythonshell',
-                    'ScriptLocation': job_params['glueScriptLocation'],
-                    'PythonVersion': '3'
-                },
-                DefaultArguments=opt_params,
-                GlueVersion='1.0',
-                MaxCapacity=1,
-                Tags={
-                    'access-org': 'edo',
-                    'access-department': 'dps',
-                    'access-team': 'mt'
-                }
-            )
-        logger.info("Job Creation Started {}".format(response))
+            job_spec['MaxCapacity'] = glue_dpus['MaxCapacity']
+
+    if 'connection' in job_params:
+        job_spec['Connections'] = {'Connections': [job_params['connection']]}
+    return job_spec
+
+
+def build_create_job_request(job_params, opt_params, glue_dpus):
+    """ Build the create_job arguments for the input configuration.
+    Returns:
+        (dict)
+        The JobUpdate of build_job_spec with the job Name and Tags.
+    """
+    request = {'Name': job_params['glueJobName']}
+    request.update(build_job_spec(job_params, opt_params, glue_dpus))
+    request['Tags'] = dict(JOB_TAGS)
+    return request
+
+
+def config_dpus(job_params, glue_dpus):
+    """ Number of DPUs a run of the configured job holds.
+    Args:
+        job_params (dict): job-paramters section of the conf file.
+        glue_dpus (dict): job-dpu section of the conf file.
+    Returns:
+        (float)
+    """
+    if job_params.get('runtime-type') == 'pythonshell':
+        return 1.0
+    if 'WorkerType' in glue_dpus:
+        return float(WORKER_TYPE_DPUS.get(glue_dpus['WorkerType'], 1) * int(glue_dpus['NumberOfWorkers']))
+    return float(glue_dpus.get('MaxCapacity', 0))
 
 
 def update_glue_job(job_params, opt_params, glue_dpus):
@@ -259,147 +275,101 @@ def update_glue_job(job_params, opt_params, glue_dpus):
     """
     if job_params['runtime-type'] == 'glueetl':
         logger.info("Updating Glue Spark ETL Job")
-        if 'connection' in job_params:
-            logger.info("Updating Glue Job with Connection")
-            if 'WorkerType' in glue_dpus:
-                logger.info("Updating Glue Job with WorkerType as {}".format(glue_dpus['WorkerType']))
-                response = glue.update_job(
-                    JobName=job_params['glueJobName'],
-                    JobUpdate={
-                        'Role': job_params['glueExecutionRole'],
-                        'ExecutionProperty': {
-                            'MaxConcurrentRuns': int(job_params['concurrency'])
-                        },
-                        'Command': {
-                            'Name': job_params['runtime-type'],
-                            'ScriptLocation': job_params['glueScriptLocation'],
-                            'PythonVersion': '3'
-                        },
-                        'DefaultArguments': opt_params,
-                        'GlueVersion': '2.0',
-                        'WorkerType': glue_dpus['WorkerType'],
-                        'NumberOfWorkers': int(glue_dpus['NumberOfWorkers']),
-                        'Connections': {'Connections': [job_params['connection']]}
-                    }
-                )
-            else:
-                logger.info(
-                    "Updating Glue Job with Standard Worker type & MaxCapacity as {}".format(glue_dpus['MaxCapacity']))
-                response = glue.update_job(
-                    JobName=job_params['glueJobName'],
-                    JobUpdate={
-                        'Role': job_params['glueExecutionRole'],
-                        'ExecutionProperty': {
-                            'MaxConcurrentRuns': int(job_params['concurrency'])
-                        },
-                        'Command': {
-                            'Name': job_params['runtime-type'],
-                            'ScriptLocation': job_params['glueScriptLocation'],
-                            'PythonVersion': '3'
-                        },
-                        'DefaultArguments': opt_params,
-                        'GlueVersion': '2.0',
-                        'MaxCapacity': glue_dpus['MaxCapacity'],
-                        'Connections': {'Connections': [job_params['connection']]}
-                    }
-                )
-            logger.info("Job Updation Started {}".format(response))
+        if 'WorkerType' in glue_dpus:
+            logger.info("Updating Glue Job with WorkerType as {}".format(glue_dpus['WorkerType']))
         else:
-            if 'WorkerType' in glue_dpus:
-                logger.info("Updating Glue Job with WorkerType as {}".format(glue_dpus['WorkerType']))
-                response = glue.update_job(
-                    JobName=job_params['glueJobName'],
-                    JobUpdate={
-                        'Role': job_params['glueExecutionRole'],
-                        'ExecutionProperty': {
-                            'MaxConcurrentRuns': int(job_params['concurrency'])
-                        },
-                        'Command': {
-                            'Name': job_params['runtime-type'],
-                            'ScriptLocation': job_params['glueScriptLocation'],
-                            'PythonVersion': '3'
-                        },
-                        'DefaultArguments': opt_params,
-                        'GlueVersion': '2.0',
-                        'WorkerType': glue_dpus['WorkerType'],
-                        'NumberOfWorkers': int(glue_dpus['NumberOfWorkers'])
-                    }
-                )
-            else:
-                logger.info(
-                    "Updating Glue Job with Standard Worker type & MaxCapacity as {}".format(glue_dpus['MaxCapacity']))
-                response = glue.update_job(
-                    JobName=job_params['glueJobName'],
-                    JobUpdate={
-                        'Role': job_params['glueExecutionRole'],
-                        'ExecutionProperty': {
-                            'MaxConcurrentRuns': int(job_params['concurrency'])
-                        },
-                        'Command': {
-                            'Name': job_params['runtime-type'],
-                            'ScriptLocation': job_params['glueScriptLocation'],
-                            'PythonVersion': '3'
-                        },
-                        'DefaultArguments': opt_params,
-                        'GlueVersion': '2.0',
-                        'MaxCapacity': glue_dpus['MaxCapacity']}
-                )
-            logger.info("Job Updation Started {}".format(response))
+            logger.info(
+                "Updating Glue Job with Standard Worker type & MaxCapacity as {}".format(glue_dpus['MaxCapacity']))
     elif job_params['runtime-type'] == 'pythonshell':
         logger.info("Updating Glue PythonShell Job")
-        if 'connection' in job_params:
-            logger.info("Updating Glue Job with Connection")
-            glue.update_job(
-                JobName=job_params['glueJobName'],
-                JobUpdate={
-                    'Role': job_params['glueExecutionRole'],
-                    'ExecutionProperty': {
-                        'MaxConcurrentRuns': int(job_params['concurrency'])
-                    },
-                    'Command': {
-                        'Name': 'pythonshell',
-                        'ScriptLocation': job_params['glueScriptLocation'],
-                        'PythonVersion': '3'
-                    },
-                    'DefaultArguments': opt_params,
-                    'GlueVersion': '1.0',
-                    'MaxCapacity': 1,
-                    'Connections': {'Connections': [job_params['connection']]}
-                }
-            )
-        else:
-            glue.update_job(
-                JobName=job_params['glueJobName'],
-                JobUpdate={
-                    'Role': job_params['glueExecutionRole'],
-                    'ExecutionProperty': {
-                        'MaxConcurrentRuns': int(job_params['concurrency'])
-                    },
-                    'Command': {
-                        'Name': 'pythonshell',
-                        'ScriptLocation': job_params['glueScriptLocation'],
-                        'PythonVersion': '3'
-                    },
-                    'DefaultArguments': opt_params,
-                    'GlueVersion': '1.0',
-                    'MaxCapacity': 1,
-                }
-            )
+    else:
+        return
+    if 'connection' in job_params:
+        logger.info("Updating Glue Job with Connection")
+
+    response = glue_client().update_job(
+        JobName=job_params['glueJobName'],
+        JobUpdate=build_job_spec(job_params, opt_params, glue_dpus)
+    )
+    logger.info("Job Updation Started {}".format(response))
+
+
+# Fields that update_job resets when they are left out of JobUpdate.
+RESETTABLE_JOB_FIELDS = ('WorkerType', 'NumberOfWorkers', 'Connections')
+
+
+def _same_value(current, desired):
+    if current == desired:
+        return True
+    if isinstance(current, (int, float)) or isinstance(desired, (int, float)):
+        try:
+            return float(current) == float(desired)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _diff_values(field, current, desired, changes):
+    if isinstance(current, dict) and isinstance(desired, dict):
+        for key in sorted(set(current) | set(desired)):
+            _diff_values("{}.{}".format(field, key), current.get(key), desired.get(key), changes)
+    elif not _same_value(current, desired):
+        changes.append((field, current, desired))
+
+
+def diff_job_spec(desired, current):
+    """ Compare a desired JobUpdate with the Job returned by get_job.
+    Args:
+        desired (dict): JobUpdate built by build_job_spec.
+        current (dict): Job section of the get_job response.
+    Returns:
+        (list)
+        (field, current value, desired value) for every differing field,
+        empty when the job is already up to date.
+    """
+    changes = []
+    fields = set(desired) | set(field for field in RESETTABLE_JOB_FIELDS if field in current)
+    for field in sorted(fields):
+        _diff_values(field, current.get(field), desired.get(field), changes)
+    return changes
+
+
+def settle(seconds):
+    """ Give Glue time to settle, as its own span so the fixed waits show in traces. """
+    with span('settle', seconds=seconds):
+        time.sleep(seconds)
 
 
 def glue_job_deployment(glue_parameters, glue_script_params, glue_dpus):
+    """ Create the Glue job, or update it when its definition differs from the config.
+    Returns:
+        (boolean)
+        True if the job was created or updated.
+        False if it was already up to date.
+    """
     job_name = glue_parameters['glueJobName']
+    current_job = get_glue_job(job_name)
 
-    if check_glue_job_exists(job_name):
+    if current_job:
+        changes = diff_job_spec(build_job_spec(glue_parameters, glue_script_params, glue_dpus), current_job)
+        if not changes:
+            logger.info("Glue job {} is up to date, skipping update".format(job_name))
+            current_span().set(action='unchanged')
+            return False
+        for field, current, desired in changes:
+            logger.info("Glue job {} field {} changed: {} -> {}".format(job_name, field, current, desired))
         logger.info("Updating glue job: {}".format(job_name))
+        current_span().set(action='update', changed_fields=len(changes))
         update_glue_job(glue_parameters, glue_script_params, glue_dpus)
-        time.sleep(5)
+        settle(DEPLOY_SETTLE_SECONDS)
     else:
         logger.info("Creating glue job: {}".format(job_name))
+        current_span().set(action='create')
         create_glue_job(glue_parameters, glue_script_params, glue_dpus)
-        time.sleep(5)
+        settle(DEPLOY_SETTLE_SECONDS)
 
     logger.info("Finished deploying Glue job.")
+    return True
 
 
 def glue_job_status(job_name, run_id):
@@ -413,14 +383,9 @@ def glue_job_status(job_name, run_id):
     Return:
         string
     '''
-    client = boto3.client('glue')
-
-    response = client.get_job_run(
-        JobName=job_name,
-        RunId=run_id)
-
+    status = None
     try:
-        response = client.get_job_run(JobName=job_name, RunId=run_id)
+        response = glue_client().get_job_run(JobName=job_name, RunId=run_id)
         status = response['JobRun']['JobRunState']
         logger.info(status)
     except ClientError as err:
@@ -449,14 +414,9 @@ def glue_job_exec_time(job_name, run_id):
     Return:
         str
     '''
-    client = boto3.client('glue')
-
-    response = client.get_job_run(
-        JobName=job_name,
-        RunId=run_id)
-
+    exec_time = None
     try:
-        response = client.get_job_run(JobName=job_name, RunId=run_id)
+        response = glue_client().get_job_run(JobName=job_name, RunId=run_id)
         exec_time = response['JobRun']['ExecutionTime']
         logger.info(exec_time)
     except ClientError as err:
@@ -474,116 +434,915 @@ def glue_job_exec_time(job_name, run_id):
     return exec_time
 
 
-def extract_zip(job_name, script_location, env):
-    import boto3
-    import zipfile
-    from io import BytesIO
-    s3 = boto3.client('s3', use_ssl=False)
-    Key_unzip = 'glue/tempScript/{}/'.format(job_name)
+def read_extract_manifest(s3_client, bucket, extract_prefix):
+    """ Read the manifest extract_zip leaves next to the extracted members.
+    Returns:
+        (dict)
+        archive, etag and the crc and size of each member, None if there is no manifest.
+    """
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=extract_prefix + EXTRACT_MANIFEST_NAME)['Body'].read()
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    try:
+        return json.loads(body)
+    except ValueError:
+        logger.warning("Ignoring unreadable extraction manifest under {}".format(extract_prefix))
+        return None
 
+
+def locate_zip(s3_client, script_location):
+    """ Bucket, key, ETag and size of the archive at script_location, found with one listing. """
     s3_uri = script_location.split("//")[1]
     bucket = s3_uri.split('/')[0]
     prefix = '/'.join([str(elem) for elem in s3_uri.split('/')[1:]])
 
-    zipped_keys = s3.list_objects_v2(Bucket=bucket, Prefix=prefix, Delimiter="/")
-    file_list = []
-    for key in zipped_keys['Contents']:
-        file_list.append(key['Key'])
+    zipped_keys = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix, Delimiter="/")
+    archive = zipped_keys['Contents'][0]
+    return bucket, archive['Key'], archive['ETag'], archive['Size']
+
+
+class _RangedObject(object):
+    """ Read-only seekable file over an s3 object, every read is one ranged get_object. """
+
+    def __init__(self, s3_client, bucket, key, size):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self.position
+        elif whence == 2:
+            offset += self.size
+        self.position = offset
+        return offset
+
+    def read(self, size=-1):
+        end = self.size if size is None or size < 0 else min(self.size, self.position + size)
+        if end <= self.position:
+            return b''
+        body = self.s3_client.get_object(Bucket=self.bucket, Key=self.key,
+                                         Range='bytes={}-{}'.format(self.position, end - 1))['Body'].read()
+        self.position += len(body)
+        return body
+
+
+def zip_members(s3_client, bucket, key, size):
+    """ CRC-32 and size of every member of the zip archive at key, read from its central directory.
+
+    Only the end of the archive is fetched, with a few ranged reads, not the members themselves.
+    """
+    import zipfile
+    with zipfile.ZipFile(_RangedObject(s3_client, bucket, key, size)) as z:
+        return dict((info.filename, {'crc': info.CRC, 'size': info.file_size}) for info in z.infolist())
+
+
+def transfer_calls(size, upload, chunk_size=ZIP_MULTIPART_CHUNKSIZE):
+    """ s3 calls s3transfer makes to move size bytes with the multipart threshold and part size of extract_zip. """
+    parts = -(-size // chunk_size)
+    if upload:
+        if size < chunk_size:
+            return {'s3:put_object': 1}
+        return {'s3:create_multipart_upload': 1, 's3:upload_part': parts, 's3:complete_multipart_upload': 1}
+    # a download heads the object first, then gets it whole or in ranged parts
+    return {'s3:head_object': 1, 's3:get_object': 1 if size < chunk_size else parts}
+
+
+def changed_members(members, extracted):
+    """ Members to upload and extracted members to delete, comparing CRC and size with the manifest.
+    Returns:
+        (tuple) lists of the changed and of the removed member names.
+    """
+    changed = [filename for filename, member in members.items() if extracted.get(filename) != member]
+    removed = [filename for filename in extracted if filename not in members]
+    return changed, removed
+
+
+def extract_zip(job_name, script_location, env, max_workers=DEFAULT_ZIP_WORKERS,
+                memory_limit=DEFAULT_ZIP_MEMORY_LIMIT):
+    """ Extract a zipped script bundle to glue/tempScript/<job_name>/.
+
+    Extraction is keyed by the ETag of the archive: a manifest next to the
+    extracted members records the ETag and the CRC-32 and size of every
+    member. When the archive did not change nothing is downloaded or
+    uploaded. When it did, only the members whose CRC or size differ from
+    the manifest are uploaded, members no longer in the archive are
+    deleted, and the manifest is written last.
+
+    The archive is spooled to a temporary file on disk with a ranged,
+    concurrent download instead of being held in memory. Members are
+    uploaded concurrently, large ones as multipart uploads. Each upload
+    buffers at most max_concurrency chunks, so the number of upload workers
+    and the per-upload concurrency are derived from memory_limit.
+
+    Args:
+        job_name (string): Name of the glue job.
+        script_location (string): s3 uri of the zip file.
+        env (string): Environment suffix of the destination bucket.
+        max_workers (int): Maximum number of members uploaded concurrently.
+        memory_limit (int): Upper bound in bytes of the upload buffers.
+    Returns:
+        (string)
+        s3 uri of the extraction prefix.
+    """
+    import threading
+    import zipfile
+    from boto3.s3.transfer import TransferConfig
+    from concurrent.futures import ThreadPoolExecutor
+    s3_client = get_client('s3')
+    Key_unzip = ZIP_EXTRACT_PREFIX.format(job_name)
+    dest_bucket = 'cv-marketing-{}'.format(env)
+
+    bucket, archive_key, archive_etag = locate_zip(s3_client, script_location)[:3]
+    manifest = read_extract_manifest(s3_client, dest_bucket, Key_unzip)
+    if manifest is not None and manifest.get('etag') == archive_etag:
+        logger.info("s3://{}/{} is unchanged since its last extraction, skipping it".format(bucket, archive_key))
+        current_span().set(cached=True, uploaded_members=0)
+        return zip_script_location(job_name, script_location)
+    extracted = (manifest or {}).get('members', {})
 
     # This will give you list of files in the folder you mentioned as prefix
-    s3_resource = boto3.resource('s3')
-
-    # Now create zip object one by one, this below is for 1st file in file_list
-    zip_obj = s3_resource.Object(bucket_name=bucket, key=file_list[0])
-    print(zip_obj)
-    buffer = BytesIO(zip_obj.get()["Body"].read())
-
-    z = zipfile.ZipFile(buffer)
-    for filename in z.namelist():
-        file_info = z.getinfo(filename)
-        s3_resource.meta.client.upload_fileobj(
-            z.open(filename),
-            Bucket='cv-marketing-{}'.format(env),
-            Key=Key_unzip + f'{filename}')
+    s3_resource = get_resource('s3')
+
+    chunk_size = ZIP_MULTIPART_CHUNKSIZE
+    workers = max(1, min(int(max_workers), memory_limit // chunk_size))
+    transfer_config = TransferConfig(multipart_threshold=chunk_size, multipart_chunksize=chunk_size,
+                                     max_concurrency=max(1, memory_limit // (workers * chunk_size)))
+
+    with tempfile.NamedTemporaryFile(suffix='.zip') as archive:
+        # Now download the archive to disk
+        logger.info("Downloading s3://{}/{} to {}".format(bucket, archive_key, archive.name))
+        s3_resource.meta.client.download_fileobj(bucket, archive_key, archive, Config=transfer_config)
+        archive.flush()
+
+        with zipfile.ZipFile(archive.name) as z:
+            members = dict((info.filename, {'crc': info.CRC, 'size': info.file_size}) for info in z.infolist())
+        changed, removed = changed_members(members, extracted)
+        # s3transfer moves the bytes on its own threads, so they are counted here
+        current_span().set(cached=False, archive_bytes=os.path.getsize(archive.name), members=len(members),
+                           uploaded_members=len(changed),
+                           uploaded_bytes=sum(members[filename]['size'] for filename in changed))
+
+        # every worker thread reads the archive through its own ZipFile handle
+        local = threading.local()
+        zip_handles = []
+
+        def upload_member(filename):
+            if not hasattr(local, 'zip_file'):
+                local.zip_file = zipfile.ZipFile(archive.name)
+                zip_handles.append(local.zip_file)
+            with local.zip_file.open(filename) as member:
+                s3_resource.meta.client.upload_fileobj(
+                    member,
+                    Bucket=dest_bucket,
+                    Key=Key_unzip + f'{filename}',
+                    Config=transfer_config)
+
+        logger.info("Uploading {} of {} members with {} workers".format(len(changed), len(members), workers))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(upload_member, changed))
+        for zip_handle in zip_handles:
+            zip_handle.close()
+
+    for index in range(0, len(removed), 1000):
+        s3_client.delete_objects(Bucket=dest_bucket, Delete={
+            'Objects': [{'Key': Key_unzip + filename} for filename in removed[index:index + 1000]]})
+    s3_client.put_object(Bucket=dest_bucket, Key=Key_unzip + EXTRACT_MANIFEST_NAME,
+                         Body=json.dumps({'archive': 's3://{}/{}'.format(bucket, archive_key),
+                                          'etag': archive_etag, 'members': members}).encode('utf-8'))
     # return "s3://"+'cv-marketing-{}'.format(env)+"/"+Key_unzip
-    return "s3://" + bucket + "/" + Key_unzip
+    return zip_script_location(job_name, script_location)
 
 
-def start_execution(glue_parameters, glue_opt_params, glue_dpus):
-    logger.info("Starting Glue Job Deployemnet")
+def zip_script_location(job_name, script_location):
+    """ s3 uri of the script a zipped bundle is run from once extracted by extract_zip. """
+    bucket = script_location.split("//")[1].split('/')[0]
+    return "s3://" + bucket + "/" + ZIP_EXTRACT_PREFIX.format(job_name)
+
 
+def prepare_script(glue_parameters):
+    """ Extract a zipped script, pointing glueScriptLocation of glue_parameters at the extracted script. """
     logger.info("Check if the script points to a zip file")
     job_name = glue_parameters['glueJobName']
     isScriptZip = glue_parameters["glueScriptLocation"].split('.')[-1] == 'zip'
     if isScriptZip:
-        glue_parameters["glueScriptLocation"] = extract_zip(job_name, glue_parameters["glueScriptLocation"],
-                                                            glue_parameters['environment']) + job_name + '.txt'
+        zip_workers = int(glue_parameters.get('zipUploadWorkers', DEFAULT_ZIP_WORKERS))
+        zip_memory_limit = int(glue_parameters.get('zipMemoryLimitMB', DEFAULT_ZIP_MEMORY_LIMIT // 1024 // 1024))
+        with span('extract_zip', job_name=job_name, source=glue_parameters["glueScriptLocation"]):
+            glue_parameters["glueScriptLocation"] = extract_zip(job_name, glue_parameters["glueScriptLocation"],
+                                                                glue_parameters['environment'],
+                                                                max_workers=zip_workers,
+                                                                memory_limit=zip_memory_limit * 1024 * 1024) + job_name + '.txt'
         logger.info("Glue ZIP extracted at {}".format(glue_parameters["glueScriptLocation"]))
     else:
         logger.info("Script location is not zip file ")
 
-    glue_job_deployment(glue_parameters, glue_opt_params, glue_dpus)
 
-    time.sleep(2)
+def prepare_job(glue_parameters, glue_opt_params, glue_dpus):
+    """ Extract a zipped script and create or update the job, so it is ready for start_job_run.
+
+    glueScriptLocation of glue_parameters is pointed at the extracted script.
+    """
+    logger.info("Starting Glue Job Deployemnet")
+    prepare_script(glue_parameters)
+    deploy_job(glue_parameters, glue_opt_params, glue_dpus)
+
 
-    start_job = glue.start_job_run(
-        JobName=job_name,
-        Arguments=glue_opt_params)
+def deploy_job(glue_parameters, glue_opt_params, glue_dpus):
+    """ Create or update the job with a script already in place, settling before its start. """
+    job_name = glue_parameters['glueJobName']
+    with span('glue_job_deployment', job_name=job_name):
+        deployed = glue_job_deployment(glue_parameters, glue_opt_params, glue_dpus)
+    if deployed:
+        settle(START_SETTLE_SECONDS)
 
-    run_id = start_job["JobRunId"]
 
-    t = 0
-    status = "RUNNING"
+def find_started_run(job_name, since, arguments=None):
+    """ Id of a run of job_name started at or after the epoch seconds since, with arguments if given.
+
+    Used on resume to find a run whose start_job_run was sent but whose
+    run id was never recorded. None when there is no such run.
+    """
+    paginator = glue_client().get_paginator('get_job_runs')
+    page = next(iter(paginator.paginate(JobName=job_name, PaginationConfig={'PageSize': 25, 'MaxItems': 25})), {})
+    for job_run in page.get('JobRuns', []):
+        started_on = job_run.get('StartedOn')
+        if started_on is None or started_on.timestamp() < since:
+            continue
+        if arguments is not None and any(job_run.get('Arguments', {}).get(name) != value
+                                         for name, value in arguments.items()):
+            continue
+        return job_run['Id']
+    return None
+
+
+def start_execution(glue_parameters, glue_opt_params, glue_dpus, wait=True, input_size=None, prepared=False,
+                    journal=None):
+    """ Deploy the job, start a run of it and, with wait, wait for the run.
+
+    With a journal (JournalEntry) each completed step is recorded, and steps
+    recorded by an earlier attempt are skipped: a deployed job is not
+    deployed again and a started run is re-attached to instead of starting
+    another one, also when only the start request was recorded.
+    """
+    job_name = glue_parameters['glueJobName']
+    run_id = journal.get('run_started')['JobRunId'] if journal and journal.done('run_started') else None
+    if run_id:
+        logger.info("Re-attaching to run {} of {} started before the restart".format(run_id, job_name))
+    else:
+        if journal and journal.done('deployed'):
+            glue_parameters['glueScriptLocation'] = journal.get('deployed')['glueScriptLocation']
+            logger.info("Glue job {} already deployed by this rollout".format(job_name))
+        else:
+            if prepared:
+                deploy_job(glue_parameters, glue_opt_params, glue_dpus)
+            else:
+                prepare_job(glue_parameters, glue_opt_params, glue_dpus)
+            if journal:
+                journal.record('deployed', {'glueScriptLocation': glue_parameters['glueScriptLocation']})
+
+        if journal and journal.done('start_requested'):
+            run_id = find_started_run(job_name, journal.get('start_requested')['at'], glue_opt_params)
+            if run_id:
+                logger.info("Re-attaching to run {} of {} whose start was not recorded".format(run_id, job_name))
+        if not run_id:
+            if journal:
+                journal.record('start_requested', {'at': time.time()})
+            with span('start_job_run', job_name=job_name) as start_span:
+                start_job = glue_client().start_job_run(
+                    JobName=job_name,
+                    Arguments=glue_opt_params)
+                start_span.set(run_id=start_job["JobRunId"])
+            run_id = start_job["JobRunId"]
+        if journal:
+            journal.record('run_started', {'JobRunId': run_id})
+
+    result = {
+        'JobName': job_name,
+        'JobRunId': run_id,
+        'JobRunState': None,
+        'ExecutionTime': None,
+        'InputBytes': input_size.total_size if input_size else None,
+        'ObjectCount': input_size.object_count if input_size else None,
+    }
+    if not wait:
+        return result
+
+    return wait_for_runs([result])[0]
+
+
+def estimate_run(job_name, dpus, input_size=None, history=None):
+    """ Estimate the runtime and cost of a run from the run history.
+
+    When the job has a recorded throughput and the input size is known the
+    estimate follows the input, otherwise it is the median runtime of the
+    recent successful runs.
+
+    Returns:
+        (dict) expected ExecutionTime in seconds and DPU-hours, None when unknown.
+    """
+    if history is None:
+        history = get_run_history()
+    report = history.job_report(job_name) if history is not None else None
+    if report and report['throughput'] and input_size is not None and dpus:
+        dpu_hours = input_size.total_size / float(GB) / report['throughput']
+        return {'ExecutionTime': dpu_hours * 3600 / dpus, 'DPUHours': dpu_hours, 'basis': 'throughput'}
+    if report and report['p50']:
+        return {'ExecutionTime': report['p50'], 'DPUHours': dpus * report['p50'] / 3600.0, 'basis': 'median runtime'}
+    return {'ExecutionTime': None, 'DPUHours': None, 'basis': 'no history'}
+
+
+def plan_execution(glue_parameters, glue_opt_params, glue_dpus, input_size=None, history=None):
+    """ Work out what start_execution would do, with read-only calls only.
+
+    The only Glue call is get_job, to decide between create, update and
+    no change; a zipped script costs one listing and a read of its
+    extraction manifest, plus a few ranged reads of the archive's central
+    directory when it changed. Nothing is extracted, deployed or started.
+
+    Returns:
+        (dict)
+        JobName, action ('create', 'update' or 'unchanged'), the changed
+        fields, the exact create_job, update_job and start_job_run requests,
+        the expected number of API calls, the number of polls of the run
+        (None without run history) and the estimated runtime and DPU-hours.
+    """
+    glue_parameters = dict(glue_parameters)
+    job_name = glue_parameters['glueJobName']
+    api_calls = {'get_job': 1}
+    zip_source = None
+    zip_cached = None
+    zip_changed = None
+    if glue_parameters["glueScriptLocation"].split('.')[-1] == 'zip':
+        zip_source = glue_parameters["glueScriptLocation"]
+        glue_parameters["glueScriptLocation"] = zip_script_location(job_name, zip_source) + job_name + '.txt'
+        s3_client = get_client('s3')
+        bucket, archive_key, archive_etag, archive_size = locate_zip(s3_client, zip_source)
+        manifest = read_extract_manifest(s3_client, 'cv-marketing-{}'.format(glue_parameters['environment']),
+                                         ZIP_EXTRACT_PREFIX.format(job_name))
+        zip_cached = manifest is not None and manifest.get('etag') == archive_etag
+        # the listing and the manifest read, then for a changed archive its download,
+        # the upload of every changed member and the new manifest
+        api_calls['s3:list_objects_v2'] = 1
+        api_calls['s3:get_object'] = 1
+        if not zip_cached:
+            members = zip_members(s3_client, bucket, archive_key, archive_size)
+            changed, removed = changed_members(members, (manifest or {}).get('members', {}))
+            zip_changed = {'changed': len(changed), 'removed': len(removed), 'members': len(members)}
+            transfers = [transfer_calls(archive_size, upload=False)]
+            transfers.extend(transfer_calls(members[filename]['size'], upload=True) for filename in changed)
+            transfers.append({'s3:put_object': 1})
+            for calls in transfers:
+                for name, count in calls.items():
+                    api_calls[name] = api_calls.get(name, 0) + count
+            if removed:
+                api_calls['s3:delete_objects'] = (len(removed) + 999) // 1000
+
+    create_request = None
+    update_request = None
+    changes = []
+    current_job = get_glue_job(job_name)
+    if current_job is None:
+        action = 'create'
+        create_request = build_create_job_request(glue_parameters, glue_opt_params, glue_dpus)
+        api_calls['create_job'] = 1
+    else:
+        job_spec = build_job_spec(glue_parameters, glue_opt_params, glue_dpus)
+        changes = diff_job_spec(job_spec, current_job)
+        action = 'update' if changes else 'unchanged'
+        if changes:
+            update_request = {'JobName': job_name, 'JobUpdate': job_spec}
+            api_calls['update_job'] = 1
+    api_calls['start_job_run'] = 1
+
+    dpus = config_dpus(glue_parameters, glue_dpus)
+    estimate = estimate_run(job_name, dpus, input_size=input_size, history=history)
+    polls = JobRunMonitor(glue_client()).estimate_polls(estimate['ExecutionTime'])
+    # the first poll of a new monitor reads the job's runs, the later ones read the run alone
+    api_calls['get_job_runs'] = 1
+    if polls and polls > 1:
+        api_calls['get_job_run'] = polls - 1
+
+    return {
+        'JobName': job_name,
+        'action': action,
+        'changes': [{'field': field, 'current': current, 'desired': desired}
+                    for field, current, desired in changes],
+        'zip_source': zip_source,
+        'zip_cached': zip_cached,
+        'zip_changed': zip_changed,
+        'create_job': create_request,
+        'update_job': update_request,
+        'start_job_run': {'JobName': job_name, 'Arguments': glue_opt_params},
+        'api_calls': api_calls,
+        'polls': polls,
+        'DPUs': dpus,
+        'ExecutionTime': estimate['ExecutionTime'],
+        'DPUHours': estimate['DPUHours'],
+        'estimate_basis': estimate['basis'],
+    }
+
+
+def wait_for_runs(results, monitor=None, history=None):
+    """ Wait for started runs to finish, fill in their final state and record them.
+    Args:
+        results (list): Results returned by start_execution with wait=False.
+        monitor (JobRunMonitor): Optional monitor to reuse, so its job
+                                 runtime history is kept across calls.
+        history (RunHistory): Store the finished runs are recorded in,
+                              the default local store when None.
+    Results of configs with deploy targets have their per-target runs under
+    'targets'; those are waited for with wait_for_target_runs, alongside the others.
+
+    Returns:
+        (list) the same results, with JobRunState and ExecutionTime set.
+    """
+    multi_target = [result for result in results if result.get('targets')]
+    if multi_target:
+        target_results = [run for result in multi_target for run in result['targets']]
+        others = [result for result in results if not result.get('targets')]
+        client = glue_client()
+        if monitor is None:
+            monitor = JobRunMonitor(client)
+
+        def wait_others():
+            with use_glue_client(client):
+                wait_for_runs(others, monitor=monitor, history=history)
+
+        # both waits run on threads, so an interrupt reaches this one and stops the runs of every target
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            waits = [executor.submit(bind(wait_for_target_runs), target_results, history=history)]
+            if others:
+                waits.append(executor.submit(bind(wait_others)))
+            for done in waits:
+                done.result()
+        except KeyboardInterrupt as e:
+            stop_target_runs(target_runs(target_results), e)
+            stop_runs([(result['JobName'], result['JobRunId']) for result in others
+                       if result['JobRunState'] is None], e, client=client)
+            raise
+        finally:
+            executor.shutdown(wait=False)
+        for result in multi_target:
+            result.update(combine_target_results(result['targets']))
+        return results
+
+    if monitor is None:
+        monitor = JobRunMonitor(glue_client())
+    runs = [(result['JobName'], result['JobRunId']) for result in results]
 
     try:
-        while status == "RUNNING":
-            status = glue_job_status(job_name, run_id)
-            print("Time: %i | Status %s" % (t, status))
-            time.sleep(5)
-            t = t + 5
+        with span('wait_for_runs', runs=len(runs)):
+            finished = monitor.wait(runs)
     except (Exception, KeyboardInterrupt) as e:
-        response = glue.batch_stop_job_run(
+        finished = {}
+        stop_runs(runs, e)
+
+    return record_results(results, finished, history=history)
+
+
+def stop_runs(runs, reason, client=None):
+    """ Stop the runs (job_name, run_id), through client or the glue client of this thread. """
+    for job_name, run_id in runs:
+        response = (client or glue_client()).batch_stop_job_run(
             JobName=job_name,
             JobRunIds=[run_id]
         )
-        logger.info("Recieved Kill Signal as {} . GraceFully Terminated the Job {}".format(e, response))
+        logger.info("Recieved Kill Signal as {} . GraceFully Terminated the Job {}".format(reason, response))
 
-    if status == "SUCCEEDED":
-        logger.info("Job Completed")
-        sys.exit("0")
+
+def record_results(results, finished, history=None):
+    """ Fill in the final state of started runs and record them in the run history.
+    Args:
+        results (list): Results returned by start_execution with wait=False.
+        finished (dict): Final JobRun of each (job_name, run_id); runs
+                         missing from it are considered STOPPED.
+        history (RunHistory): Store the runs are recorded in, the default
+                              local store when None.
+    Returns:
+        (list) the same results, with JobRunState and ExecutionTime set.
+    """
+    if history is None:
+        history = get_run_history()
+    for result in results:
+        job_run = finished.get((result['JobName'], result['JobRunId']), {})
+        result['JobRunState'] = job_run.get('JobRunState', 'STOPPED')
+        result['ExecutionTime'] = job_run.get('ExecutionTime')
+        if history is not None:
+            try:
+                history.record_run(result['JobName'], result['JobRunId'], job_run,
+                                   input_bytes=result.get('InputBytes'), object_count=result.get('ObjectCount'),
+                                   state=result['JobRunState'])
+            except Exception as e:
+                logger.warning("Unable to record run {} in the run history: {}".format(result['JobRunId'], e))
+        if result['JobRunState'] == "SUCCEEDED":
+            logger.info("Job Completed")
+        else:
+            logger.error("Job Failed")
+    return results
+
+
+def load_config(conf_file):
+    """ Read a deployment conf file from a local path or an s3:// uri.
+    Args:
+        conf_file (string): Local path or s3 uri of the conf file.
+    Returns:
+        (ConfigParser)
+    """
+    config = configparser.ConfigParser()
+    config.optionxform = str
+
+    if conf_file[:2] == 's3':
+        logger.info("Reading Conf file from s3 Path {}".format(conf_file))
+        s3_uri = conf_file.split("//")[1]
+        bucket = s3_uri.split('/')[0]
+        file_key = '/'.join([str(elem) for elem in s3_uri.split('/')[1:]])
+        # read in memory, so configs can be loaded from several threads at once
+        try:
+            body = s3.meta.client.get_object(Bucket=bucket, Key=file_key)['Body'].read()
+            config.read_string(body.decode('utf-8'))
+            logger.info("Sucessfully Read Conf File {}".format(conf_file))
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                print("The Conf File does not exist.")
+            else:
+                raise
     else:
-        logger.error("Job Failed")
-        sys.exit("1")
+        config.read(conf_file)
+
+    logger.info(f" config.sections {config.sections()}")
+    return config
+
+
+def parse_config(config):
+    """ Split a deployment config into the Glue job, script and DPU parameters.
+    Args:
+        config (ConfigParser): Parsed conf file.
+    Returns:
+        (tuple) glue_params, glue_script_params and glue_dpus dicts.
+    """
+    # Fetching Job Parameters (Mandatory)
+    try:
+        glue_params = dict(config.items('job-paramters'))
+    except NoSectionError as e:
+        logger.warn('Specify the Mandatory Glue Job paramters')
+        raise
+
+    # Fetching Script Language (Mandatory)
+    try:
+        glue_script_params = dict(config.items('script-language'))
+    except NoSectionError as e:
+        logger.warn('Need to specify --job-language= python or --job-language= scala')
+        raise
+
+    # Fetching DPU/Resource (Mandatory)
+    try:
+        glue_dpus = dict(config.items('job-dpu'))
+    except NoSectionError as e:
+        logger.warn('Need to specify WorkerType & NumberOfWorkers')
+        raise
+
+    # Fetching Job Specific/Optional Paramters
+    try:
+        glue_opt_params = dict(config.items('opt-paramters'))
+        glue_script_params.update(glue_opt_params)
+    except NoSectionError as e:
+        logger.info('No Optional Paramter Specified')
+
+    return glue_params, glue_script_params, glue_dpus
+
+
+def parse_targets(config):
+    """ Deployment targets named in the deploy-targets section of config.
+
+    Each option is one target, 'name = region', or 'name = region, role_arn'
+    to deploy as a role assumed in another account.
+
+    Returns:
+        (list) of Target, empty when the config names none and the default glue client is used.
+    """
+    if not config.has_section('deploy-targets'):
+        return []
+    targets = []
+    for name, value in config.items('deploy-targets'):
+        parts = [part.strip() for part in value.split(',')]
+        if not parts[0] or len(parts) > 2:
+            raise ValueError("Target {} must be 'region' or 'region, role_arn', not '{}'".format(name, value))
+        targets.append(Target(name, parts[0], parts[1] if len(parts) == 2 and parts[1] else None))
+    return targets
+
+
+def as_config_parser(config):
+    """ Return config as a ConfigParser, converting a dict of {section: {option: value}}. """
+    if isinstance(config, dict):
+        config_dict = config
+        config = configparser.ConfigParser()
+        config.optionxform = str
+        config.read_dict(config_dict)
+    return config
+
+
+def plan_deploy(config, input_size=None, history=None):
+    """ Plan the deployment and run of config without changing anything, see plan_execution.
+    Args:
+        config (ConfigParser or dict): Parsed conf file.
+        input_size (FolderSize): Measured input of the run, for the cost estimate.
+        history (RunHistory): Run history the estimate is read from, the default local store when None.
+    Returns:
+        (dict)
+    """
+    config = as_config_parser(config)
+    glue_params, glue_script_params, glue_dpus = parse_config(config)
+    targets = parse_targets(config)
+    if not targets:
+        return plan_execution(glue_params, glue_script_params, glue_dpus, input_size=input_size, history=history)
+
+    def plan_target(target):
+        try:
+            with use_glue_client(target_glue_client(target)):
+                plan = plan_execution(glue_params, glue_script_params, glue_dpus, input_size=input_size,
+                                      history=history)
+        except Exception as e:
+            logger.error("Unable to plan target {} ({}): {}".format(target.name, target.region, e))
+            plan = {'JobName': glue_params['glueJobName'], 'action': 'error', 'error': str(e), 'api_calls': {},
+                    'DPUs': config_dpus(glue_params, glue_dpus), 'ExecutionTime': None, 'DPUHours': None}
+        plan.update(target=target.name, region=target.region, role_arn=target.role_arn)
+        return plan
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        return combine_target_plans(list(executor.map(bind(plan_target), targets)))
+
+
+def combine_target_plans(plans):
+    """ One plan covering the plans of every target, which are kept under 'targets'.
+
+    The action is the strongest of the targets (create, then update), API
+    calls and DPU-hours are summed and the zip extraction is counted once.
+    Targets that could not be planned are left out of the totals.
+    """
+    planned = [plan for plan in plans if plan['action'] != 'error'] or plans
+    combined = dict(planned[0])
+    actions = [plan['action'] for plan in plans]
+    combined['action'] = next((action for action in ('create', 'update', 'unchanged') if action in actions), 'error')
+    api_calls = {}
+    for index, plan in enumerate(plans):
+        for name, count in plan['api_calls'].items():
+            # the script is extracted once, before the targets are deployed
+            if index and name.startswith('s3:'):
+                continue
+            api_calls[name] = api_calls.get(name, 0) + count
+    combined['api_calls'] = api_calls
+    polls = [plan['polls'] for plan in planned if plan['action'] != 'error']
+    combined['polls'] = None if None in polls or not polls else sum(polls)
+    hours = [plan['DPUHours'] for plan in plans if plan['action'] != 'error']
+    combined['DPUHours'] = None if None in hours else sum(hours)
+    combined['targets'] = plans
+    return combined
+
+
+def print_plan(plan):
+    if plan.get('targets'):
+        for target_plan in plan['targets']:
+            print("Target {} ({}{}):".format(target_plan['target'], target_plan['region'],
+                                             ' as ' + target_plan['role_arn'] if target_plan['role_arn'] else ''))
+            print_plan(dict(target_plan, targets=None))
+        return
+    if plan['action'] == 'error':
+        print("Job {}: not planned, {}".format(plan['JobName'], plan['error']))
+        return
+    print("Job {}: {} ({} DPUs)".format(plan['JobName'], plan['action'], plan['DPUs']))
+    for change in plan['changes']:
+        print("    {}: {} -> {}".format(change['field'], change['current'], change['desired']))
+    if plan['zip_source'] and plan['zip_cached']:
+        print("    script extracted from {} (unchanged, extraction skipped)".format(plan['zip_source']))
+    elif plan['zip_source']:
+        print("    script extracted from {} (changed, {changed} of {members} members uploaded, "
+              "{removed} removed)".format(plan['zip_source'], **plan['zip_changed']))
+    for request in ('create_job', 'update_job', 'start_job_run'):
+        if plan[request] is not None:
+            print("    {} {}".format(request, json.dumps(plan[request], sort_keys=True, default=str)))
+    print("    API calls: {}".format(', '.join('{} x{}'.format(name, count)
+                                               for name, count in sorted(plan['api_calls'].items()))))
+    if plan['polls'] is None:
+        print("    Polls: unknown without run history, each poll after the first is one more get_job_run")
+    if plan['DPUHours'] is None:
+        print("    Estimated cost: unknown, no run history")
+    else:
+        print("    Estimated runtime {:.0f}s, {:.2f} DPU-hours ({})".format(
+            plan['ExecutionTime'], plan['DPUHours'], plan['estimate_basis']))
+
+
+def deploy(config, wait=True, input_size=None, journal=None):
+    """ Deploy the Glue job described by config, run it and wait for the run to finish.
+    Args:
+        config (ConfigParser or dict): Parsed conf file, or a dict of
+                                       {section: {option: value}}.
+        wait (boolean): Wait for the run to finish. When False the result is
+                        returned as soon as the run is started, and
+                        wait_for_runs() can watch it later.
+        input_size (FolderSize): Measured input of the run, kept in the run history.
+        journal (JournalEntry): Journal of the config in a resumable rollout,
+                                see start_execution. Each deploy target is journaled on its own.
+    Returns:
+        (dict)
+        JobName, JobRunId, final JobRunState and ExecutionTime of the run.
+        For a config with deploy targets JobRunId is None and the run of
+        every target is under 'targets', see deploy_to_targets.
+    """
+    config = as_config_parser(config)
+    job = dict(config.items('JOB'))
+    logger.info("Execution Environmnet for spark jobs {}".format(job['Execution_Enviornment']))
+
+    glue_params, glue_script_params, glue_dpus = parse_config(config)
+    targets = parse_targets(config)
+
+    logger.info("Starting Execution")
+    with span('deploy', job_name=glue_params['glueJobName'], targets=len(targets) or None):
+        if targets:
+            return combine_target_results(deploy_to_targets(glue_params, glue_script_params, glue_dpus, targets,
+                                                            wait=wait, input_size=input_size, journal=journal))
+        return start_execution(glue_params, glue_script_params, glue_dpus, wait=wait, input_size=input_size,
+                               journal=journal)
+
+
+def deploy_to_targets(glue_parameters, glue_opt_params, glue_dpus, targets, wait=True, input_size=None,
+                      journal=None):
+    """ Deploy and run the job in every target at once.
+
+    A zipped script is extracted once, then every target is deployed, started
+    and, with wait, waited for on its own thread with its own glue client, so
+    the rollout takes as long as the slowest target. A target that fails, e.g.
+    because its role cannot be assumed, only fails its own result.
+
+    Args:
+        targets (list): Target of each region or account to deploy to.
+        wait (boolean): Wait for the runs. When False the results are returned
+                        once every run is started, with their JobRunId, and
+                        wait_for_target_runs() can watch them later.
+        journal (JournalEntry): Journal of the config in a resumable rollout.
+                                The extracted script is recorded in it and not
+                                extracted again on resume, and every target is
+                                journaled as a part of it, see start_execution.
+    Returns:
+        (list)
+        one result per target, in the order of targets, with the target name,
+        region and role_arn, and the error of a failed target.
+    """
+    glue_parameters = dict(glue_parameters)
+    if journal and journal.done('script_prepared'):
+        glue_parameters['glueScriptLocation'] = journal.get('script_prepared')['glueScriptLocation']
+        logger.info("Script of {} already prepared by this rollout".format(glue_parameters['glueJobName']))
+    else:
+        prepare_script(glue_parameters)
+        if journal:
+            journal.record('script_prepared', {'glueScriptLocation': glue_parameters['glueScriptLocation']})
+
+    def run_target(target):
+        result = {'target': target.name, 'region': target.region, 'role_arn': target.role_arn,
+                  'JobName': glue_parameters['glueJobName'], 'JobRunId': None, 'JobRunState': None,
+                  'ExecutionTime': None, 'error': None}
+        try:
+            with span('deploy_target', target=target.name, region=target.region):
+                with use_glue_client(target_glue_client(target)):
+                    result.update(start_execution(dict(glue_parameters), glue_opt_params, glue_dpus, wait=False,
+                                                  input_size=input_size, prepared=True,
+                                                  journal=journal.part(target.name) if journal else None))
+        except Exception as e:
+            logger.error("Deployment to target {} ({}) failed: {}".format(target.name, target.region, e))
+            result['JobRunState'] = 'ERROR'
+            result['error'] = str(e)
+        return result
+
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        results = list(executor.map(bind(run_target), targets))
+    if wait:
+        wait_for_target_runs(results)
+    return results
+
+
+def target_runs(results):
+    """ Runs still in flight of per-target results, grouped by target.
+
+    The runs of a target are polled with its own client,
+    target_glue_client(target), taken again at every poll as the client of
+    an assumed role is replaced when its credentials are renewed.
+
+    Returns:
+        (dict) mapping each Target to a dict of (job_name, run_id) to its result.
+    """
+    runs = {}
+    for result in results:
+        if result['JobRunId'] and result['JobRunState'] is None:
+            runs.setdefault(result_target(result), {})[(result['JobName'], result['JobRunId'])] = result
+    return runs
+
+
+def wait_for_target_runs(results, history=None):
+    """ Wait for the runs deploy_to_targets started without waiting, see wait_for_runs.
+
+    The runs of each target are watched by one monitor on its own thread,
+    all targets at once. A target that cannot be polled fails its runs.
+
+    Args:
+        results (list): Per-target results, of one config or several.
+    Returns:
+        (list) the same results, with JobRunState and ExecutionTime set.
+    """
+    def wait_target(item):
+        target, runs = item
+        try:
+            client = target_glue_client(target)
+            with use_glue_client(client):
+                wait_for_runs(list(runs.values()), monitor=JobRunMonitor(client), history=history)
+        except Exception as e:
+            logger.error("Unable to watch the runs in target {} ({}): {}".format(target.name, target.region, e))
+            for result in runs.values():
+                result['JobRunState'] = 'ERROR'
+                result['error'] = str(e)
+
+    runs = target_runs(results)
+    if runs:
+        # an interrupt stops the runs of every target, instead of waiting for them on the way out
+        executor = ThreadPoolExecutor(max_workers=len(runs))
+        try:
+            list(executor.map(bind(wait_target), runs.items()))
+        except KeyboardInterrupt as e:
+            stop_target_runs(runs, e)
+            raise
+        finally:
+            executor.shutdown(wait=False)
+    return results
+
+
+def stop_target_runs(runs, reason):
+    """ Stop the runs of target_runs(), each through the client of its target. """
+    for target, target_results in runs.items():
+        try:
+            stop_runs(list(target_results), reason, client=target_glue_client(target))
+        except Exception as e:
+            logger.error("Unable to stop the runs in target {} ({}): {}".format(target.name, target.region, e))
+
+
+def combine_target_results(results):
+    """ One result for the runs of every target, which are kept under 'targets'.
+
+    The state is None while a target's run is in flight, SUCCEEDED when every
+    target succeeded, otherwise the state of the first target that did not;
+    the time is the slowest target's. JobRunId is None, the run id of each
+    target is in its result.
+    """
+    states = [result['JobRunState'] for result in results]
+    failed = [state for state in states if state != 'SUCCEEDED']
+    return {
+        'JobName': results[0]['JobName'],
+        'JobRunId': None,
+        'JobRunState': None if None in states else (failed[0] if failed else 'SUCCEEDED'),
+        'ExecutionTime': max(result['ExecutionTime'] or 0 for result in results),
+        'targets': results,
+    }
+
 
+def print_target_results(results):
+    for result in results:
+        print("{:<20} {:<15} {:<12} {:>8}  {}".format(result['target'], result['region'], result['JobRunState'],
+                                                     result['ExecutionTime'] or '',
+                                                     result['error'] or result['JobRunId'] or ''))
 
-job = dict(config.items('JOB'))
 
-logger.info("Execution Environmnet for spark jobs {}".format(job['Execution_Enviornment']))
+def main(argv=None):
+    argv = sys.argv if argv is None else argv
+    plan = '--plan' in argv[1:]
+    argv = [arg for arg in argv if arg != '--plan']
+    if len(argv) < 2:
+        logger.info(
+            "Not enough arguments. Try again. Please ensure that conf file is added as argumnet : python3 glue_deploy.py glue_deployment.conf [--plan]")
+        return 1
 
-# Fetching Job Parameters (Mandatory)
-try:
-    glue_params = dict(config.items('job-paramters'))
-except NoSectionError as e:
-    logger.warn('Specify the Mandatory Glue Job paramters')
+    # Arguments passed
+    logger.info(f"Name of Python script: {argv[0]}")
+    logger.info(f"Name of Conf File: {argv[1]}")
 
-# Fetching Script Language (Mandatory)
-try:
-    glue_script_params = dict(config.items('script-language'))
-except NoSectionError as e:
-    logger.warn('Need to specify --job-language= python or --job-language= scala')
+    if plan:
+        print_plan(plan_deploy(load_config(argv[1])))
+        return 0
 
-# Fetching DPU/Resource (Mandatory)
-try:
-    glue_dpus = dict(config.items('job-dpu'))
-except NoSectionError as e:
-    logger.warn('Need to specify WorkerType & NumberOfWorkers')
+    result = deploy(load_config(argv[1]))
+    if result.get('targets'):
+        print_target_results(result['targets'])
+    return 0 if result['JobRunState'] == "SUCCEEDED" else 1
 
-# Fetching Job Specific/Optional Paramters
-try:
-    glue_opt_params = dict(config.items('opt-paramters'))
-    glue_script_params.update(glue_opt_params)
-except (NoSectionError, NameError) as e:
-    logger.info('No Optional Paramter Specified')
 
-logger.info("Starting Execution")
-start_execution(glue_params, glue_script_params, glue_dpus)
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TRACE_FORMATS = ('jsonl', 'otlp')
+
+# Set GLUE_TRACE_FILE to write the spans of every run to that file.
+DEFAULT_TRACE_FILE = os.environ.get('GLUE_TRACE_FILE') or None
+DEFAULT_TRACE_FORMAT = os.environ.get('GLUE_TRACE_FORMAT', 'jsonl')
+
+SERVICE_NAME = 'glue-deploy'
+
+
+class Span(object):
+    """ One timed phase, with its attributes and the API calls and bytes moved while it was open. """
+
+    def __init__(self, tracer, name, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = dict(attributes)
+        self.api_calls = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.error = None
+        self.start = time.time()
+        self.end = None
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_call(self, operation, bytes_in=0, bytes_out=0):
+        # calls count in the span they were made in and in every enclosing span
+        with self.tracer.lock:
+            span = self
+            while span is not None:
+                span.api_calls[operation] = span.api_calls.get(operation, 0) + 1
+                span.bytes_in += bytes_in
+                span.bytes_out += bytes_out
+                span = span.parent
+
+    def to_dict(self):
+        return {
+            'trace_id': self.tracer.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent else None,
+            'name': self.name,
+            'start': self.start,
+            'end': self.end,
+            'duration': self.duration,
+            'attributes': self.attributes,
+            'api_calls': self.api_calls,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'error': self.error,
+        }
+
+
+class _NullSpan(object):
+    """ Span handed out while tracing is disabled, every call is a no-op. """
+
+    def set(self, **attributes):
+        pass
+
+    def record_call(self, operation, bytes_in=0, bytes_out=0):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in sorted(attributes.items())
+            if value is not None]
+
+
+def otlp_span(span):
+    """ Convert a finished span to the OTLP/JSON span representation. """
+    attributes = dict(span['attributes'])
+    attributes['bytes_in'] = span['bytes_in']
+    attributes['bytes_out'] = span['bytes_out']
+    attributes['api_calls'] = sum(span['api_calls'].values())
+    for operation, count in span['api_calls'].items():
+        attributes['api_calls.' + operation] = count
+    otlp = {
+        'traceId': span['trace_id'],
+        'spanId': span['span_id'],
+        'name': span['name'],
+        'kind': 1,
+        'startTimeUnixNano': str(int(span['start'] * 1e9)),
+        'endTimeUnixNano': str(int(span['end'] * 1e9)),
+        'attributes': _otlp_attributes(attributes),
+        'status': {'code': 2, 'message': span['error']} if span['error'] else {'code': 1},
+    }
+    if span['parent_id']:
+        otlp['parentSpanId'] = span['parent_id']
+    return otlp
+
+
+class Tracer(object):
+    """ Records spans and writes them to a local file.
+
+    The jsonl format appends one JSON object per span as soon as it ends.
+    The otlp format keeps the spans in memory and writes them as one
+    OTLP/JSON document on flush(), which OpenTelemetry collectors and
+    viewers can import. Spans nest per thread; bind() carries the current
+    span into worker threads so their API calls are counted in it.
+    """
+
+    def __init__(self, path=None, trace_format=DEFAULT_TRACE_FORMAT):
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError("Trace format must be one of {}".format(TRACE_FORMATS))
+        self.path = path
+        self.trace_format = trace_format
+        self.trace_id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.finished = []
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def current(self):
+        return getattr(self._local, 'span', None)
+
+    def _set_current(self, span):
+        self._local.span = span
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """ Time the enclosed block as a span named name.
+        Yields:
+            (Span) whose set() adds attributes, e.g. sizes only known at the end.
+        """
+        if not self.enabled:
+            yield NULL_SPAN
+            return
+        parent = self.current()
+        span = Span(self, name, parent, attributes)
+        self._set_current(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = "{}: {}".format(type(e).__name__, e)
+            raise
+        finally:
+            span.end = time.time()
+            self._set_current(parent)
+            self._finish(span)
+
+    def _finish(self, span):
+        record = span.to_dict()
+        with self.lock:
+            if self.trace_format == 'jsonl':
+                with open(self.path, 'a') as trace_file:
+                    trace_file.write(json.dumps(record, default=str) + '\n')
+            else:
+                self.finished.append(record)
+
+    def bind(self, fn):
+        """ Wrap fn so that it runs inside the span current at bind time, in whichever thread calls it. """
+        parent = self.current()
+        if parent is None:
+            return fn
+
+        def bound(*args, **kwargs):
+            previous = self.current()
+            self._set_current(parent)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._set_current(previous)
+        return bound
+
+    def flush(self):
+        """ Write every span ended so far as one OTLP/JSON document, for the otlp format. """
+        if not self.enabled or self.trace_format != 'otlp':
+            return
+        with self.lock:
+            spans = [otlp_span(span) for span in self.finished]
+        if not spans:
+            return
+        document = {'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': SERVICE_NAME})},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': spans}],
+        }]}
+        with open(self.path, 'w') as trace_file:
+            json.dump(document, trace_file)
+        logger.info("Wrote {} spans to {}".format(len(spans), self.path))
+
+
+_tracer = Tracer(DEFAULT_TRACE_FILE, DEFAULT_TRACE_FORMAT)
+
+
+def get_tracer():
+    return _tracer
+
+
+def configure(path=None, trace_format=None):
+    """ Start writing spans to path, in the jsonl or otlp format. """
+    global _tracer
+    _tracer.flush()
+    _tracer = Tracer(path, trace_format or DEFAULT_TRACE_FORMAT)
+    return _tracer
+
+
+def span(name, **attributes):
+    """ Span of the process wide tracer, see Tracer.span. """
+    return _tracer.span(name, **attributes)
+
+
+def current_span():
+    return _tracer.current() or NULL_SPAN
+
+
+def bind(fn):
+    return _tracer.bind(fn)
+
+
+def _content_length(headers):
+    try:
+        return int(headers.get('Content-Length') or headers.get('content-length') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _before_send(request, **kwargs):
+    if _tracer.current() is not None:
+        # the request is counted when its response arrives, only its size is kept here
+        _tracer._local.bytes_out = _content_length(request.headers)
+
+
+def _after_call(http_response, model, **kwargs):
+    span = _tracer.current()
+    if span is None:
+        return
+    bytes_out = getattr(_tracer._local, 'bytes_out', 0)
+    _tracer._local.bytes_out = 0
+    bytes_in = _content_length(http_response.headers) if http_response is not None else 0
+    span.record_call(model.name, bytes_in=bytes_in, bytes_out=bytes_out)
+
+
+def instrument_client(client):
+    """ Count the API calls and bytes of a botocore client in the current span. """
+    client.meta.events.register('before-send', _before_send)
+    client.meta.events.register('after-call', _after_call)
+    return client
+
+
+atexit.register(lambda: _tracer.flush())
@@ -0,0 +1,283 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import glue_dynamic_wrapper
+import glue_spark_deploy
+from glue_folder_size import get_folder_size_after
+from glue_job_monitor import JobRunMonitor, TERMINAL_STATES
+from glue_spark_deploy import record_results, result_target, target_glue_client
+from glue_tracing import span
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_WATCH_INTERVAL = 60
+DEFAULT_METRICS_HOST = '127.0.0.1'
+# the daemon reports unhealthy when no cycle completed for this many intervals
+UNHEALTHY_INTERVALS = 3
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class WatchDaemon(object):
+    """ Re-size and re-deploy configs only when their config or source data changed.
+
+    Every cycle lists the config prefix once and compares the ETag of each
+    config with the one it was last processed at. The source prefix of a
+    config whose ETag did not change is checked with a StartAfter listing
+    from the last key seen, which costs one request when no data arrived.
+    Changed configs are queued and processed like fleet mode, without
+    waiting for their runs: runs in flight are polled once per cycle and a
+    config is not processed again while its previous run is still running.
+    The runs of a config with deploy targets are polled in each target, with
+    one monitor per target.
+
+    Clients, the sizer and its caches stay warm between cycles. Source data
+    that is rewritten or deleted before the last key seen is not detected,
+    as with incremental sizing. With --inventory, configs are still sized
+    by live listing: an inventory delivered once a day would not include
+    the new data that triggered the run.
+    """
+
+    def __init__(self, args, entries=None, interval=DEFAULT_WATCH_INTERVAL, monitor=None, history=None):
+        self.args = args
+        # None watches every .conf directly under the config prefix, new ones included
+        self.entries = None if entries is None else list(entries)
+        self.interval = interval
+        self.policy = glue_dynamic_wrapper.build_policy(args)
+        self.sizer = glue_dynamic_wrapper.build_sizer(args)
+        self.tuner = glue_dynamic_wrapper.build_tuner(args)
+        self.monitor = monitor or JobRunMonitor(glue_spark_deploy.glue)
+        self.target_monitors = {}
+        self.history = history
+        self.lock = threading.Lock()
+        self.queue = deque()
+        self.queued = set()
+        self.etags = {}
+        self.last_keys = {}
+        self.in_flight = {}
+        self.stopped = threading.Event()
+        self.metrics = {
+            'cycles': 0,
+            'configs_processed': 0,
+            'runs_started': 0,
+            'runs_failed': 0,
+            'errors': 0,
+            'last_cycle_seconds': None,
+            'last_cycle_end': None,
+        }
+
+    def _enqueue(self, entry, reason):
+        with self.lock:
+            if entry[0] in self.queued:
+                return
+            self.queued.add(entry[0])
+            self.queue.append(entry)
+        logger.info("Queued {}: {}".format(entry[0], reason))
+
+    def list_config_etags(self):
+        """ ETag of every object under the config prefix, from one paginated listing. """
+        etags = {}
+        paginator = glue_dynamic_wrapper.s3_res.meta.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.args.bucket, Prefix=self.args.config_prefix):
+            for obj in page.get('Contents', []):
+                etags[obj['Key'][len(self.args.config_prefix):]] = obj['ETag']
+        return etags
+
+    def _source_changed(self, configfile):
+        folder_prefix, last_key = self.last_keys[configfile]
+        new_objects = get_folder_size_after(self.args.bucket, folder_prefix, last_key,
+                                            s3_client=glue_dynamic_wrapper.s3_res.meta.client)
+        return new_objects.object_count > 0
+
+    def detect_changes(self):
+        """ Queue the configs whose config object or source prefix changed since they were processed. """
+        with span('detect_changes'):
+            etags = self.list_config_etags()
+            entries = self.entries
+            if entries is None:
+                entries = [(key, self.args.folder_prefix) for key in sorted(etags)
+                           if key.endswith('.conf') and '/' not in key]
+            unchanged = []
+            for entry in entries:
+                configfile = entry[0]
+                if configfile not in etags:
+                    logger.warning("Config {} not found under {}".format(configfile, self.args.config_prefix))
+                elif self.etags.get(configfile) != etags[configfile]:
+                    self._enqueue(entry, "config changed")
+                elif configfile in self.last_keys:
+                    unchanged.append(entry)
+
+            with ThreadPoolExecutor(max_workers=max(1, int(self.args.fleet_workers))) as executor:
+                for entry, changed in zip(unchanged, executor.map(lambda e: self._source_changed(e[0]), unchanged)):
+                    if changed:
+                        self._enqueue(entry, "new source data")
+        return etags
+
+    def process_queue(self, etags):
+        """ Process the queued configs whose previous run is finished. """
+        with self.lock:
+            busy = set(result['configfile'] for result in self.in_flight.values())
+            ready = [entry for entry in self.queue if entry[0] not in busy]
+            for entry in ready:
+                self.queue.remove(entry)
+                self.queued.discard(entry[0])
+        if not ready:
+            return []
+
+        def run_one(entry):
+            configfile, folder_prefix = entry
+            try:
+                return glue_dynamic_wrapper.process_config(
+                    self.args.bucket, self.args.config_prefix, configfile, folder_prefix, self.args.dest_prefix,
+                    self.policy, max_workers=int(self.args.max_workers), wait=False, sizer=self.sizer,
+                    tuner=self.tuner, target_runtime=self.args.target_runtime,
+                    group_size=glue_dynamic_wrapper.group_size(self.args), versions_prefix=self.args.versions_prefix)
+            except Exception as e:
+                logger.error("Unable to process {}: {}".format(configfile, e))
+                return {'configfile': configfile, 'folder_prefix': folder_prefix, 'status': 'ERROR ({})'.format(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, int(self.args.fleet_workers))) as executor:
+            results = list(executor.map(run_one, ready))
+
+        for entry, result in zip(ready, results):
+            configfile = entry[0]
+            self.metrics['configs_processed'] += 1
+            if result.get('targets'):
+                started = [run for run in result['targets'] if run['JobRunId']]
+                self.metrics['runs_started'] += len(started)
+                # targets that could not be deployed or started
+                self.metrics['runs_failed'] += len(result['targets']) - len(started)
+                if not started:
+                    self.metrics['errors'] += 1
+                    continue
+                with self.lock:
+                    for run in started:
+                        self.in_flight[(run['JobName'], run['JobRunId'])] = dict(
+                            result, JobRunId=run['JobRunId'], target=result_target(run))
+            elif not result.get('JobRunId'):
+                # left without an ETag, so it is retried next cycle
+                self.metrics['errors'] += 1
+                continue
+            else:
+                self.metrics['runs_started'] += 1
+                with self.lock:
+                    self.in_flight[(result['JobName'], result['JobRunId'])] = result
+            if result.get('last_key'):
+                self.last_keys[configfile] = (result['folder_prefix'], result['last_key'])
+            # the ETag seen at listing time, or the new one when the config was rewritten in place
+            if result.get('changed') and self.args.dest_prefix == self.args.config_prefix:
+                self.etags[configfile] = glue_dynamic_wrapper.s3_res.meta.client.head_object(
+                    Bucket=self.args.bucket, Key=self.args.config_prefix + configfile)['ETag']
+            elif configfile in etags:
+                self.etags[configfile] = etags[configfile]
+        return results
+
+    def _monitor(self, target):
+        if target is None:
+            return self.monitor
+        monitor = self.target_monitors.setdefault(target, JobRunMonitor(None))
+        # the client of an assumed role is replaced when its credentials are renewed
+        monitor.glue = target_glue_client(target)
+        return monitor
+
+    def check_runs(self):
+        """ Poll the runs in flight once, in their targets, and record the finished ones. """
+        by_target = {}
+        with self.lock:
+            for key, result in self.in_flight.items():
+                by_target.setdefault(result.get('target'), []).append(key)
+        current = {}
+        for target, runs in by_target.items():
+            try:
+                current.update(self._monitor(target).poll(runs))
+            except Exception as e:
+                # e.g. the role of the target cannot be assumed, its runs are polled again next cycle
+                self.metrics['errors'] += 1
+                logger.error("Unable to poll the runs in target {}: {}".format(target.name if target else 'default', e))
+        for key, job_run in current.items():
+            if job_run['JobRunState'] not in TERMINAL_STATES:
+                continue
+            with self.lock:
+                result = self.in_flight.pop(key)
+            run = {'JobName': result['JobName'], 'JobRunId': result['JobRunId'],
+                   'InputBytes': result['total_size'], 'ObjectCount': result['object_count']}
+            record_results([run], {key: job_run}, history=self.history)
+            if run['JobRunState'] != 'SUCCEEDED':
+                self.metrics['runs_failed'] += 1
+            where = " in {}".format(result['target'].name) if result.get('target') else ''
+            logger.info("Run {} of {} finished as {}{}".format(key[1], key[0], run['JobRunState'], where))
+
+    def run_cycle(self):
+        started = time.time()
+        with span('watch_cycle'):
+            self.check_runs()
+            etags = self.detect_changes()
+            self.process_queue(etags)
+        self.metrics['cycles'] += 1
+        self.metrics['last_cycle_seconds'] = time.time() - started
+        self.metrics['last_cycle_end'] = time.time()
+
+    def snapshot(self):
+        """ Current metrics, with the queue depth and the runs in flight. """
+        with self.lock:
+            metrics = dict(self.metrics, queue_depth=len(self.queue), runs_in_flight=len(self.in_flight))
+        last_end = metrics['last_cycle_end']
+        metrics['healthy'] = last_end is not None and time.time() - last_end < UNHEALTHY_INTERVALS * self.interval
+        return metrics
+
+    def serve_metrics(self, port, host=DEFAULT_METRICS_HOST):
+        """ Serve /health (JSON, 503 when cycles stalled) and /metrics (Prometheus text) in a background thread. """
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                metrics = daemon.snapshot()
+                if self.path == '/health':
+                    body = json.dumps(metrics).encode('utf-8')
+                    self.send_response(200 if metrics['healthy'] else 503)
+                    self.send_header('Content-Type', 'application/json')
+                elif self.path == '/metrics':
+                    lines = ["glue_watch_{} {}".format(name, 0 if value is None else float(value))
+                             for name, value in sorted(metrics.items())]
+                    body = ('\n'.join(lines) + '\n').encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                else:
+                    body = b''
+                    self.send_response(404)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = _ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever, name='glue-watch-metrics', daemon=True)
+        thread.start()
+        logger.info("Serving health and metrics on http://{}:{}/".format(host, server.server_address[1]))
+        return server
+
+    def stop(self):
+        self.stopped.set()
+
+    def run_forever(self):
+        """ Run a cycle every interval seconds until stop() is called. """
+        while not self.stopped.is_set():
+            try:
+                self.run_cycle()
+            except Exception as e:
+                self.metrics['errors'] += 1
+                logger.error("Watch cycle failed: {}".format(e))
+            # the next cycle starts one interval after this one started
+            self.stopped.wait(max(0, self.interval - (self.metrics['last_cycle_seconds'] or 0)))